@@ -0,0 +1,207 @@
+"""
+Benchmarks of the batch runner against a stub TUV executable.
+
+Every case builds a throwaway TUV tree whose ./tuv is stub_tuv.py and runs
+one batch_run over a 1, 2 or 3 dimensional sweep, serially, with a process
+pool (workers) or with the asyncio runner. Each case runs in a fresh Python
+process so peak memory is its own. Reported per case:
+
+    runs/s        simulations per second of wall time
+    overhead ms   wall time per run not spent inside ./tuv (as measured by
+                  the batch metrics), times the number of concurrent runs
+    render ms     median time to write usrinp
+    peak MiB      peak resident memory of the runner process
+
+    python benchmarks/bench_batch.py                       # default cases
+    python benchmarks/bench_batch.py --sizes 10000 --modes workers
+    python benchmarks/bench_batch.py --save-baseline       # after an intended change
+
+Results are compared with benchmarks/baseline.json and the script exits
+with status 1 if any case is more than --tolerance slower, or uses more
+memory, than its baseline. Baselines are machine specific, so none is kept
+in the repository: the first run on a machine saves its results as the
+baseline, and cases first run later are added to it. The baseline records
+the host, CPU count, Python and commit it was taken on; comparing with one
+from another host or Python is an error (exit status 2) unless
+--no-compare only prints the results.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import shutil
+import asyncio
+import argparse
+import resource
+import tempfile
+import contextlib
+import subprocess
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(bench_dir))
+
+default_baseline = os.path.join(bench_dir, 'baseline.json')
+
+def case_name(dims, size, mode):
+    return f'{dims}d-{size}-{mode}'
+
+def case_sweep(dims, size):
+    from tuv_sweep import Sweep
+    # split size points over dims axes as evenly as the factors allow
+    shape = []
+    rest = size
+    for d in range(dims, 0, -1):
+        n = max(round(rest ** (1 / d)), 1)
+        while rest % n:
+            n -= 1
+        shape.append(n)
+        rest //= n
+    sweep = Sweep()
+    for name, lo, hi, n in zip(('lat', 'o3col', 'alsurf'), (-89.5, 200, 0.0), (89.5, 500, 0.9), shape):
+        sweep.product(name, [lo + (hi - lo) * k / max(n - 1, 1) for k in range(n)])
+    return sweep
+
+def build_tree(root):
+    tree = os.path.join(root, 'TUV-V5.4')
+    for name in ('INPUTS', 'DATAE1', 'DATAJ1', 'DATAS1'):
+        os.makedirs(os.path.join(tree, name))
+    shutil.copy(os.path.join(bench_dir, 'usrinp_backup'), os.path.join(tree, 'INPUTS', 'usrinp_backup'))
+    shutil.copy(os.path.join(bench_dir, 'stub_tuv.py'), os.path.join(tree, 'tuv'))
+    os.chmod(os.path.join(tree, 'tuv'), 0o755)
+    return tree
+
+def run_case(dims, size, mode, workers):
+    import run_tuv_batch
+    import modify_usrinp
+    from tuv_metrics import read_metrics
+
+    root = tempfile.mkdtemp(prefix='tuv-bench-')
+    try:
+        tree = build_tree(root)
+        run_tuv_batch.tuv_path = tree
+        modify_usrinp.reference_filepath = os.path.join(tree, 'INPUTS', 'usrinp_backup')
+        modify_usrinp.outfile = os.path.join(tree, 'INPUTS', 'usrinp')
+        metrics_path = os.path.join(root, 'metrics.jsonl')
+        kwargs = dict(sweep=case_sweep(dims, size), metrics=metrics_path, nt=1)
+
+        concurrency = 1 if mode == 'serial' else workers
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            if mode == 'async':
+                from tuv_async import batch_run_async
+                asyncio.run(batch_run_async('bench', concurrency=workers, **kwargs))
+            else:
+                run_tuv_batch.batch_run('bench', workers=concurrency, **kwargs)
+        wall = time.perf_counter() - started
+
+        records = [record for record in read_metrics(metrics_path) if record['status'] == 'ran']
+        if len(records) != size:
+            raise RuntimeError(f'{len(records)} of {size} runs finished')
+        tuv_time = sum(record['run_s'] for record in records)
+        renders = sorted(record['render_s'] for record in records)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    return {'runs_per_s': size / wall,
+            'overhead_ms': 1e3 * (wall * concurrency - tuv_time) / size,
+            'render_ms': 1e3 * renders[len(renders) // 2],
+            'peak_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+def machine():
+    # what a baseline is only valid for
+    return {'host': platform.node(), 'cpus': os.cpu_count(), 'python': platform.python_version()}
+
+def same_machine(meta):
+    return meta is not None and all(meta.get(key) == value for key, value in machine().items())
+
+def baseline_meta():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=bench_dir, check=True,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {**machine(), 'commit': commit, 'saved': time.strftime('%Y-%m-%d')}
+
+def save_baseline(filepath, cases, meta=None):
+    with open(filepath, 'w') as f:
+        json.dump({'meta': meta or baseline_meta(), 'cases': cases}, f, indent=1, sort_keys=True)
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['runs_per_s'] < base['runs_per_s'] * (1 - tolerance):
+            regressions.append(f'{name}: {result["runs_per_s"]:.1f} runs/s, baseline {base["runs_per_s"]:.1f}')
+        if result['peak_mb'] > base['peak_mb'] * (1 + tolerance):
+            regressions.append(f'{name}: {result["peak_mb"]:.0f} MiB peak, baseline {base["peak_mb"]:.0f}')
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--dims', type=int, nargs='+', default=[1, 2, 3])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--modes', nargs='+', default=['serial', 'workers', 'async'],
+                        choices=['serial', 'workers', 'async'])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--sleep', type=float, default=0.0, help='seconds each stub run sleeps')
+    parser.add_argument('--cpu', type=float, default=0.0, help='seconds of CPU each stub run burns')
+    parser.add_argument('--baseline', default=default_baseline)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--no-compare', action='store_true', help='print the results without judging them')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--case', nargs=3, metavar=('DIMS', 'SIZE', 'MODE'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        dims, size, mode = args.case
+        print(json.dumps(run_case(int(dims), int(size), mode, args.workers)))
+        return 0
+
+    env = dict(os.environ, TUV_STUB_SLEEP=str(args.sleep), TUV_STUB_CPU=str(args.cpu))
+    results = {}
+    print(f'{"case":>22} {"runs/s":>9} {"overhead ms":>12} {"render ms":>10} {"peak MiB":>9}')
+    for mode in args.modes:
+        for dims in args.dims:
+            for size in args.sizes:
+                name = case_name(dims, size, mode)
+                output = subprocess.run([sys.executable, os.path.abspath(__file__), '--workers',
+                                         str(args.workers), '--case', str(dims), str(size), mode],
+                                        env=env, stdout=subprocess.PIPE, check=True)
+                result = json.loads(output.stdout.decode().strip().splitlines()[-1])
+                results[name] = result
+                print(f'{name:>22} {result["runs_per_s"]:9.1f} {result["overhead_ms"]:12.2f} '
+                      f'{result["render_ms"]:10.3f} {result["peak_mb"]:9.1f}')
+
+    if args.no_compare:
+        return 0
+    if not os.path.exists(args.baseline):
+        save_baseline(args.baseline, results)
+        print(f'no baseline yet; saved {len(results)} cases to {args.baseline} for later runs to compare with')
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    meta = baseline.get('meta')
+    if args.save_baseline:
+        # cases from another machine are dropped, not mixed in
+        save_baseline(args.baseline, {**(baseline['cases'] if same_machine(meta) else {}), **results})
+        print(f'saved {len(results)} cases to {args.baseline}')
+        return 0
+
+    if not same_machine(meta):
+        print(f'ERROR: {args.baseline} was taken on {meta}, not on {machine()}; save one here with '
+              f'--save-baseline, or pass --no-compare')
+        return 2
+    regressions = compare(results, baseline['cases'], args.tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    new = {name: result for name, result in results.items() if name not in baseline['cases']}
+    if new:
+        save_baseline(args.baseline, {**baseline['cases'], **new}, meta)
+        print(f'added {len(new)} new cases to {args.baseline}')
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the TUV executable, for benchmarking the batch runner.
+
+Like TUV it reads INPUTS/usrinp from the directory it is started in and
+writes usrout.txt and tuvlog.txt one level up. The output has TUV's layout
+and roughly its size for the same inputs: a dose rate table of nt times by
+nms spectra and a spectral irradiance table of nwint wavelengths by nt
+times. The values are made up. How long a run takes is set from the
+environment:
+
+    TUV_STUB_SLEEP   seconds to sleep (waiting on I/O)
+    TUV_STUB_CPU     seconds of CPU to burn
+"""
+import os
+import time
+
+def read_inputs(filepath):
+    inputs = {}
+    with open(filepath) as usrinp:
+        lines = usrinp.read().split('\n')
+    for line in lines[2:18]:
+        tokens = line.split()
+        for k in range(0, 9, 3):
+            inputs[tokens[k]] = tokens[k+2]
+    return inputs
+
+def burn(seconds):
+    end = time.process_time() + seconds
+    x = 0.0
+    while time.process_time() < end:
+        for i in range(1000):
+            x += i * 1e-9
+    return x
+
+def usrout(inputs):
+    nt = max(int(inputs['nt']), 1)
+    nwint = int(inputs['nwint'])
+    nms = int(inputs['nms']) if inputs['lrates'] == 'T' else 0
+    tstart, tstop = float(inputs['tstart']), float(inputs['tstop'])
+    wstart, wstop = float(inputs['wstart']), float(inputs['wstop'])
+    if nwint < 0:
+        wstart, wstop, nwint = 120.0, 735.0, 156
+    times = [tstart + (tstop - tstart) * k / max(nt - 1, 1) for k in range(nt)]
+    scale = float(inputs['o3col']) / 300.0
+
+    lines = [' ' + '=' * 66]
+    keys = list(inputs)
+    for k in range(0, len(keys), 3):
+        lines.append(' ' + '   '.join(f'{key} = {inputs[key]:>{17 - len(key)}}' for key in keys[k:k+3]))
+    lines.append(' ' + '=' * 66)
+
+    if nms:
+        lines.append('')
+        lines.append(f' Weighted irradiances (W m-2), altitude (km) = {float(inputs["zout"]):8.3f}')
+        for i in range(nms):
+            lines.append(f'  {i+1} spectrum {i+1}')
+        lines.append(' time, hrs.  sza, deg.' + ''.join(f'{i+1:11d}' for i in range(nms)))
+        for t in times:
+            lines.append(f'  {t:8.3f}  {abs(t - 12) * 15:8.3f}' +
+                         ''.join(f' {0.15 * (i + 1) / scale:10.3E}' for i in range(nms)))
+
+    if inputs['lirrad'] == 'T':
+        lines.append('')
+        lines.append(f' Spectral irradiance, W m-2 nm-1, at altitude (km) = {float(inputs["zout"]):8.3f}')
+        lines.append(' wl(lower)  wl(upper)' + ''.join(f'{k+1:11d}' for k in range(nt)))
+        step = (wstop - wstart) / nwint
+        for w in range(nwint):
+            lines.append(f' {wstart + w*step:9.3f} {wstart + (w+1)*step:9.3f}' +
+                         ''.join(f' {1e-3 * (w + 1) / scale:10.3E}' for _ in range(nt)))
+    return '\n'.join(lines) + '\n'
+
+if __name__ == '__main__':
+    inputs = read_inputs(os.path.join('INPUTS', 'usrinp'))
+    time.sleep(float(os.environ.get('TUV_STUB_SLEEP', 0)))
+    burn(float(os.environ.get('TUV_STUB_CPU', 0)))
+    with open(os.path.join('..', 'usrout.txt'), 'w') as out:
+        out.write(usrout(inputs))
+    with open(os.path.join('..', 'tuvlog.txt'), 'w') as log:
+        with open(os.path.join('INPUTS', 'usrinp')) as usrinp:
+            log.write(usrinp.read())
+        log.write(' done\n')
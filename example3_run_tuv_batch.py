@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+from run_tuv_batch import batch_run # since this is a relative import, make sure you're in the TUV-V5.4 home directory!
+
+"""
+In example 3, the month varies from Jan. to Dec. at latitudes every 5 degrees,
+with the total ozone column of each (month, latitude) point taken from a
+seasonal cycle of OMI data. This is the test run that used to sit at the
+bottom of run_tuv_batch.py; uncomment the iterable_j/k lines to sweep latitude
+and ozone as well.
+"""
+
+# ITERABLE PARAMETERS
+# -------------------
+lat_spacing = 1#5
+lat_min = -89.5 #-90
+lat_max = 89.5 #90
+month_start = 1
+month_end = 12
+month_spacing = 1
+lat_range = np.arange(lat_min, lat_max + 1, lat_spacing)
+imonth_range = np.arange(month_start, month_end + 1, month_spacing)
+
+# Get seasonal TOC trend
+data_path = '/data/keeling/a/sf20/d/TUV-V5.4/omi-data/processed-seasonal-cycle/2005/'
+filename = 'omi_TOC_monthly-longavg_2005.csv'
+seasonal_TOC_trend = np.array(pd.read_csv(data_path + filename, index_col=0))
+
+# lower the latitude resolution of TOC to be 5 degrees instead of 1 for comp. effic.
+lat_range = lat_range[5::5] # sets the range to -84.5 to 85.5
+seasonal_TOC_trend = seasonal_TOC_trend[5::5]
+
+batch_run(data_subdir='general-iter-test-2',
+    #data_subdir='seasonal-toc-2005-latres5deg',
+    # CONSTANT PARAMETERS 
+    iday = 1, 
+    tstart = 12.0,
+    tstop = 12.01,
+    nt = 1,
+    wstart = 205.0, # Shortest wavelength I can go without getting runtime error
+    wstop = 420.0,
+    nwint = -156, #215, # for wavelengths lower than 205
+    tauaer = 0,
+    ssaaer = 0,
+    alpha = 0,
+    # ITERABLE PARAMETERS (assigned subsequently looping over values)
+    iterable_i = 'imonth',
+    #iterable_j = 'lat',
+    #iterable_k = 'o3col',
+    #iterable_k_field = True, # one o3col per (imonth, lat) point
+    imonth = imonth_range,
+    #lat = lat_range, 
+    #o3col = seasonal_TOC_trend, 
+    )
@@ -1,11 +1,12 @@
-import pandas as pd
+import os
 import csv
 
 reference_filepath = '/data/keeling/a/sf20/d/TUV-V5.4/INPUTS/usrinp_backup'
 outfile = '/data/keeling/a/sf20/d/TUV-V5.4/INPUTS/usrinp'
 
 def createInputsDataset():
-    
+    # pandas only for this table, so that rendering usrinp never waits on it
+    import pandas as pd
     inputs = pd.read_csv(reference_filepath, header=None, skiprows=2, nrows=16, delim_whitespace=True).drop(columns=[1,4,7])
     #inputs = pd.read_csv(filepath, header=None, skiprows=2, nrows=16,)# delimiter=' ')
     inputs1 = inputs[[0, 2]].rename(columns={0:"varname", 2:"value"})
@@ -17,82 +18,110 @@ def createInputsDataset():
 
     return inputs_formatted
 
-def modifyInput(modified_variables):
-
-    inputs_formatted = createInputsDataset()
-
-    for var_name, var_value in modified_variables.items():
-        var_value = formatVarType(var_name, var_value)
-        var_idx = inputs_formatted[inputs_formatted['varname']== var_name].index[0]
-        inputs_formatted.loc[var_idx, 'value'] = var_value
-        #print(f'..setting {var_name}: {var_value:>10}')
-
-    inputs1_formatted = pd.DataFrame(inputs_formatted.loc[0:15, :])
-    inputs2_formatted = pd.DataFrame(inputs_formatted.loc[16:31, :])
-    inputs3_formatted = pd.DataFrame(inputs_formatted.loc[32:, :])
-
-    # Create a temporary csv file to store the modified variable info
-    with open('modified-vars', 'w') as csvfile:
-        for row1, row2, row3 in zip(inputs1_formatted.iterrows(), 
-                                    inputs2_formatted.iterrows(), 
-                                    inputs3_formatted.iterrows()):
-            #idx1 = row1[0]
-            attributes1 = row1[1]
-            var1 = attributes1.varname
-            val1 = str(attributes1.value)
-            var1_str = f'{var1} = '
-            len_var1_str = len(var1_str)
-            len_val1 = 20 - len_var1_str
-            val1_str = val1.rjust(len_val1, ' ')
-            output1_str = f'{var1_str}{val1_str}'
-
-            #idx2 = row2[0]
-            attributes2 = row2[1]
-            var2 = attributes2.varname
-            val2 = str(attributes2.value)
-            var2_str = f'{var2} = '
-            len_var2_str = len(var2_str)
-            len_val2 = 20 - len_var2_str
-            val2_str = val2.rjust(len_val2, ' ')
-            output2_str = f'{var2_str}{val2_str}'
-
-            #idx3 = row3[0]
-            attributes3 = row3[1]
-            var3 = attributes3.varname
-            val3 = str(attributes3.value)
-            var3_str = f'{var3} = '
-            len_var3_str = len(var3_str)
-            len_val3 = 20 - len_var3_str
-            val3_str = val3.rjust(len_val3, ' ')
-            output3_str = f'{var3_str}{val3_str}'
-
-            row_output = f'{output1_str}   {output2_str}   {output3_str}'
-            
-            csvfile.write(row_output)
-            csvfile.write('\n')
-
-    # update usrinpt with modified variable info
-    # use backup usrinpt to copy over lines that wont change
-    with open(reference_filepath) as refcsv:
-        with open('modified-vars') as modcsv:
-            with open(outfile, 'w') as outcsv:
-                refreader = csv.reader(refcsv, delimiter='\t')
-                modreader = csv.reader(modcsv)
-                outwriter = csv.writer(outcsv)
-                mod_line = 0
-                modlines = [line for line in modreader]
-                for i, row in enumerate(refreader):
-                    if (i>1) and (i<18):
-                        # copy over lines with updated variable values
-                        outcsv.write(f'{modlines[mod_line][0]}\n')
-                        mod_line += 1
-                    else:
-                        # copy over lines that dont change 
-                        outcsv.write(f'{row[0]}\n')
-    
-    return
+class InputDeck:
+    """
+    usrinp_backup parsed once into a compiled template.
+
+    Lines 2-17 of the file hold the 48 input variables in three fixed-width
+    columns of the form 'name = value'. Below them are the lists of spectral
+    weighting functions and photolysis reactions, one per line with a T or F
+    flag in front ('T  1 UV-B, 280-315 nm'). Every other line is copied
+    through unchanged. The template keeps the (line, column, width) slot of
+    each variable and the flag of every list entry, so a new usrinp is
+    rendered with a single str.format call.
+
+    The flags are set with the pseudo-variables 'spectra' and 'reactions':
+    the numbers of the entries to switch on, separated by spaces. Left out,
+    the lists stay as they are in the file.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.mtime = os.stat(filepath).st_mtime_ns
+        self.defaults = {}
+        self.slots = {}
+        self.selections = {'spectra': [], 'reactions': []}
+
+        template_lines = []
+        section = None
+        with open(filepath) as refcsv:
+            for i, row in enumerate(csv.reader(refcsv, delimiter='\t')):
+                line = row[0] if row else ''
+                if 'Select spectra' in line:
+                    section = 'spectra'
+                elif 'Select photolysis' in line:
+                    section = 'reactions'
+                if (i>1) and (i<18):
+                    line = self._compile_line(i, line)
+                elif section is not None and self._is_selection(line):
+                    line = self._compile_selection(section, line)
+                else:
+                    line = line.replace('{', '{{').replace('}', '}}')
+                template_lines.append(f'{line}\n')
+        self.template = ''.join(template_lines)
+
+    @staticmethod
+    def _is_selection(line):
+        tokens = line.split(None, 2)
+        return len(tokens) == 3 and tokens[0] in ('T', 'F') and tokens[1].isdigit()
+
+    def _compile_selection(self, section, line):
+        flag, number, name = line.split(None, 2)
+        entries = self.selections[section]
+        entries.append(name.strip())
+        slot = f'{section}_{len(entries)}'
+        self.defaults[slot] = flag
+        rest = line[line.index(flag) + 1:].replace('{', '{{').replace('}', '}}')
+        return f'{line[:line.index(flag)]}{{{slot}}}{rest}'
+
+    def _compile_line(self, line_number, line):
+        tokens = line.split()
+        fields = []
+        for column in range(3):
+            var_name, value = tokens[3*column], tokens[3*column + 2]
+            var_str = f'{var_name} = '
+            width = 20 - len(var_str)
+            self.defaults[var_name] = value
+            self.slots[var_name] = (line_number, column, width)
+            fields.append(f'{var_str}{{{var_name}:>{width}}}')
+        return '   '.join(fields)
+
+    def render(self, modified_variables):
+        values = dict(self.defaults)
+        for var_name, var_value in modified_variables.items():
+            if var_name in self.selections:
+                selected = {int(number) for number in str(var_value).split()}
+                for n in range(1, len(self.selections[var_name]) + 1):
+                    values[f'{var_name}_{n}'] = 'T' if n in selected else 'F'
+                continue
+            if var_name not in values:
+                raise AttributeError(f'Invalid parameter name: "{var_name}"')
+            values[var_name] = formatVarType(var_name, var_value)
+        return self.template.format_map(values)
+
+_decks = {}
+
+def loadInputDeck(filepath=None):
+    # parse each reference file once, and again only if it changes on disk
+    if filepath is None:
+        filepath = reference_filepath
+    deck = _decks.get(filepath)
+    if deck is None or deck.mtime != os.stat(filepath).st_mtime_ns:
+        deck = InputDeck(filepath)
+        _decks[filepath] = deck
+    return deck
+
+def modifyInput(modified_variables, usrinp_filepath=None):
+    # usrinp_filepath lets parallel runs write into their own TUV workspace
+    if usrinp_filepath is None:
+        usrinp_filepath = outfile
+
+    usrinp = loadInputDeck().render(modified_variables)
+    with open(usrinp_filepath, 'w') as outcsv:
+        outcsv.write(usrinp)
 
 def varTypeDict():
+    import pandas as pd
     inputs_formatted = createInputsDataset()
     typedict = {}
     for row in inputs_formatted.iterrows():
@@ -112,66 +141,70 @@ def varTypeDict():
                 typedict[attribs.varname] = 'str'
     return typedict
 
+var_types = {'inpfil': 'str',
+             'lat': 'float',
+             'iyear': 'int',
+             'zstart': 'float',
+             'wstart': 'float',
+             'tstart': 'float',
+             'lzenit': 'bool',
+             'o3col': 'float',
+             'taucld': 'float',
+             'tauaer': 'float',
+             'dirsun': 'float',
+             'zout': 'float',
+             'lirrad': 'bool',
+             'lrates': 'bool',
+             'ljvals': 'bool',
+             'iwfix': 'int',
+             'outfil': 'str',
+             'lon': 'float',
+             'imonth': 'int',
+             'zstop': 'float',
+             'wstop': 'float',
+             'tstop': 'float',
+             'alsurf': 'float',
+             'so2col': 'float',
+             'zbase': 'float',
+             'ssaaer': 'float',
+             'difdn': 'float',
+             'zaird': 'float', # NOTE this is actually scientific expon
+             'laflux': 'bool',
+             'isfix': 'int',
+             'ijfix': 'int',
+             'itfix': 'int',
+             'nstr': 'int',
+             'tmzone': 'float',
+             'iday': 'int',
+             'nz': 'int',
+             'nwint': 'int',
+             'nt': 'int',
+             'psurf': 'float',
+             'no2col': 'float',
+             'ztop': 'float',
+             'alpha': 'float',
+             'difup': 'float',
+             'ztemp': 'float',
+             'lmmech': 'bool',
+             'nms': 'int',
+             'nmj': 'int',
+             'izfix': 'int',
+             # not usrinp variables but the T/F lists below them, see InputDeck
+             'spectra': 'str',
+             'reactions': 'str'}
+
+_formatters = {'int': lambda var_value: str(int(var_value)),
+               'float': lambda var_value: f'{float(var_value):8.3f}',
+               'bool': lambda var_value: str(var_value)[0], # T or F
+               'str': str}
+
 def formatVarType(var_name, var_value):
-    typedict = {'inpfil': 'str',
-                'lat': 'float',
-                'iyear': 'int',
-                'zstart': 'float',
-                'wstart': 'float',
-                'tstart': 'float',
-                'lzenit': 'bool',
-                'o3col': 'float',
-                'taucld': 'float',
-                'tauaer': 'float',
-                'dirsun': 'float',
-                'zout': 'float',
-                'lirrad': 'bool',
-                'lrates': 'bool',
-                'ljvals': 'bool',
-                'iwfix': 'int',
-                'outfil': 'str',
-                'lon': 'float',
-                'imonth': 'int',
-                'zstop': 'float',
-                'wstop': 'float',
-                'tstop': 'float',
-                'alsurf': 'float',
-                'so2col': 'float',
-                'zbase': 'float',
-                'ssaaer': 'float',
-                'difdn': 'float',
-                'zaird': 'float', # NOTE this is actually scientific expon
-                'laflux': 'bool',
-                'isfix': 'int',
-                'ijfix': 'int',
-                'itfix': 'int',
-                'nstr': 'int',
-                'tmzone': 'float',
-                'iday': 'int',
-                'nz': 'int',
-                'nwint': 'int',
-                'nt': 'int',
-                'psurf': 'float',
-                'no2col': 'float',
-                'ztop': 'float',
-                'alpha': 'float',
-                'difup': 'float',
-                'ztemp': 'float',
-                'lmmech': 'bool',
-                'nms': 'int',
-                'nmj': 'int',
-                'izfix': 'int'}
-    
-    var_type = typedict[var_name]
-
-    if var_type == 'int':
-        var_value = str(int(var_value))
-    if var_type == 'float':
-        var_value = f'{float(var_value):8.3f}'
-    if var_type == 'bool':
-        var_value = str(var_value)[0] # T or F
-
-    return var_value
+    return _formatters[var_types[var_name]](var_value)
+
+def formatInputs(input_dict):
+    # the values exactly as they end up in usrinp
+    return {var_name: formatVarType(var_name, var_value)
+            for var_name, var_value in input_dict.items()}
 
 if __name__ == '__main__':
 
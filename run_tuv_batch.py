@@ -178,14 +178,43 @@ UVB: 280-315 nm
 UVC: 100-280 nm
 
 """
-import subprocess
 import os
-import numpy as np
-import pandas as pd
-from modify_usrinp import modifyInput
+import re
+import sys
+import json
+import shutil
+import math
+import time
+import queue
+import resource
+import itertools
+import threading
+from collections import namedtuple
+from modify_usrinp import modifyInput, formatInputs
+from tuv_workspace import (create_workspace, batch_root, workspace_outputs,
+                           WorkspaceManager, OutputMover, link_or_copy)
+from tuv_cache import ResultCache, binary_fingerprint, inputs_key
+from tuv_journal import RunJournal, is_complete
+from tuv_sweep import Sweep
+from tuv_metrics import RunMetrics
+from tuv_extend import extend_outputs
+# NumPy and the modules built on it (tuv_output, tuv_store, tuv_cost,
+# tuv_preflight, tuv_want), subprocess and multiprocessing are imported where
+# they are used, so that a batch can be planned, and the command line
+# started, without waiting for them
+
+tuv_path = '/data/keeling/a/sf20/d/TUV-V5.4'
+
+# one planned simulation: where it sits in the sweep, its inputs and outputs
+# (members lists the per-time runs a collapsed time axis run stands for)
+Run = namedtuple('Run', ['iteration', 'label', 'index', 'inputs',
+                         'output_filename', 'log_filename', 'cache_key', 'members'],
+                 defaults=(None,))
 
 def batch_test():
     # NOTE test: change the number of time increments
+    import subprocess
+    import numpy as np
     nt_range = np.arange(1, 11, 1)
     for i, nt_val in enumerate(nt_range):
         print(f'TUV Run: {i+1}'.center(20))
@@ -256,132 +285,875 @@ def setInputs(**kwargs):
             if item in ('iterable_i', 'iterable_j', 'iterable_k'):
                 iterable_vars.append(kwargs[item])
                 continue
+            elif item == 'iterable_k_field':
+                continue
             else:
                 raise AttributeError(f'Invalid parameter name: "{item}"')
         inputs[item] = kwargs[item]
             
     return inputs, iterable_vars
 
-def batch_run(data_subdir, **kwargs):
-    output_path = '/data/keeling/a/sf20/d/TUV-V5.4/OUTPUT/'
+def batch_run(data_subdir, workers=1, scratch_root=None, cache=None, resume=False, output='text',
+              sweep=None, shard=None, collapse_time=False, timeout=None, metrics=False,
+              local_scratch=None, cost_model=None, dry_run=False, preflight=True, want=None,
+              extend=False, index=None, **kwargs):
+    if dry_run:
+        return _dry_run(sweep, shard, collapse_time, cost_model, workers, preflight, want, kwargs)
+    batch = _setup_batch(data_subdir, cache, resume, output, sweep, shard, collapse_time,
+                         metrics, local_scratch, cost_model, preflight, want, extend, kwargs)
+    if batch.cost is not None and workers > 1:
+        batch = batch._replace(runs=batch.cost.order(batch.runs))
+
+    try:
+        if workers > 1:
+            _run_parallel(batch, workers, scratch_root, timeout)
+        else:
+            _run_serial(batch, timeout)
+    finally:
+        _close_batch(batch)
+
+    _link_repeats(batch)
+    _index_batch(os.path.dirname(batch.journal.filepath), index)
+    _report_batch(batch)
+
+# everything a runner needs to work through a batch
+Batch = namedtuple('Batch', ['runs', 'total_iterations', 'cache', 'journal', 'store', 'metrics',
+                             'workspaces', 'mover', 'cost', 'repeats', 'archive'])
+
+# points that check_sweep() found to be the same run as an earlier point
+Repeats = namedtuple('Repeats', ['duplicates', 'planned', 'sweep', 'time_axis', 'input_dict', 'batch_path'])
+
+def _setup_batch(data_subdir, cache, resume, output, sweep, shard, collapse_time, metrics,
+                 local_scratch, cost_model, preflight, want, extend, kwargs):
+    if output not in ('text', 'store', 'archive'):
+        raise ValueError(f'Unknown output "{output}", expected text, store or archive')
+    if extend and output != 'text':
+        raise ValueError('Only batches saved as text output can be extended')
+    # extending picks up the existing outputs just like resuming does
+    resume = resume or extend
+    output_path = f'{tuv_path}/OUTPUT/'
     dirExist = os.path.exists(output_path)
     if not dirExist:
         os.mkdir(output_path)
 
-    os.mkdir(f'/data/keeling/a/sf20/d/TUV-V5.4/OUTPUT/{data_subdir}')
-    os.mkdir(f'/data/keeling/a/sf20/d/TUV-V5.4/OUTPUT/{data_subdir}/data')
-    os.mkdir(f'/data/keeling/a/sf20/d/TUV-V5.4/OUTPUT/{data_subdir}/log')
+    # an absolute data_subdir puts the batch anywhere, e.g. on shared storage
+    batch_path = os.path.join(output_path, data_subdir)
+
+    # an existing output directory is only allowed when picking up a batch
+    os.makedirs(batch_path, exist_ok=resume)
+    os.makedirs(f'{batch_path}/data', exist_ok=resume)
+    os.makedirs(f'{batch_path}/log', exist_ok=resume)
+
+    journal = RunJournal(f'{batch_path}/journal.jsonl')
+    if metrics:
+        if metrics is True:
+            metrics = f'{batch_path}/metrics.jsonl'
+        metrics = RunMetrics(metrics)
+    else:
+        metrics = None
+
+    input_dict, sweep, planned, time_axis = _plan_sweep(sweep, collapse_time, want, kwargs)
+    if want is not None:
+        from tuv_want import Wanted
+        # what the outputs hold, for Wanted(...).read() later on
+        with open(f'{batch_path}/want.json', 'w') as f:
+            json.dump(Wanted(want).specs, f)
+    if extend:
+        extend_outputs(batch_path, input_dict, sweep)
+    completed = journal.completed() if resume else {}
 
+    if isinstance(cache, str):
+        cache = ResultCache(cache)
+    fingerprint = None
+    if cache is not None:
+        fingerprint = binary_fingerprint(os.path.join(tuv_path, 'tuv'))
+
+    store = archive = None
+    if output == 'store':
+        store = _open_store(f'{batch_path}/store', sweep, resume)
+    elif output == 'archive':
+        from tuv_archive import BatchArchive
+        archive = BatchArchive(f'{batch_path}/archive')
+
+    if time_axis is not None:
+        os.makedirs(f'{batch_path}/combined', exist_ok=resume)
+
+    points = planned.points() if shard is None else planned.shard(*shard)
+    report = repeats = None
+    if preflight:
+        report = _preflight(input_dict, planned, shard)
+    if report is not None and report.duplicates:
+        repeats = Repeats(report.duplicates, planned, sweep, time_axis, input_dict,
+                          batch_path)
+    runs = _plan_runs(points, input_dict, batch_path,
+                      resume, completed, store, cache, fingerprint, journal, metrics,
+                      sweep if time_axis else None, time_axis, report, archive)
+
+    # workspaces on local disk or in RAM, with outputs moved over in batches
+    workspaces = mover = None
+    if local_scratch:
+        workspaces = WorkspaceManager(tuv_path, None if local_scratch is True else local_scratch)
+        mover = OutputMover()
+    return Batch(runs, len(sweep), cache, journal, store, metrics, workspaces, mover,
+                 _cost_model(cost_model), repeats, archive)
+
+def _plan_sweep(sweep, collapse_time, want, kwargs):
     input_dict, iterable_vars = setInputs(**kwargs)
+    if want is not None:
+        from tuv_want import Wanted
+        # switch off every output that wasn't asked for
+        input_dict.update(Wanted(want).settings())
+
+    # iterable_i/j/k describe a sweep of up to three axes
+    if sweep is None:
+        sweep = Sweep.from_iterables(input_dict,
+                                     kwargs.get('iterable_i', None),
+                                     kwargs.get('iterable_j', None),
+                                     kwargs.get('iterable_k', None),
+                                     kwargs.get('iterable_k_field', False))
+    for param in sweep.params:
+        if param not in input_dict:
+            raise AttributeError(f'Invalid parameter name: "{param}"')
+
+    # a time or zenith angle axis can be left to TUV's own nt grid, so one run
+    # covers the whole axis and is split up again afterwards
+    planned = sweep
+    time_axis = sweep.time_axis(input_dict) if collapse_time else None
+    if time_axis is not None:
+        planned = sweep.without(time_axis)
+    elif collapse_time:
+        print('..no evenly spaced tstart axis to collapse, running every time separately')
+    return input_dict, sweep, planned, time_axis
+
+def _preflight(input_dict, planned, shard):
+    if not isinstance(planned, Sweep):
+        print('..preflight: rows are checked as they are read')
+        return planned.preflight(input_dict)
+    from tuv_preflight import check_sweep
+    start, stop = 0, len(planned)
+    if shard is not None:
+        start, stop = shard[0] * stop // shard[1], (shard[0] + 1) * stop // shard[1]
+    report = check_sweep(input_dict, planned, start, stop)
+    print(f'..preflight: {report.summary()}')
+    return report
+
+def _cost_model(cost_model):
+    from tuv_cost import CostModel
+    if cost_model is True:
+        return CostModel(f'{tuv_path}/OUTPUT/runtimes.jsonl')
+    if isinstance(cost_model, str):
+        return CostModel(cost_model)
+    return cost_model
+
+def _dry_run(sweep, shard, collapse_time, cost_model, workers, preflight, want, kwargs):
+    # plan the batch without touching the output directories
+    input_dict, sweep, planned, time_axis = _plan_sweep(sweep, collapse_time, want, kwargs)
+    points = planned.points() if shard is None else planned.shard(*shard)
+    report = _preflight(input_dict, planned, shard) if preflight else None
+    if report is not None:
+        points = (point for point in points
+                  if point.flat not in report.invalid and point.flat not in report.duplicates)
+    if time_axis is not None:
+        points = (_collapse_point(point, sweep, time_axis) for point in points)
+    model = _cost_model(True if cost_model is None else cost_model)
+    from tuv_cost import describe
+    prediction = model.predict_batch(({**input_dict, **point.values} for point in points), workers)
+    print(f'..dry run: {describe(prediction)}')
+    return prediction
+
+def _report_batch(batch):
+    if batch.cache is not None:
+        print('..cache: {hits} hits, {misses} misses, {evictions} evictions'.format(**batch.cache.stats()))
+    if batch.journal.failures:
+        print(f'..{batch.journal.failures} iterations failed, see journal.jsonl')
+
+def _index_batch(batch_path, index):
+    # index=True is the index in OUTPUT, a string the path of another one
+    if not index:
+        return
+    from tuv_index import RunIndex
+    with RunIndex(None if index is True else index) as run_index:
+        run_index.update(batch_path, binary_fingerprint(os.path.join(tuv_path, 'tuv')))
+
+def _close_batch(batch):
+    if batch.metrics is not None:
+        batch.metrics.close()
+    if batch.mover is not None:
+        batch.mover.flush()
+    if batch.workspaces is not None:
+        batch.workspaces.close()
+    if batch.cost is not None:
+        batch.cost.close()
+    if batch.archive is not None:
+        batch.archive.flush()
 
-    # create mesh for i and j parameters
-    iter_ivar_name = kwargs.get('iterable_i', None) # month
-    iter_jvar_name =kwargs.get('iterable_j', None) # lat
-    iter_kvar_name =kwargs.get('iterable_k', None) # ozone column
-
-    iterate_i = False
-    iterate_j = False
-    if (iter_ivar_name is not None):
-        iterate_i = True
-        idim = input_dict[iter_ivar_name].size
-        if (iter_jvar_name is not None):
-            iterate_j = True
-            iterable_i_mesh, iterable_j_mesh = np.meshgrid(input_dict[iter_ivar_name], 
-                                                           input_dict[iter_jvar_name])
-            jdim = input_dict[iter_jvar_name].size
-            i_index_mesh, j_index_mesh = np.meshgrid(np.arange(idim), np.arange(jdim))
-
-            flat_iterable_i_mesh = iterable_i_mesh.flatten()
-            flat_iterable_j_mesh = iterable_j_mesh.flatten()
-            flat_i_index_mesh = i_index_mesh.flatten()
-            flat_j_index_mesh = j_index_mesh.flatten()
-            iterable_vars_dict = {iter_ivar_name: flat_iterable_i_mesh,
-                                  iter_jvar_name: flat_iterable_j_mesh}
+def _plan_runs(points, input_dict, batch_path,
+               resume, completed, store, cache, fingerprint, journal, metrics=None,
+               full_sweep=None, time_axis=None, report=None, archive=None):
+    # generate the runs that still need TUV one at a time, so a sweep is
+    # never held in memory as a whole
+    per_point = 1
+    if time_axis is not None:
+        per_point = next(axis.size for axis in full_sweep.axes if axis.name == time_axis)
+    # counted over the points given, which for a shard or queue chunk aren't the whole sweep
+    resumed = n_points = 0
+    for point in points:
+        n_points += per_point
+        if report is not None and point.flat in report.duplicates:
+            continue
+        if report is not None and point.flat in report.invalid:
+            _reject_point(point, input_dict, report.invalid[point.flat], journal, full_sweep, time_axis)
+            continue
+        if time_axis is not None:
+            point = _collapse_point(point, full_sweep, time_axis)
+        iteration = point.flat
+        file_iter_label = point.label
+        output_filename = f'{batch_path}/data/usrout-{file_iter_label}.txt'
+        log_filename = f'{batch_path}/log/tuvlog-{file_iter_label}.txt'
+        members = None
+        if time_axis is not None:
+            output_filename = f'{batch_path}/combined/usrout-{file_iter_label}.txt'
+            log_filename = f'{batch_path}/combined/tuvlog-{file_iter_label}.txt'
+            members = [Run(member.flat, member.label, member.index, {**input_dict, **member.values},
+                           f'{batch_path}/data/usrout-{member.label}.txt',
+                           f'{batch_path}/log/tuvlog-{member.label}.txt', None)
+                       for member in point.members]
+
+        point_inputs = dict(input_dict)
+        point_inputs.update(point.values)
+        for var, value in point.values.items():
+            if isinstance(value, float) and math.isnan(value):
+                print(f'..{var}={value}, skipping iteration {iteration+1}')
+                break
         else:
-            iterable_i_mesh = input_dict[iter_ivar_name]
-            i_index_mesh = np.arange(idim)
-            flat_iterable_i_mesh = iterable_i_mesh.flatten()
-            flat_i_index_mesh = i_index_mesh
-            iterable_vars_dict = {iter_ivar_name: flat_iterable_i_mesh}
+            run = Run(iteration, file_iter_label, point.index, point_inputs,
+                      output_filename, log_filename, None, members)
+
+            if resume and _is_finished(run, completed, store, archive):
+                resumed += len(members) if members else 1
+                if metrics is not None:
+                    metrics.record(run, 'skipped')
+                continue
+
+            if cache is not None:
+                run = run._replace(cache_key=inputs_key(point_inputs, fingerprint))
+                started = time.perf_counter()
+                if cache.fetch(run.cache_key, output_filename, log_filename):
+                    print(f'..iteration {iteration+1} found in cache')
+                    _finish_run(run, None, journal, store, archive)
+                    if metrics is not None:
+                        metrics.record(run, 'cached', finish_s=time.perf_counter() - started)
+                    continue
+
+            yield run
+
+    if resume:
+        print(f'..resuming: {resumed} of {n_points} iterations already done')
+
+def _reject_point(point, input_dict, reason, journal, full_sweep=None, time_axis=None):
+    print(f'..iteration {point.flat+1} not run ({reason})')
+    for member in _point_members(point, full_sweep, time_axis):
+        journal.record_failure(member.flat, member.label, {**input_dict, **member.values}, 'invalid', reason)
+
+def _point_members(point, full_sweep=None, time_axis=None):
+    if time_axis is None:
+        return [point]
+    return _collapse_point(point, full_sweep, time_axis).members
+
+def _link_repeats(batch):
+    """Give the points check_sweep() found repeated the outputs of their first occurrence."""
+    repeats = batch.repeats
+    if repeats is None:
+        return
+    linked = 0
+    for flat, first in sorted(repeats.duplicates.items()):
+        pairs = zip(_point_members(repeats.planned.point(first), repeats.sweep, repeats.time_axis),
+                    _point_members(repeats.planned.point(flat), repeats.sweep, repeats.time_axis))
+        for source, member in pairs:
+            if batch.store is not None:
+                if batch.store.copy_point(source.index, member.index):
+                    linked += 1
+                continue
+            if batch.archive is not None:
+                if batch.archive.copy(source.label, member.label):
+                    linked += 1
+                continue
+            targets = [(f'{repeats.batch_path}/{folder}/{kind}-{source.label}.txt',
+                        f'{repeats.batch_path}/{folder}/{kind}-{member.label}.txt')
+                       for kind, folder in (('usrout', 'data'), ('tuvlog', 'log'))]
+            if not all(os.path.exists(src) for src, _ in targets):
+                # the first occurrence failed
+                continue
+            for src, dst in targets:
+                link_or_copy(src, dst)
+            batch.journal.record(member.flat, member.label, {**repeats.input_dict, **member.values},
+                                 targets[0][1], targets[1][1])
+            linked += 1
+    if batch.archive is not None:
+        batch.archive.close()
+    if linked:
+        print(f'..{linked} repeated points linked to the outputs of their first occurrence')
+
+# a point of a sweep with its time axis folded into TUV's nt grid
+CollapsedPoint = namedtuple('CollapsedPoint', ['flat', 'index', 'label', 'values', 'members'])
+
+def _collapse_point(point, full_sweep, time_axis):
+    position = [axis.name for axis in full_sweep.axes].index(time_axis)
+    times = full_sweep.axes[position].params['tstart']
+    members = []
+    for k in range(len(times)):
+        index = point.index[:position] + (k,) + point.index[position:]
+        members.append(full_sweep.point(full_sweep.flat_index(index)))
+    values = dict(point.values)
+    values.update(tstart=times[0], tstop=times[-1], nt=len(times))
+    label = [str(i) for i in point.index]
+    label.insert(position, 't')
+    return CollapsedPoint(members[0].flat, point.index, '-'.join(label), values, members)
+
+class TuvRunError(RuntimeError):
+
+    def __init__(self, kind, message):
+        super().__init__(kind, message)
+        self.kind = kind
+        self.message = message
+
+    def __str__(self):
+        return f'{self.kind}: {self.message}'
+
+def run_point(input_dict, output_filename, log_filename, workdir=None, timeout=None, usrinp=None):
+    # usrinp is the file rendered from input_dict ahead of time, if it was
+    import subprocess
+    if workdir is None:
+        workdir = tuv_path
+    usrinp_filename = os.path.join(workdir, 'INPUTS', 'usrinp')
+    usrout_filename, tuvlog_filename = workspace_outputs(workdir)
+
+    started = time.perf_counter()
+    if usrinp is None:
+        modifyInput(input_dict, usrinp_filename)
     else:
-        raise AttributeError('No iterable parameters specified')
-    
-    if iter_kvar_name:
-        iterable_k_mesh = input_dict[iter_kvar_name]
-        #kdim = input_dict[iter_kvar_name].size
-        flat_iterable_k_mesh = iterable_k_mesh.flatten()
-        iterable_vars_dict[iter_kvar_name] = flat_iterable_k_mesh
-
-    total_iterations = flat_i_index_mesh.size
-    for iteration in range(total_iterations):
-
-        i = flat_i_index_mesh[iteration]
-        file_iter_label = f'{i}'
-        if iterate_j:
-            j = flat_j_index_mesh[iteration]
-            file_iter_label = f'{i}-{j}'
-
-        output_filename = f'/data/keeling/a/sf20/d/TUV-V5.4/OUTPUT/{data_subdir}/data/usrout-{file_iter_label}.txt'
-        log_filename = f'/data/keeling/a/sf20/d/TUV-V5.4/OUTPUT/{data_subdir}/log/tuvlog-{file_iter_label}.txt'
-
-        for var in iterable_vars:
-            input_dict[var] = iterable_vars_dict[var][iteration]
-            #print(input_dict[var])
-        if any(np.isnan(input_dict[var]) for var in iterable_vars):
-            print(f'..{var}={input_dict[var]}, skipping iteration {iteration+1}')
+        with open(usrinp_filename, 'w') as outcsv:
+            outcsv.write(usrinp)
+
+    # outputs left over from an earlier run must never pass for this one
+    for filename in (usrout_filename, tuvlog_filename):
+        if os.path.exists(filename):
+            os.remove(filename)
+
+    rendered = time.perf_counter()
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    try:
+        result = subprocess.run(['./tuv'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                cwd=workdir, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise TuvRunError('timeout', f'no result after {timeout} s')
+    finished = time.perf_counter()
+    child_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    failure = classify_failure(result.returncode, result.stdout, usrout_filename, tuvlog_filename)
+    if failure is not None:
+        raise TuvRunError(*failure)
+
+    output_bytes = os.path.getsize(usrout_filename) + os.path.getsize(tuvlog_filename)
+    os.rename(usrout_filename, output_filename)
+    os.rename(tuvlog_filename, log_filename)
+
+    # how long each stage took, for batch_run(..., metrics=True)
+    return {'render_s': rendered - started,
+            'run_s': finished - rendered,
+            'move_s': time.perf_counter() - finished,
+            'user_s': child_usage.ru_utime - usage.ru_utime,
+            'sys_s': child_usage.ru_stime - usage.ru_stime,
+            'maxrss_kb': child_usage.ru_maxrss,
+            'output_bytes': output_bytes}
+
+# failures that rerunning the same inputs can't fix
+permanent_failures = ('runtime-error', 'tuv-error')
+
+# how TUV says it gave up: a message starting with ERROR (often after a
+# row of asterisks), gfortran's ERROR STOP, or a STOP with a message or a
+# nonzero code; STOP and STOP 0 are a normal end
+tuv_fatal = re.compile(r'^(\**\s*error\b|stop\s+(?!0+$)\S)', re.IGNORECASE)
+
+def classify_failure(returncode, console, usrout_filename, tuvlog_filename):
+    """
+    Look at a finished TUV process and return (kind, message) if it failed,
+    else None. console is what TUV printed to stdout and stderr. kind is one
+    of 'runtime-error' (a Fortran runtime error, e.g. for wavelengths below
+    205 nm), 'tuv-error' (TUV stopped on an input it rejects, see tuv_fatal),
+    'crash' (killed by a signal or non-zero exit) and 'no-output'. A line
+    that merely mentions an error, such as a "relative error" note, is not
+    a failure.
+    """
+    if isinstance(console, bytes):
+        console = console.decode(errors='replace')
+    lines = [line.strip() for line in (console or '').splitlines() if line.strip()]
+    last_line = lines[-1] if lines else ''
+    if 'Fortran runtime error' in (console or ''):
+        return 'runtime-error', last_line
+    if returncode < 0:
+        return 'crash', f'killed by signal {-returncode}'
+    if os.path.exists(tuvlog_filename):
+        with open(tuvlog_filename, errors='replace') as tuvlog:
+            lines.extend(line.strip() for line in tuvlog)
+    for line in lines:
+        if tuv_fatal.match(line):
+            return 'tuv-error', line
+    if returncode != 0:
+        return 'crash', last_line or f'exit status {returncode}'
+    if not os.path.exists(usrout_filename) or not os.path.exists(tuvlog_filename):
+        return 'no-output', 'TUV exited without writing usrout.txt and tuvlog.txt'
+    return None
+
+def _fail_run(run, error, batch):
+    print(f'..iteration {run.iteration+1} failed ({error})')
+    members = run.members if run.members is not None else [run]
+    for member in members:
+        batch.journal.record_failure(member.iteration, member.label, member.inputs, error.kind, error.message)
+    if batch.metrics is not None:
+        batch.metrics.record(run, 'failed', {'error': error.kind})
+
+def _stage(run, batch):
+    # with local scratch, TUV's outputs wait in the outbox until they are moved
+    if batch.workspaces is None:
+        return run
+    output_filename, log_filename = batch.workspaces.staged_outputs(run.label)
+    return run._replace(output_filename=output_filename, log_filename=log_filename)
+
+def _complete_run(run, batch, timings=None, staged=None):
+    started = time.perf_counter()
+    run_s = timings['run_s'] if timings else None
+    if staged is None or staged is run:
+        _finish_run(run, batch.cache, batch.journal, batch.store, batch.archive, run_s)
+    else:
+        _finish_run(staged, batch.cache, batch.journal, batch.store, batch.archive, run_s)
+        # store and archive batches have taken them in and removed them already
+        for src, dst in ((staged.output_filename, run.output_filename),
+                         (staged.log_filename, run.log_filename)):
+            if os.path.exists(src):
+                batch.mover.add(src, dst)
+    if batch.metrics is not None:
+        batch.metrics.record(run, 'ran', timings, finish_s=time.perf_counter() - started)
+    if batch.cost is not None and timings:
+        batch.cost.record(run.inputs, timings['run_s'])
+
+def _open_store(store_path, sweep, resume):
+    import numpy as np
+    from tuv_store import BatchStore
+    if resume and os.path.exists(store_path):
+        return BatchStore(store_path)
+    axes = []
+    fields = {}
+    for axis in sweep.axes:
+        # the coordinate of a zipped axis is its parameter of the same name,
+        # or else its first one; the others are kept alongside
+        coord = axis.name if axis.name in axis.params else next(iter(axis.params))
+        axes.append((axis.name, axis.params[coord]))
+        for param, values in axis.params.items():
+            if param != coord:
+                fields[param] = ((axis.name,), values)
+    for name, values in sweep.fields.items():
+        fields[name] = (tuple(axis.name for axis in sweep.axes), np.reshape(values, sweep.shape))
+    return BatchStore.create(store_path, axes, fields)
+
+def _is_finished(run, completed, store, archive=None):
+    if run.members is not None:
+        return all(_is_finished(member, completed, store, archive) for member in run.members)
+    record = completed.get(run.iteration)
+    if store is None and archive is None:
+        return is_complete(record, run.inputs, run.output_filename, run.log_filename)
+    # store and archive batches keep no text files to checksum
+    if record is None or record['inputs'] != formatInputs(run.inputs):
+        return False
+    return store.is_done(run.index) if store is not None else archive.has(run.label)
+
+def _finish_run(run, cache, journal, store, archive=None, run_s=None):
+    if cache is not None:
+        cache.store(run.cache_key, run.output_filename, run.log_filename)
+    if run.members is not None:
+        _split_run(run, journal, store, archive, run_s)
+        return
+    journal.record(run.iteration, run.label, run.inputs, run.output_filename, run.log_filename, run_s)
+    if archive is not None:
+        archive.add(run.label, run.output_filename, run.log_filename)
+    if store is not None:
+        from tuv_output import read_usrout
+        with open(run.log_filename) as tuvlog:
+            store.write(run.index, read_usrout(run.output_filename), tuvlog.read())
+        os.remove(run.output_filename)
+        os.remove(run.log_filename)
+
+def _split_run(run, journal, store, archive=None, run_s=None):
+    # hand each time of a collapsed run back to its own point of the sweep,
+    # each with its share of the time TUV took
+    from tuv_output import read_usrout, split_times, write_usrout
+    parts = split_times(read_usrout(run.output_filename), len(run.members))
+    if run_s is not None:
+        run_s /= len(run.members)
+    with open(run.log_filename) as tuvlog:
+        log_text = tuvlog.read()
+    for member, part in zip(run.members, parts):
+        if store is not None:
+            journal.record(member.iteration, member.label, member.inputs, run.output_filename, run.log_filename,
+                           run_s)
+            store.write(member.index, part, log_text)
             continue
+        write_usrout(part, member.output_filename)
+        link_or_copy(run.log_filename, member.log_filename)
+        journal.record(member.iteration, member.label, member.inputs, member.output_filename, member.log_filename,
+                       run_s)
+        if archive is not None:
+            archive.add(member.label, member.output_filename, member.log_filename)
+    if store is not None or archive is not None:
+        os.remove(run.output_filename)
+        os.remove(run.log_filename)
 
-        print(f'TUV Run: {iteration+1}/{total_iterations}'.center(20))
-        
-        modifyInput(input_dict)
-        
-        subprocess.run(['./tuv'], stdout=subprocess.PIPE)
-        os.rename('/data/keeling/a/sf20/d/usrout.txt', output_filename)
-        os.rename('/data/keeling/a/sf20/d/tuvlog.txt', log_filename)
+def _run_serial(batch, timeout=None, depth=2):
+    """
+    Run one TUV process at a time, as a pipeline of three stages. While TUV
+    runs point n on the main thread, one thread plans and renders the
+    usrinp of the points after it, and another ingests the outputs of the
+    points before it (journal checksums, store, cache, splitting collapsed
+    runs, moving them out of scratch). The queues between the stages hold
+    depth runs, so neither thread gets far ahead of TUV. Planning and
+    ingesting both write to the journal, so they take turns under one lock.
+    What the threads print is queued and printed by the main thread, whole
+    lines at a time.
+    """
+    from modify_usrinp import loadInputDeck
+    workdir = None if batch.workspaces is None else batch.workspaces.workspace(0)
+    rendered = queue.Queue(depth)
+    finished = queue.Queue(depth)
+    lock = threading.Lock()
+    # set when a stage fails, so that the others stop waiting on it
+    stop = threading.Event()
+    errors = []
 
-if __name__ == '__main__':
+    def put(stage_queue, item, waiting):
+        # block while the queue is full, but only as long as waiting() holds
+        while waiting():
+            try:
+                stage_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def get(stage_queue):
+        while not stop.is_set():
+            try:
+                return stage_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+
+    def render():
+        try:
+            runs = iter(batch.runs)
+            while not stop.is_set():
+                with lock:
+                    run = next(runs, None)
+                if run is None:
+                    break
+                put(rendered, (run, _stage(run, batch), loadInputDeck().render(run.inputs)), running)
+        except BaseException as error:
+            errors.append(error)
+            stop.set()
+        finally:
+            put(rendered, None, running)
+
+    def ingest():
+        while True:
+            item = finished.get()
+            if item is None:
+                return
+            run, staged, timings, error = item
+            try:
+                with lock:
+                    if error is not None:
+                        _fail_run(run, error, batch)
+                    else:
+                        _complete_run(run, batch, timings, staged)
+            except BaseException as exception:
+                errors.append(exception)
+                stop.set()
+                return
+
+    def running():
+        return not stop.is_set()
+
+    output = _MainThreadOutput(sys.stdout)
+    sys.stdout = output
+    renderer = threading.Thread(target=render, daemon=True)
+    ingester = threading.Thread(target=ingest, daemon=True)
+    renderer.start()
+    ingester.start()
+    try:
+        while True:
+            item = get(rendered)
+            output.drain()
+            if item is None:
+                break
+            run, staged, usrinp = item
+            print(f'TUV Run: {run.iteration+1}/{batch.total_iterations}'.center(20))
+            try:
+                timings = run_point(run.inputs, staged.output_filename, staged.log_filename,
+                                    workdir=workdir, timeout=timeout, usrinp=usrinp)
+                error = None
+            except TuvRunError as run_error:
+                timings, error = None, run_error
+            # a run TUV has finished is ingested even if planning has failed since
+            put(finished, (run, staged, timings, error), ingester.is_alive)
+    finally:
+        stop.set()
+        renderer.join()
+        if ingester.is_alive():
+            finished.put(None)
+            ingester.join()
+        sys.stdout = output.stream
+        output.drain()
+    if errors:
+        raise errors[0]
+
+class _MainThreadOutput:
+    """
+    Stands in for sys.stdout while _run_serial's threads run: the main
+    thread writes through, other threads' lines wait in a queue until the
+    main thread drain()s it.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.main = threading.current_thread()
+        self.lines = queue.SimpleQueue()
+        self.partial = threading.local()
+
+    def write(self, text):
+        if threading.current_thread() is self.main:
+            return self.stream.write(text)
+        # print() writes the text and its newline separately
+        lines, newline, self.partial.text = (getattr(self.partial, 'text', '') + text).rpartition('\n')
+        if newline:
+            self.lines.put(lines + newline)
+        return len(text)
 
-    # ITERABLE PARAMETERS
-    # -------------------
-    lat_spacing = 1#5
-    lat_min = -89.5 #-90
-    lat_max = 89.5 #90
-    month_start = 1
-    month_end = 12
-    month_spacing = 1
-    lat_range = np.arange(lat_min, lat_max + 1, lat_spacing)
-    imonth_range = np.arange(month_start, month_end + 1, month_spacing)
-
-    # Get seasonal TOC trend
-    data_path = '/data/keeling/a/sf20/d/TUV-V5.4/omi-data/processed-seasonal-cycle/2005/'
-    filename = 'omi_TOC_monthly-longavg_2005.csv'
-    seasonal_TOC_trend = np.array(pd.read_csv(data_path + filename, index_col=0))
-
-    # lower the latitude resolution of TOC to be 5 degrees instead of 1 for comp. effic.
-    lat_range = lat_range[5::5] # sets the range to -84.5 to 85.5
-    seasonal_TOC_trend = seasonal_TOC_trend[5::5]
-
-    batch_run(data_subdir='general-iter-test-2',
-        #data_subdir='seasonal-toc-2005-latres5deg',
-        # CONSTANT PARAMETERS 
-        iday = 1, 
-        tstart = 12.0,
-        tstop = 12.01,
-        nt = 1,
-        wstart = 205.0, # Shortest wavelength I can go without getting runtime error
-        wstop = 420.0,
-        nwint = -156, #215, # for wavelengths lower than 205
-        tauaer = 0,
-        ssaaer = 0,
-        alpha = 0,
-        # ITERABLE PARAMETERS (assigned subsequently looping over values)
-        iterable_i = 'imonth',
-        #iterable_j = 'lat',
-        #iterable_k = 'o3col',
-        imonth = imonth_range,
-        #lat = lat_range, 
-        #o3col = seasonal_TOC_trend, 
-        )
-
-
-    
\ No newline at end of file
+    def flush(self):
+        if threading.current_thread() is self.main:
+            self.stream.flush()
+
+    def drain(self):
+        while True:
+            try:
+                self.stream.write(self.lines.get_nowait())
+            except queue.Empty:
+                return
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+def _run_parallel(batch, workers, scratch_root=None, timeout=None):
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+    if scratch_root is None:
+        scratch_root = f'{tuv_path}/WORKSPACES'
+
+    # one workspace per worker process; each process claims one at start-up
+    if batch.workspaces is not None:
+        workdirs = [batch.workspaces.workspace(n) for n in range(workers)]
+    else:
+        root = batch_root(scratch_root)
+        workdirs = [create_workspace(tuv_path, root, n) for n in range(workers)]
+    workdir_queue = multiprocessing.Queue()
+    for workdir in workdirs:
+        workdir_queue.put(workdir)
+    import modify_usrinp
+    paths = (tuv_path, modify_usrinp.reference_filepath, modify_usrinp.outfile)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, 
+                                 initializer=_init_worker,
+                                 initargs=(workdir_queue, paths)) as pool:
+            # keep a few runs queued per worker rather than submitting the
+            # whole sweep up front
+            futures = {}
+            done = 0
+            for run in itertools.chain(batch.runs, [None]):
+                if run is not None:
+                    staged = _stage(run, batch)
+                    future = pool.submit(_run_worker_point, run.inputs, staged.output_filename,
+                                         staged.log_filename, timeout)
+                    futures[future] = run
+                    if len(futures) < 4 * workers:
+                        continue
+                while futures and (run is None or len(futures) >= 4 * workers):
+                    finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        finished_run = futures.pop(future)
+                        done += 1
+                        try:
+                            timings = future.result()
+                        except TuvRunError as error:
+                            _fail_run(finished_run, error, batch)
+                            continue
+                        _complete_run(finished_run, batch, timings, _stage(finished_run, batch))
+                        print(f'TUV Run: {finished_run.iteration+1}/{batch.total_iterations} ({done} done)'.center(20))
+    finally:
+        if batch.workspaces is None:
+            shutil.rmtree(root, ignore_errors=True)
+
+_worker_workdir = None
+
+def _init_worker(workdir_queue, paths):
+    global _worker_workdir, tuv_path
+    import modify_usrinp
+    _worker_workdir = workdir_queue.get()
+    # a worker started with spawn or forkserver has none of the parent's
+    # settings, and a forked one only those of when the pool was made
+    tuv_path, modify_usrinp.reference_filepath, modify_usrinp.outfile = paths
+
+def _run_worker_point(input_dict, output_filename, log_filename, timeout=None):
+    return run_point(input_dict, output_filename, log_filename, workdir=_worker_workdir, timeout=timeout)
+
+def main(argv=None):
+    """
+    Command line for a batch described in a spec file (see tuv_spec.py), for
+    batches spread over several nodes through a queue directory on shared
+    storage (see tuv_queue.py), and for the index of runs (see tuv_index.py).
+    """
+    import argparse
+    from tuv_spec import load_spec
+    parser = argparse.ArgumentParser(prog='run_tuv_batch.py')
+    parser.add_argument('--tuv-path', help=f'TUV installation to run (default {tuv_path})')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='run the batch a spec file describes')
+    run.add_argument('spec', help='TOML or JSON file of batch_run arguments, including data_subdir')
+    run.add_argument('--dry-run', action='store_true', help='print the plan instead of running it')
+    run.add_argument('--check', action='store_true',
+                     help='with --dry-run, also check every point and predict the runtime (imports NumPy)')
+    run.add_argument('--shard', type=_parse_shard,
+                     help='K/N: run only the K-th (from 0) of N pieces of the sweep')
+    run.add_argument('--resume', action='store_true', help='pick up the batch where it stopped')
+
+    plan = commands.add_parser('plan', help='write a sweep to a queue directory')
+    plan.add_argument('queue')
+    plan.add_argument('spec', help='TOML or JSON file of batch_run arguments, including data_subdir')
+    plan.add_argument('--chunk-size', type=int, default=100)
+
+    worker = commands.add_parser('worker', help='run chunks of a queue until none are left')
+    worker.add_argument('queue')
+    worker.add_argument('--id', help='worker name (default host-pid)')
+    worker.add_argument('--workers', type=int, help="TUV processes on this node (default the plan's, or 1)")
+    worker.add_argument('--local-scratch', help='directory for workspaces (default /dev/shm)')
+    worker.add_argument('--cache')
+    worker.add_argument('--timeout', type=float)
+    worker.add_argument('--metrics', action='store_true', default=None)
+    worker.add_argument('--heartbeat', type=float, default=30.0)
+    worker.add_argument('--lease-timeout', type=float, default=300.0)
+    worker.add_argument('--no-wait', action='store_true',
+                        help="stop when every chunk is taken instead of waiting to take over a crashed worker's")
+
+    merge = commands.add_parser('merge', help='collect the chunks into OUTPUT/{data_subdir}')
+    merge.add_argument('queue')
+    merge.add_argument('--data-subdir')
+    merge.add_argument('--partial', action='store_true', help='merge the finished chunks only')
+
+    index = commands.add_parser('index', help='add every batch under OUTPUT, or the given ones, to the run index')
+    index.add_argument('batches', nargs='*', help='batch directories (default every one under OUTPUT)')
+    index.add_argument('--db', help='index file (default OUTPUT/index.sqlite)')
+    index.add_argument('--workers', type=int, help='batches read at once (default one per CPU)')
+
+    find = commands.add_parser('find', help='list the indexed runs an SQL condition matches')
+    find.add_argument('where', help='e.g. "lat BETWEEN 30 AND 60 AND imonth = 6"')
+    find.add_argument('--db', help='index file (default OUTPUT/index.sqlite)')
+    find.add_argument('--limit', type=int)
+
+    args = parser.parse_args(argv)
+    spec = load_spec(args.spec) if args.command in ('run', 'plan') else {}
+    # --tuv-path wins over the spec's
+    if args.tuv_path or spec.get('tuv_path'):
+        _use_tuv_path(args.tuv_path or spec['tuv_path'])
+    spec.pop('tuv_path', None)
+    if args.command in ('index', 'find'):
+        _index_command(args)
+        return
+    if args.command == 'run':
+        if args.shard:
+            spec['shard'] = args.shard
+        if args.resume:
+            spec['resume'] = True
+        if args.dry_run and not args.check:
+            _print_plan(**spec)
+        else:
+            batch_run(dry_run=args.dry_run, **spec)
+        return
+    import tuv_queue
+    if args.command == 'plan':
+        tuv_queue.plan_queue(args.queue, chunk_size=args.chunk_size, **spec)
+    elif args.command == 'worker':
+        tuv_queue.work(args.queue, args.id, args.workers, args.local_scratch, args.cache,
+                       args.timeout, args.metrics, args.heartbeat, args.lease_timeout,
+                       wait=not args.no_wait, tuv_path=args.tuv_path)
+    else:
+        tuv_queue.merge(args.queue, args.data_subdir, args.partial, tuv_path=args.tuv_path)
+
+def _index_command(args):
+    from tuv_index import RunIndex
+    with RunIndex(args.db) as run_index:
+        if args.command == 'index':
+            if not args.batches:
+                run_index.backfill(workers=args.workers)
+            for batch_path in args.batches:
+                run_index.update(batch_path)
+            return
+        started = time.perf_counter()
+        runs = run_index.find(args.where, limit=args.limit)
+        for run in runs:
+            print(f"{run['batch']}\t{run['label']}\t{run['usrout']}")
+        print(f'..{len(runs)} runs in {1000*(time.perf_counter() - started):.1f} ms')
+
+def _parse_shard(text):
+    from argparse import ArgumentTypeError
+    try:
+        shard, n_shards = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise ArgumentTypeError(f'expected K/N, e.g. 3/100, not "{text}"')
+    if not 0 <= shard < n_shards:
+        raise ArgumentTypeError(f'K of {text} counts from 0 to N-1')
+    return shard, n_shards
+
+def _print_plan(data_subdir, workers=1, output='text', sweep=None, shard=None, collapse_time=False,
+                want=None, **kwargs):
+    """What batch_run(data_subdir, ...) would run, worked out without NumPy."""
+    options = batch_run.__code__.co_varnames[:batch_run.__code__.co_argcount]
+    constants = {name: value for name, value in kwargs.items() if name not in options}
+    input_dict, sweep, planned, time_axis = _plan_sweep(sweep, collapse_time, want, dict(constants))
+    print(f'batch    {os.path.join(tuv_path, "OUTPUT", data_subdir)} ({output} output, {workers} workers)')
+    for n, axis in enumerate(sweep.axes):
+        ranges = ', '.join(f'{param} {values[0]} .. {values[-1]}' if len(values) > 1 else f'{param} {values[0]}'
+                           for param, values in axis.params.items())
+        print(f'{"axes" if n == 0 else "":<8} {axis.name} ({axis.size}): {ranges}')
+    if sweep.fields:
+        print(f'fields   {", ".join(sweep.fields)}')
+    inputs = {name: value for name, value in constants.items()
+              if name not in sweep.params and not name.startswith('iterable_')}
+    if inputs:
+        print(f'inputs   {" ".join(f"{name}={value}" for name, value in inputs.items())}')
+    if want is not None:
+        print(f'want     {", ".join([want] if isinstance(want, str) else want)}')
+    print(f'points   {len(sweep)} ({" x ".join(str(size) for size in sweep.shape)})')
+    if time_axis is not None:
+        print(f'runs     {len(planned)}, each covering the {time_axis} axis')
+    if shard is not None:
+        start, stop = shard[0] * len(planned) // shard[1], (shard[0] + 1) * len(planned) // shard[1]
+        print(f'shard    {shard[0]}/{shard[1]}: runs {start} to {stop - 1}')
+
+def _use_tuv_path(path):
+    global tuv_path
+    import modify_usrinp
+    tuv_path = os.path.abspath(path)
+    modify_usrinp.reference_filepath = os.path.join(tuv_path, 'INPUTS', 'usrinp_backup')
+    modify_usrinp.outfile = os.path.join(tuv_path, 'INPUTS', 'usrinp')
+
+if __name__ == '__main__':
+    # run as the imported module, whose tuv_path the other modules see
+    import run_tuv_batch
+    run_tuv_batch.main()
@@ -0,0 +1,25 @@
+import os
+import sys
+import shutil
+import pytest
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the modules live at the top of the repository
+sys.path.insert(0, repo_dir)
+
+@pytest.fixture
+def tuv_tree(tmp_path, monkeypatch):
+    """A throwaway TUV tree whose ./tuv is the benchmarks' stub, made the one batch_run uses."""
+    import run_tuv_batch
+    import modify_usrinp
+    tree = tmp_path / 'TUV-V5.4'
+    for name in ('INPUTS', 'DATAE1', 'DATAJ1', 'DATAS1'):
+        os.makedirs(tree / name)
+    shutil.copy(os.path.join(repo_dir, 'benchmarks', 'usrinp_backup'), tree / 'INPUTS' / 'usrinp_backup')
+    shutil.copy(os.path.join(repo_dir, 'benchmarks', 'stub_tuv.py'), tree / 'tuv')
+    os.chmod(tree / 'tuv', 0o755)
+    monkeypatch.setattr(run_tuv_batch, 'tuv_path', str(tree))
+    monkeypatch.setattr(modify_usrinp, 'reference_filepath', str(tree / 'INPUTS' / 'usrinp_backup'))
+    monkeypatch.setattr(modify_usrinp, 'outfile', str(tree / 'INPUTS' / 'usrinp'))
+    return tree
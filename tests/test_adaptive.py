@@ -0,0 +1,40 @@
+import os
+import numpy as np
+import pytest
+from tuv_adaptive import batch_run_adaptive
+
+def stub_rate(o3col):
+    # the stub's second dose rate falls off as 1/o3col
+    return 0.3 * 300 / o3col
+
+def test_refines_where_the_output_bends(tuv_tree, capsys):
+    result = batch_run_adaptive('adaptive', ('dose_rates', 'spectrum 2'), tol=2e-3,
+                                min_spacing={'o3col': 5.0},
+                                iterable_i='lat', lat=[0.0, 30.0],
+                                iterable_j='o3col', o3col=[200.0, 600.0], nt=1)
+    assert list(result['axes']) == ['lat', 'o3col']
+    assert result['converged'].all()
+    assert np.all(result['box_error'] <= 2e-3)
+    points = result['points']
+    np.testing.assert_allclose(result['values'][:, 0], stub_rate(points[:, 1]), rtol=1e-3)
+    # the response is flat in lat, so only o3col is split, most where it bends
+    assert sorted(set(points[:, 0])) == [0.0, 15.0, 30.0]
+    o3col = np.unique(points[:, 1])
+    assert np.sum(o3col < 400) > np.sum(o3col > 400)
+    assert os.path.exists(tuv_tree / 'OUTPUT' / 'adaptive' / 'adaptive.npz')
+    assert os.path.exists(tuv_tree / 'OUTPUT' / 'adaptive' / 'round-1')
+
+def test_stops_at_min_spacing(tuv_tree):
+    result = batch_run_adaptive('coarse', ('dose_rates', 1), tol=0.0,
+                                min_spacing={'o3col': 100.0},
+                                iterable_i='o3col', o3col=[200.0, 600.0], nt=1)
+    assert not result['converged'].any()
+    # no box is split below min_spacing, so the narrowest are 100 wide
+    np.testing.assert_array_equal(result['box_hi'] - result['box_lo'], [[100.0]] * 4)
+
+@pytest.mark.parametrize('option', [{'output': 'store'}, {'collapse_time': True},
+                                    {'iterable_k_field': True}])
+def test_refused_options(tuv_tree, option):
+    with pytest.raises(ValueError):
+        batch_run_adaptive('refused', ('dose_rates', 1), tol=1e-3,
+                           iterable_i='o3col', o3col=[200.0, 600.0], nt=1, **option)
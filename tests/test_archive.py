@@ -0,0 +1,53 @@
+import os
+import filecmp
+import tuv_archive
+from run_tuv_batch import batch_run
+from tuv_archive import BatchArchive
+
+params = dict(iterable_i='lat', lat=[0.0, 10.0, 20.0], nt=1)
+
+def test_round_trip(tuv_tree):
+    batch_run('text', **params)
+    batch_run('zipped', output='archive', **params)
+    batch_path = tuv_tree / 'OUTPUT' / 'zipped'
+    # runs pass through data/ and log/ on their way into the archive
+    assert os.listdir(batch_path / 'data') == os.listdir(batch_path / 'log') == []
+    archive = BatchArchive(str(batch_path / 'archive'))
+    assert sorted(archive.labels()) == ['0', '1', '2']
+    with open(tuv_tree / 'OUTPUT' / 'text' / 'data' / 'usrout-1.txt') as f:
+        assert archive.read('usrout', '1') == f.read()
+    assert archive.read_usrout('1', kinds=('irradiance',)).irradiance.values.shape == (140, 1)
+
+    archive.extract_all(str(batch_path))
+    archive.close()
+    for folder, kind in (('data', 'usrout'), ('log', 'tuvlog')):
+        for label in '012':
+            name = f'{kind}-{label}.txt'
+            assert filecmp.cmp(tuv_tree / 'OUTPUT' / 'text' / folder / name, batch_path / folder / name,
+                               shallow=False)
+
+def test_resume(tuv_tree):
+    batch_run('zipped', output='archive', iterable_i='lat', lat=[0.0, 10.0], nt=1)
+    batch_run('zipped', output='archive', resume=True, **params)
+    archive = BatchArchive(str(tuv_tree / 'OUTPUT' / 'zipped' / 'archive'))
+    assert sorted(archive.labels()) == ['0', '1', '2']
+    # the resumed batch only archived the run it hadn't done
+    assert len(os.listdir(tuv_tree / 'OUTPUT' / 'zipped' / 'archive')) == 2
+
+def test_parts_and_copy(tmp_path, monkeypatch):
+    monkeypatch.setattr(tuv_archive, 'compression', 'lzma')
+    path = str(tmp_path / 'archive')
+    with BatchArchive(path, chunk_size=2) as archive:
+        for label in 'abc':
+            (tmp_path / 'usrout.txt').write_text(f'usrout {label}')
+            (tmp_path / 'tuvlog.txt').write_text(f'tuvlog {label}')
+            archive.add(label, str(tmp_path / 'usrout.txt'), str(tmp_path / 'tuvlog.txt'))
+        assert not os.path.exists(tmp_path / 'usrout.txt')
+        # a full part is renamed into place, the open one is not yet readable
+        assert [name.endswith('.zip') for name in sorted(os.listdir(path))] == [True, False]
+        assert archive.has('b') and not archive.has('c')
+        assert archive.copy('a', 'd')
+        assert not archive.copy('e', 'f')
+    reopened = BatchArchive(path)
+    assert sorted(reopened.labels('tuvlog')) == ['a', 'b', 'c', 'd']
+    assert reopened.read('usrout', 'd') == 'usrout a'
@@ -0,0 +1,68 @@
+import os
+import json
+import asyncio
+import pytest
+from run_tuv_batch import batch_run, classify_failure
+from tuv_async import batch_run_async
+
+# a ./tuv that trips on the second latitude and runs the stub otherwise
+failing_tuv = """#!/usr/bin/env python3
+import os, sys
+with open(os.path.join('INPUTS', 'usrinp')) as usrinp:
+    if 'lat =         10.000' in usrinp.read():
+        print('At line 12 of file swchem.f')
+        print('Fortran runtime error: Index 0 of dimension 1 of array below lower bound of 1')
+        sys.exit(2)
+os.execv(sys.executable, [sys.executable, 'stub.py'])
+"""
+
+def journal_records(tuv_tree, data_subdir):
+    with open(tuv_tree / 'OUTPUT' / data_subdir / 'journal.jsonl') as f:
+        return [json.loads(line) for line in f]
+
+@pytest.mark.parametrize('returncode, console, outputs, expected', [
+    (2, 'Fortran runtime error: Index 0 below lower bound', True, 'runtime-error'),
+    (0, ' ****** ERROR in input: nt must be positive', True, 'tuv-error'),
+    (0, ' STOP 3', True, 'tuv-error'),
+    (0, ' STOP 0', True, None),
+    (0, ' relative error below 1%', True, None),
+    (-9, '', True, 'crash'),
+    (1, 'segmentation fault', True, 'crash'),
+    (0, '', False, 'no-output'),
+])
+def test_classify_failure(tmp_path, returncode, console, outputs, expected):
+    usrout, tuvlog = tmp_path / 'usrout.txt', tmp_path / 'tuvlog.txt'
+    if outputs:
+        usrout.write_text('')
+        tuvlog.write_text('')
+    failure = classify_failure(returncode, console, str(usrout), str(tuvlog))
+    assert (failure and failure[0]) == expected
+
+def test_same_outputs_as_batch_run(tuv_tree):
+    params = dict(iterable_i='lat', lat=[0.0, 10.0, 20.0], nt=1)
+    batch_run('serial', **params)
+    asyncio.run(batch_run_async('async', concurrency=2, timeout=60, **params))
+    for label in ('0', '1', '2'):
+        with open(tuv_tree / 'OUTPUT' / 'serial' / 'data' / f'usrout-{label}.txt') as f:
+            expected = f.read()
+        with open(tuv_tree / 'OUTPUT' / 'async' / 'data' / f'usrout-{label}.txt') as f:
+            assert f.read() == expected
+
+def test_runtime_error_is_not_retried(tuv_tree, capsys):
+    os.rename(tuv_tree / 'tuv', tuv_tree / 'stub.py')
+    (tuv_tree / 'tuv').write_text(failing_tuv)
+    os.chmod(tuv_tree / 'tuv', 0o755)
+    asyncio.run(batch_run_async('failing', concurrency=1, retries=2, backoff=0,
+                                iterable_i='lat', lat=[0.0, 10.0, 20.0], nt=1))
+    assert 'retrying' not in capsys.readouterr().out
+    records = journal_records(tuv_tree, 'failing')
+    assert [(record['label'], record.get('kind')) for record in records] == \
+        [('0', None), ('1', 'runtime-error'), ('2', None)]
+
+def test_timeout_is_retried(tuv_tree, monkeypatch, capsys):
+    monkeypatch.setenv('TUV_STUB_SLEEP', '30')
+    asyncio.run(batch_run_async('slow', concurrency=1, timeout=0.5, retries=1, backoff=0,
+                                iterable_i='lat', lat=[0.0], nt=1))
+    assert capsys.readouterr().out.count('retrying') == 1
+    records = journal_records(tuv_tree, 'slow')
+    assert [record.get('kind') for record in records] == ['timeout']
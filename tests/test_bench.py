@@ -0,0 +1,43 @@
+import os
+import sys
+import json
+from conftest import repo_dir
+
+sys.path.insert(0, os.path.join(repo_dir, 'benchmarks'))
+import bench_batch
+
+def test_case_sweep():
+    for dims, size in ((1, 10), (2, 100), (3, 1000), (3, 10)):
+        sweep = bench_batch.case_sweep(dims, size)
+        assert len(sweep) == size
+        assert len(sweep.shape) == dims
+
+def test_compare():
+    baseline = {'1d-10-serial': {'runs_per_s': 100.0, 'peak_mb': 40.0}}
+    assert bench_batch.compare({'1d-10-serial': {'runs_per_s': 80.0, 'peak_mb': 45.0}}, baseline, 0.25) == []
+    assert len(bench_batch.compare({'1d-10-serial': {'runs_per_s': 70.0, 'peak_mb': 60.0}}, baseline, 0.25)) == 2
+    # cases without a baseline are not judged
+    assert bench_batch.compare({'2d-10-serial': {'runs_per_s': 1.0, 'peak_mb': 1e3}}, baseline, 0.25) == []
+
+def test_baseline_stays_on_its_machine(tmp_path, capsys):
+    baseline = str(tmp_path / 'baseline.json')
+    argv = ['--dims', '1', '--sizes', '10', '--modes', 'serial', '--baseline', baseline]
+    # the first run is the baseline, a later one is compared with it
+    assert bench_batch.main(argv) == 0
+    with open(baseline) as f:
+        saved = json.load(f)
+    assert list(saved['cases']) == ['1d-10-serial']
+    assert bench_batch.same_machine(saved['meta'])
+    assert bench_batch.main(argv + ['--tolerance', '100']) == 0
+
+    saved['meta']['host'] = 'elsewhere'
+    with open(baseline, 'w') as f:
+        json.dump(saved, f)
+    capsys.readouterr()
+    assert bench_batch.main(argv) == 2
+    assert capsys.readouterr().out.splitlines()[-1].startswith('ERROR')
+    assert bench_batch.main(argv + ['--no-compare']) == 0
+    # saving here drops the other machine's cases
+    assert bench_batch.main(argv + ['--save-baseline']) == 0
+    with open(baseline) as f:
+        assert bench_batch.same_machine(json.load(f)['meta'])
@@ -0,0 +1,54 @@
+import os
+from run_tuv_batch import batch_run
+from tuv_cache import ResultCache, inputs_key
+
+def cached_o3col(cache_root):
+    # the o3col each cache entry's usrout echoes
+    found = []
+    for dirpath, _, filenames in os.walk(cache_root):
+        if 'usrout.txt' in filenames:
+            with open(os.path.join(dirpath, 'usrout.txt')) as f:
+                found.append(next(line.split('o3col =')[1].split()[0] for line in f if 'o3col =' in line))
+    return sorted(found)
+
+def test_hit_and_miss(tuv_tree, tmp_path):
+    cache = str(tmp_path / 'cache')
+    batch_run('a', cache=cache, iterable_i='lat', lat=[0.0, 10.0], nt=1)
+    results = ResultCache(cache)
+    assert results.stats()['entries'] == 2
+    # 10.0001 is written to usrinp as 10.000, so it is the same run
+    batch_run('b', cache=results, iterable_i='lat', lat=[10.0001, 20.0], nt=1)
+    assert (results.hits, results.misses) == (1, 1)
+    for label in ('0', '1'):
+        assert os.path.exists(tuv_tree / 'OUTPUT' / 'b' / 'data' / f'usrout-{label}.txt')
+
+def test_fetch_leaves_other_entries_alone(tuv_tree, tmp_path):
+    cache = str(tmp_path / 'cache')
+    batch_run('x', cache=cache, iterable_i='lat', lat=[0.0], o3col=300.0, nt=1)
+    batch_run('y', cache=cache, iterable_i='lat', lat=[0.0], o3col=350.0, nt=1)
+    # x's usrout is a hardlink to the o3col=300 entry; fetching the o3col=350
+    # entry over it must not rewrite that entry
+    batch_run('x', cache=cache, resume=True, iterable_i='lat', lat=[0.0], o3col=350.0, nt=1)
+    assert cached_o3col(cache) == ['300.000', '350.000']
+    with open(tuv_tree / 'OUTPUT' / 'x' / 'data' / 'usrout-0.txt') as f:
+        assert 'o3col =      350.000' in f.read()
+
+def test_inputs_key():
+    assert inputs_key({'lat': 10.0, 'nt': 1}) == inputs_key({'lat': 10.0001, 'nt': 1.0})
+    assert inputs_key({'lat': 10.0}) != inputs_key({'lat': 10.0}, 'another tuv')
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=250)
+    (tmp_path / 'usrout.txt').write_text('x' * 100)
+    (tmp_path / 'tuvlog.txt').write_text('')
+    got = (str(tmp_path / 'got.txt'), str(tmp_path / 'got.log'))
+    a, b, c = 'a' * 64, 'b' * 64, 'c' * 64
+    cache.store(a, str(tmp_path / 'usrout.txt'), str(tmp_path / 'tuvlog.txt'))
+    cache.store(b, str(tmp_path / 'usrout.txt'), str(tmp_path / 'tuvlog.txt'))
+    assert cache.fetch(a, *got)
+    cache.store(c, str(tmp_path / 'usrout.txt'), str(tmp_path / 'tuvlog.txt'))
+    # a was used after b was stored, so b goes first
+    assert cache.evictions == 1
+    assert not cache.fetch(b, *got)
+    assert cache.fetch(a, *got)
+    assert cache.fetch(c, *got)
@@ -0,0 +1,71 @@
+import json
+import pytest
+from run_tuv_batch import batch_run
+from tuv_cost import CostModel, features, describe
+
+base = {'nt': 1, 'nz': 10, 'nwint': 100, 'nstr': -2, 'ljvals': False}
+
+def seconds(inputs):
+    nt, _, work, streams_work, jvals_work = features(inputs)
+    return 0.05 + 0.01 * nt + 1e-5 * work + 2e-6 * streams_work + 3e-5 * jvals_work
+
+def record_grid(model):
+    for nt in (1, 5, 10):
+        for nz in (10, 50):
+            for nstr, ljvals in ((-2, False), (8, False), (-2, True)):
+                inputs = dict(base, nt=nt, nz=nz, nstr=nstr, ljvals=ljvals)
+                model.record(inputs, seconds(inputs))
+    model.close()
+
+def test_features():
+    assert features(base) == [1.0, 1, 1000, 1000, 0.0]
+    # integers from older records and TUV's standard wavelength grid
+    assert features(dict(base, nt='5.0', nwint=-156, nstr=4, ljvals='T')) == [1.0, 5, 7800, 31200, 7800]
+
+def test_fit(tmp_path):
+    model = CostModel(str(tmp_path / 'runtimes.jsonl'))
+    assert model.coef is None
+    assert model.predict(base) == 1000
+    record_grid(model)
+    model.fit()
+    assert model.n_records == 18
+    for inputs in (dict(base, nt=3, nz=30), dict(base, nt=7, nstr=8), dict(base, ljvals=True)):
+        assert model.predict(inputs) == pytest.approx(seconds(inputs))
+
+def test_few_records(tmp_path):
+    model = CostModel(str(tmp_path / 'runtimes.jsonl'))
+    model.record(base, 2.0)
+    model.record(dict(base, nt=3), 4.0)
+    model.close()
+    # one constant per unit of nt nz nw: 6 s over 4000
+    assert model.fit().predict(dict(base, nt=2)) == pytest.approx(3.0)
+
+def test_unreadable_records(tmp_path, capsys):
+    filepath = tmp_path / 'runtimes.jsonl'
+    filepath.write_text(json.dumps({'nt': 1}) + '\n{"nt": 1, "n\n' +
+                        json.dumps(dict(base, run_s=1.5)) + '\n')
+    model = CostModel(str(filepath))
+    assert model.n_records == 1
+    assert 'skipped 2 unreadable records' in capsys.readouterr().out
+
+def test_predict_batch(tmp_path):
+    model = CostModel(str(tmp_path / 'runtimes.jsonl'))
+    runs = [dict(base, nt=nt) for nt in (4, 3, 3, 2, 2)]
+    assert model.predict_batch(runs, 2)['wall_seconds'] is None
+    model.record(base, 1.0)
+    model.close()
+    prediction = model.fit().predict_batch(runs, workers=2)
+    # longest first, each run to the worker free first: 4 + 2 + 2 against 3 + 3
+    assert prediction['tuv_seconds'] == pytest.approx(14.0)
+    assert prediction['wall_seconds'] == pytest.approx(8.0)
+    assert describe(prediction).startswith('5 runs, 14.0 s of TUV time, 8.0 s wall time')
+
+def test_batch_records_and_dry_run(tuv_tree, capsys):
+    batch_run('timed', cost_model=True, iterable_i='nt', nt=[1, 2, 3])
+    with open(tuv_tree / 'OUTPUT' / 'runtimes.jsonl') as f:
+        records = [json.loads(line) for line in f]
+    assert [record['nt'] for record in records] == ['1', '2', '3']
+    prediction = batch_run('planned', dry_run=True, workers=2, iterable_i='nt', nt=[1, 2, 3, 4])
+    assert prediction['runs'] == 4
+    assert prediction['records'] == 3
+    assert not (tuv_tree / 'OUTPUT' / 'planned').exists()
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from run_tuv_batch import batch_run
+from tuv_emulator import Emulator
+from tuv_sweep import Sweep
+
+lat = np.array([-30.0, 0.0, 10.0, 40.0])
+o3col = np.array([250.0, 300.0, 400.0])
+
+def plane(x, y):
+    return 2*x + 3*y + 1
+
+def grid_emulator(method='linear'):
+    x, y = np.meshgrid(lat, o3col, indexing='ij')
+    return Emulator([('lat', lat), ('o3col', o3col)], plane(x, y), method=method)
+
+@pytest.mark.parametrize('method', ['linear', 'cubic'])
+def test_reproduces_a_plane(method):
+    emulator = grid_emulator(method)
+    x = np.array([-30.0, -12.5, 5.0, 39.0])
+    y = np.array([250.0, 260.0, 333.3, 400.0])
+    np.testing.assert_allclose(emulator(lat=x, o3col=y), plane(x, y))
+    # queries broadcast together
+    assert emulator(lat=x[:, None], o3col=y).shape == (4, 4)
+    assert np.all(emulator.error['max_abs'] < 1e-9)
+
+def test_outside_the_grid_is_nan():
+    result = grid_emulator()(lat=[0.0, -31.0, 41.0, np.nan], o3col=300.0)
+    assert not np.isnan(result[0])
+    assert np.isnan(result[1:]).all()
+
+def test_axes_are_sorted():
+    x, y = np.meshgrid(lat[::-1], o3col, indexing='ij')
+    emulator = Emulator([('lat', lat[::-1]), ('o3col', o3col)], plane(x, y))
+    assert emulator(lat=5.0, o3col=300.0) == pytest.approx(plane(5.0, 300.0))
+
+def test_invalid():
+    with pytest.raises(ValueError):
+        Emulator([('lat', [0.0, 0.0])], [1.0, 2.0])
+    with pytest.raises(ValueError):
+        Emulator([('lat', [0.0, 1.0, 2.0])], [1.0, 2.0])
+    with pytest.raises(ValueError):
+        Emulator([('lat', [0.0, 1.0])], [1.0, 2.0], method='nearest')
+    with pytest.raises(AttributeError):
+        grid_emulator()(lat=0.0)
+    with pytest.raises(AttributeError):
+        grid_emulator()(lat=0.0, o3col=300.0, alsurf=0.1)
+
+def test_save_and_load(tmp_path):
+    emulator = Emulator([('lat', lat)], np.outer(lat, [1.0, 2.0]), [('column', np.array(['a', 'b']))])
+    emulator.save(str(tmp_path / 'emulator.npz'))
+    loaded = Emulator.load(str(tmp_path / 'emulator.npz'))
+    assert loaded.names == ['lat']
+    assert list(loaded.tail[0][1]) == ['a', 'b']
+    np.testing.assert_array_equal(loaded(lat=[5.0, 20.0]), emulator(lat=[5.0, 20.0]))
+
+def test_from_store_and_outputs(tuv_tree):
+    params = dict(iterable_i='lat', lat=list(lat), iterable_j='o3col', o3col=list(o3col), nt=1)
+    batch_run('stored', output='store', **params)
+    batch_run('text', **params)
+    store = str(tuv_tree / 'OUTPUT' / 'stored' / 'store')
+    stored = Emulator.from_store(store, 'dose_rates', column='spectrum 2', time=12)
+    assert stored.names == ['lat', 'o3col']
+    assert stored(lat=10.0, o3col=300.0) == pytest.approx(0.3)
+
+    sweep = Sweep().product('lat', lat).product('o3col', o3col)
+    text = Emulator.from_outputs(str(tuv_tree / 'OUTPUT' / 'text' / 'data'), sweep, 'dose_rates')
+    assert text(lat=10.0, o3col=300.0)[0, 1] == pytest.approx(0.3)
+    # grid axes are interpolated, not selected
+    with pytest.raises(ValueError):
+        Emulator.from_store(store, 'dose_rates', lat=0.0)
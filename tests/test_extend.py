@@ -0,0 +1,69 @@
+import json
+import os
+from tuv_extend import extend_outputs, read_manifest
+from tuv_journal import RunJournal
+from tuv_sweep import Sweep
+
+def make_batch(batch, lats, o3col=300.0):
+    """A finished batch over lat, with each output holding its latitude."""
+    for folder in ('data', 'log'):
+        os.makedirs(batch / folder)
+    journal = RunJournal(batch / 'journal.jsonl')
+    for point in Sweep().product('lat', lats):
+        usrout = batch / 'data' / f'usrout-{point.label}.txt'
+        tuvlog = batch / 'log' / f'tuvlog-{point.label}.txt'
+        usrout.write_text(f'lat {point.values["lat"]}')
+        tuvlog.write_text('log')
+        journal.record(point.flat, point.label, {'lat': point.values['lat'], 'o3col': o3col},
+                       usrout, tuvlog)
+
+def test_relabel(tmp_path):
+    make_batch(tmp_path, [0.0, 10.0, 20.0])
+    sweep = Sweep().product('lat', [-10.0, 0.0, 5.0, 10.0])
+    assert extend_outputs(tmp_path, {'lat': None, 'o3col': 300.0}, sweep) == 2
+
+    # the kept runs are under their new labels, with nothing else in data/
+    assert sorted(os.listdir(tmp_path / 'data')) == ['usrout-1.txt', 'usrout-3.txt']
+    assert (tmp_path / 'data' / 'usrout-1.txt').read_text() == 'lat 0.0'
+    assert (tmp_path / 'data' / 'usrout-3.txt').read_text() == 'lat 10.0'
+    assert sorted(os.listdir(tmp_path / 'log')) == ['tuvlog-1.txt', 'tuvlog-3.txt']
+    records = RunJournal(tmp_path / 'journal.jsonl').completed()
+    assert {iteration: record['label'] for iteration, record in records.items()} == {1: '1', 3: '3'}
+
+    # lat 20 drops out along with the old journal
+    dropped = tmp_path / 'dropped' / '0'
+    assert os.listdir(dropped / 'data') == ['usrout-2.txt']
+    assert (dropped / 'data' / 'usrout-2.txt').read_text() == 'lat 20.0'
+    assert len((dropped / 'journal.jsonl').read_text().splitlines()) == 3
+
+    manifest = read_manifest(tmp_path)
+    assert manifest['generation'] == 1
+    assert Sweep.from_dict(manifest['sweep']).shape == (4,)
+    assert not os.path.exists(tmp_path / '.extend')
+
+def test_extend_twice(tmp_path):
+    make_batch(tmp_path, [0.0, 10.0])
+    extend_outputs(tmp_path, {'lat': None, 'o3col': 300.0}, Sweep().product('lat', [-10.0, 0.0, 10.0]))
+    assert extend_outputs(tmp_path, {'lat': None, 'o3col': 300.0},
+                          Sweep().product('lat', [10.0, 0.0])) == 2
+    assert (tmp_path / 'data' / 'usrout-0.txt').read_text() == 'lat 10.0'
+    assert (tmp_path / 'data' / 'usrout-1.txt').read_text() == 'lat 0.0'
+    assert read_manifest(tmp_path)['generation'] == 2
+
+def test_other_constants(tmp_path):
+    make_batch(tmp_path, [0.0, 10.0])
+    sweep = Sweep().product('lat', [0.0, 10.0])
+    assert extend_outputs(tmp_path, {'lat': None, 'o3col': 350.0}, sweep) == 0
+    assert os.listdir(tmp_path / 'data') == []
+    assert (tmp_path / 'journal.jsonl').read_text() == ''
+    assert sorted(os.listdir(tmp_path / 'dropped' / '0' / 'data')) == ['usrout-0.txt', 'usrout-1.txt']
+
+def test_stale_staging(tmp_path):
+    make_batch(tmp_path, [0.0, 10.0])
+    # left by a relabelling that never got as far as the manifest
+    os.makedirs(tmp_path / '.extend' / 'data')
+    (tmp_path / '.extend' / 'data' / 'usrout-5.txt').write_text('stale')
+    with open(tmp_path / '.extend' / 'generation.json', 'w') as f:
+        json.dump({'generation': 1, 'files': ['data/usrout-5.txt'], 'reused': []}, f)
+    assert extend_outputs(tmp_path, {'lat': None, 'o3col': 300.0}, Sweep().product('lat', [0.0, 10.0])) == 2
+    assert sorted(os.listdir(tmp_path / 'data')) == ['usrout-0.txt', 'usrout-1.txt']
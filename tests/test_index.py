@@ -0,0 +1,76 @@
+import os
+import json
+import pytest
+import run_tuv_batch
+from run_tuv_batch import batch_run
+from tuv_index import RunIndex, read_input_echo
+
+params = dict(iterable_i='lat', lat=[0.0, 10.0, 20.0], iterable_j='imonth', imonth=[3, 6], nt=1)
+
+def journal_inputs(batch_path):
+    with open(os.path.join(batch_path, 'journal.jsonl')) as f:
+        return {record['label']: record['inputs'] for record in map(json.loads, f)}
+
+def test_round_trip(tuv_tree):
+    batch_run('indexed', index=True, **params)
+    batch_path = str(tuv_tree / 'OUTPUT' / 'indexed')
+    with RunIndex() as index:
+        assert index.count() == 6
+        runs = index.find(lat=10.0001, imonth=6)
+        assert [(run['label'], run['output']) for run in runs] == [('1-1', 'text')]
+        run = runs[0]
+        assert run['usrout'] == os.path.join(batch_path, 'data', 'usrout-1-1.txt')
+        assert len(run['tuv_sha256']) == 64
+        assert run['run_s'] > 0
+        # the inputs come back as usrinp and the journal have them
+        assert run['inputs'] == journal_inputs(batch_path)['1-1']
+
+def test_conditions(tuv_tree, tmp_path):
+    batch_run('indexed', index=str(tmp_path / 'index.sqlite'), **params)
+    with RunIndex(str(tmp_path / 'index.sqlite')) as index:
+        assert index.count(lat=(5, 20)) == 4
+        assert index.count(lat=[0.0, 20.0], imonth=3) == 2
+        assert [run['label'] for run in index.find('lat > 5 AND imonth = 3')] == ['1-0', '2-0']
+        assert len(index.find(limit=4)) == 4
+        with pytest.raises(AttributeError):
+            index.find(latitude=10.0)
+
+def test_update_reads_new_runs_only(tuv_tree, tmp_path):
+    index_path = str(tmp_path / 'index.sqlite')
+    batch_run('indexed', index=index_path, iterable_i='lat', lat=[0.0, 10.0], nt=1)
+    with RunIndex(index_path) as index:
+        indexed = {run['label']: run['indexed'] for run in index.find()}
+    batch_run('indexed', index=index_path, resume=True, iterable_i='lat', lat=[0.0, 10.0, 20.0], nt=1)
+    with RunIndex(index_path) as index:
+        runs = {run['label']: run['indexed'] for run in index.find()}
+    assert sorted(runs) == ['0', '1', '2']
+    assert runs['0'] == indexed['0'] and runs['1'] == indexed['1']
+
+def test_failed_runs_are_dropped(tuv_tree, tmp_path):
+    index_path = str(tmp_path / 'index.sqlite')
+    batch_run('indexed', index=index_path, iterable_i='lat', lat=[0.0, 10.0], nt=1)
+    batch_path = tuv_tree / 'OUTPUT' / 'indexed'
+    with open(batch_path / 'journal.jsonl', 'a') as f:
+        f.write(json.dumps({'iteration': 1, 'label': '1', 'inputs': {}, 'status': 'failed',
+                            'kind': 'crash', 'message': 'killed by signal 9'}) + '\n')
+    with RunIndex(index_path) as index:
+        index.update(str(batch_path))
+        assert [run['label'] for run in index.find()] == ['0']
+
+def test_backfill_without_journal(tuv_tree):
+    batch_run('old', **params)
+    batch_path = tuv_tree / 'OUTPUT' / 'old'
+    os.remove(batch_path / 'journal.jsonl')
+    assert read_input_echo(str(batch_path / 'data' / 'usrout-2-1.txt'))['lat'] == '  20.000'
+    with RunIndex() as index:
+        assert index.backfill(workers=1) == 6
+        run = index.find(lat=20.0, imonth=6)[0]
+        assert (run['label'], run['iteration'], run['tuv_sha256']) == ('2-1', None, None)
+
+def test_find_command(tuv_tree, capsys):
+    batch_run('indexed', index=True, **params)
+    capsys.readouterr()
+    run_tuv_batch.main(['find', 'lat BETWEEN 5 AND 15 AND imonth = 6'])
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split('\t')[1] == '1-1'
+    assert lines[-1].startswith('..1 runs in')
@@ -0,0 +1,66 @@
+import json
+from tuv_journal import RunJournal, is_complete
+
+inputs = {'lat': 10.0, 'o3col': 300.0, 'nt': 1}
+
+def run(tmp_path, label, text='output'):
+    usrout = tmp_path / f'usrout-{label}.txt'
+    tuvlog = tmp_path / f'tuvlog-{label}.txt'
+    usrout.write_text(text)
+    tuvlog.write_text('log')
+    return usrout, tuvlog
+
+def test_completed(tmp_path):
+    journal = RunJournal(tmp_path / 'journal.jsonl')
+    assert journal.completed() == {}
+    journal.record(0, '0', inputs, *run(tmp_path, '0'), run_s=1.23456)
+    journal.record(1, '1', inputs, *run(tmp_path, '1'))
+    records = journal.completed()
+    assert sorted(records) == [0, 1]
+    assert records[0]['label'] == '0'
+    assert records[0]['run_s'] == 1.2346
+    assert 'run_s' not in records[1]
+
+def test_failure_undoes_success(tmp_path):
+    journal = RunJournal(tmp_path / 'journal.jsonl')
+    journal.record(0, '0', inputs, *run(tmp_path, '0'))
+    journal.record_failure(0, '0', inputs, 'crash', 'killed by signal 9')
+    journal.record_failure(1, '1', inputs, 'invalid', 'nt below 1')
+    assert journal.completed() == {}
+    assert journal.failures == 2
+    # the last record of an iteration wins
+    journal.record(0, '0', inputs, *run(tmp_path, '0'))
+    assert sorted(journal.completed()) == [0]
+
+def test_truncated_line(tmp_path):
+    filepath = tmp_path / 'journal.jsonl'
+    RunJournal(filepath).record(0, '0', inputs, *run(tmp_path, '0'))
+    with open(filepath, 'a') as f:
+        f.write('{"iteration": 1, "lab')
+    # a batch killed mid-write; the next one starts on a fresh line
+    journal = RunJournal(filepath)
+    journal.record(2, '2', inputs, *run(tmp_path, '2'))
+    assert sorted(journal.completed()) == [0, 2]
+    lines = filepath.read_text().splitlines()
+    assert json.loads(lines[-1])['iteration'] == 2
+
+def test_is_complete(tmp_path):
+    journal = RunJournal(tmp_path / 'journal.jsonl')
+    usrout, tuvlog = run(tmp_path, '0')
+    journal.record(0, '0', inputs, usrout, tuvlog)
+    record = journal.completed()[0]
+    assert is_complete(record, inputs, usrout, tuvlog)
+    # the same inputs once written to usrinp
+    assert is_complete(record, {'lat': 10.0001, 'o3col': 300, 'nt': 1.0}, usrout, tuvlog)
+    assert not is_complete(None, inputs, usrout, tuvlog)
+    assert not is_complete(record, {**inputs, 'lat': 20.0}, usrout, tuvlog)
+
+def test_is_complete_checks_outputs(tmp_path):
+    journal = RunJournal(tmp_path / 'journal.jsonl')
+    usrout, tuvlog = run(tmp_path, '0')
+    journal.record(0, '0', inputs, usrout, tuvlog)
+    record = journal.completed()[0]
+    usrout.write_text('changed')
+    assert not is_complete(record, inputs, usrout, tuvlog)
+    tuvlog.unlink()
+    assert not is_complete(record, inputs, usrout, tuvlog)
@@ -0,0 +1,38 @@
+import io
+import numpy as np
+from run_tuv_batch import batch_run
+from tuv_metrics import read_metrics, percentile, summarize
+
+def test_records(tuv_tree):
+    params = dict(metrics=True, iterable_i='lat', lat=[0.0, 10.0], nt=1)
+    batch_run('timed', **params)
+    filepath = str(tuv_tree / 'OUTPUT' / 'timed' / 'metrics.jsonl')
+    records = read_metrics(filepath)
+    assert [(record['label'], record['status']) for record in records] == [('0', 'ran'), ('1', 'ran')]
+    for record in records:
+        assert record['run_s'] > 0
+        assert record['output_bytes'] > 0
+        assert 'finish_s' in record
+    # a resumed batch writes down what it skipped
+    batch_run('timed', resume=True, **params)
+    assert [record['status'] for record in read_metrics(filepath)[2:]] == ['skipped', 'skipped']
+
+def test_truncated_line_is_skipped(tmp_path):
+    filepath = tmp_path / 'metrics.jsonl'
+    filepath.write_text('{"iteration": 0, "label": "0", "status": "ran"}\n{"iteration": 1, "lab')
+    assert len(read_metrics(str(filepath))) == 1
+
+def test_percentile():
+    values = [5.0, 1.0, 4.0, 2.0, 3.0, 10.0]
+    for q in (0, 25, 50, 95, 100):
+        assert percentile(values, q) == np.percentile(values, q)
+    assert np.isnan(percentile([], 50))
+
+def test_summarize(tuv_tree):
+    batch_run('timed', metrics=True, iterable_i='lat', lat=[0.0, 10.0], nt=1)
+    out = io.StringIO()
+    summarize(str(tuv_tree / 'OUTPUT' / 'timed' / 'metrics.jsonl'), out)
+    lines = out.getvalue().splitlines()
+    assert lines[0] == '2 ran'
+    assert any(line.split()[0] == 'run_s' for line in lines[1:])
+    assert lines[-1].startswith('2 runs in')
@@ -0,0 +1,107 @@
+import numpy as np
+from tuv_output import read_usrout, split_times, write_usrout
+
+usrout = """\
+ ==================================================================
+ lat =         40.000   lon =          0.000   tmzone =       0.000
+ iyear =         2002   imonth =           3   iday =            21
+ tstart =      12.000   tstop =       14.000   nt =               2
+ lirrad =           T   laflux =           F   lmmech =           F
+ ==================================================================
+
+ Weighted irradiances (W m-2), altitude (km) =    0.000
+  1 UV-B, 280-315 nm
+  2 UV-A, 315-400 nm
+ time, hrs.  sza, deg.          1          2
+    12.000    40.100  1.500E+00  3.000E+01
+    14.000    45.200  1.200E+00  2.500E+01
+
+ Spectral irradiance, W m-2 nm-1, at altitude (km) =    0.000
+ wl(lower)  wl(upper)          1          2
+   280.000   281.000  1.000E-03  8.000E-04
+   281.000   282.000  2.5-100   *********
+
+ Photolysis rate coefficients, s-1, at altitude (km) =    0.000
+  1 O3 -> O2 + O(1D)             1.234E-05  1.100E-05
+  2 NO2 -> NO + O(3P)            8.000E-03  *********
+"""
+
+def write(tmp_path, text=usrout):
+    filepath = tmp_path / 'usrout-0.txt'
+    filepath.write_text(text)
+    return filepath
+
+def test_input_echo(tmp_path):
+    output = read_usrout(write(tmp_path))
+    assert output.inputs['lat'] == '40.000'
+    assert output.inputs['nt'] == '2'
+    assert output.inputs['lirrad'] == 'T'
+
+def test_tables(tmp_path):
+    output = read_usrout(write(tmp_path))
+    assert [table.kind for table in output.tables] == ['dose_rates', 'irradiance', 'j_values']
+
+    dose_rates = output.dose_rates
+    assert dose_rates.names == ['UV-B, 280-315 nm', 'UV-A, 315-400 nm']
+    assert list(dose_rates.coords) == ['time', 'sza']
+    np.testing.assert_array_equal(dose_rates.coords['time'], [12.0, 14.0])
+    np.testing.assert_array_equal(dose_rates.values, [[1.5, 30.0], [1.2, 25.0]])
+
+    irradiance = output.irradiance
+    np.testing.assert_array_equal(irradiance.coords['wavelength'], [280.0, 281.0])
+    np.testing.assert_array_equal(irradiance.coords['wavelength_upper'], [281.0, 282.0])
+    assert irradiance.values.shape == (2, 2)
+
+    j_values = output.j_values
+    assert j_values.row_names == ['O3 -> O2 + O(1D)', 'NO2 -> NO + O(3P)']
+    np.testing.assert_array_equal(j_values.values, [[1.234e-05, 1.1e-05], [8e-03, np.nan]])
+
+def test_fortran_numbers(tmp_path):
+    values = read_usrout(write(tmp_path)).irradiance.values
+    # an exponent without E, and an overflowed field
+    assert values[1, 0] == 2.5e-100
+    assert np.isnan(values[1, 1])
+    assert np.isnan(read_usrout(write(tmp_path)).j_values.values[1, 1])
+
+def test_kinds(tmp_path):
+    output = read_usrout(write(tmp_path), kinds=('dose_rates',))
+    assert [table.kind for table in output.tables] == ['dose_rates']
+
+def test_split_times(tmp_path):
+    parts = split_times(read_usrout(write(tmp_path)), 2)
+    assert len(parts) == 2
+    for k, part in enumerate(parts):
+        assert part.inputs['nt'] == '2'
+        # split by row
+        np.testing.assert_array_equal(part.dose_rates.coords['time'], [[12.0, 14.0][k]])
+        assert part.dose_rates.values.shape == (1, 2)
+        # split by column
+        np.testing.assert_array_equal(part.irradiance.values[0], [[1e-03], [8e-04]][k])
+        assert part.j_values.values.shape == (2, 1)
+        assert part.j_values.row_names == ['O3 -> O2 + O(1D)', 'NO2 -> NO + O(3P)']
+
+def test_split_one_time(tmp_path):
+    output = read_usrout(write(tmp_path))
+    part, = split_times(output, 1)
+    assert [table.values.shape for table in part.tables] == [(2, 2), (2, 2), (2, 2)]
+
+def test_write_round_trip(tmp_path):
+    output = read_usrout(write(tmp_path))
+    write_usrout(output, tmp_path / 'copy.txt')
+    copy = read_usrout(tmp_path / 'copy.txt')
+    assert copy.inputs == output.inputs
+    assert [table.kind for table in copy.tables] == [table.kind for table in output.tables]
+    for table, copied in zip(output.tables, copy.tables):
+        np.testing.assert_array_equal(copied.values, table.values)
+        for name, values in table.coords.items():
+            np.testing.assert_array_equal(copied.coords[name], values)
+        assert copied.names == table.names
+        assert copied.row_names == table.row_names
+
+def test_write_split_parts(tmp_path):
+    for k, part in enumerate(split_times(read_usrout(write(tmp_path)), 2)):
+        write_usrout(part, tmp_path / f'part-{k}.txt')
+        copy = read_usrout(tmp_path / f'part-{k}.txt')
+        assert [table.kind for table in copy.tables] == ['dose_rates', 'irradiance', 'j_values']
+        assert copy.irradiance.names == [str(k + 1)]
+        np.testing.assert_array_equal(copy.irradiance.values, part.irradiance.values)
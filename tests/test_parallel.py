@@ -0,0 +1,33 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import run_tuv_batch
+from tuv_journal import RunJournal
+from tuv_output import read_usrout
+
+def worker_paths():
+    import run_tuv_batch
+    import modify_usrinp
+    return run_tuv_batch.tuv_path, modify_usrinp.reference_filepath, modify_usrinp.outfile
+
+def test_spawned_worker_gets_the_paths(tmp_path):
+    paths = (str(tmp_path), str(tmp_path / 'usrinp_backup'), str(tmp_path / 'usrinp'))
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    queue.put(str(tmp_path / 'worker-0'))
+    with ProcessPoolExecutor(1, context, run_tuv_batch._init_worker, (queue, paths)) as pool:
+        assert pool.submit(worker_paths).result(timeout=60) == paths
+
+def test_workers(tuv_tree):
+    run_tuv_batch.batch_run('parallel', workers=2, iterable_i='lat', lat=[0.0, 10.0, 20.0, 30.0],
+                            iterable_j='o3col', o3col=[300.0, 350.0], nt=1)
+    batch = tuv_tree / 'OUTPUT' / 'parallel'
+    records = RunJournal(batch / 'journal.jsonl').completed()
+    assert sorted(records) == list(range(8))
+    for record in records.values():
+        # each output is the run of its own inputs
+        echo = read_usrout(batch / 'data' / f'usrout-{record["label"]}.txt').inputs
+        assert float(echo['lat']) == float(record['inputs']['lat'])
+        assert float(echo['o3col']) == float(record['inputs']['o3col'])
+    # the per-batch workspace directory is gone
+    assert os.listdir(tuv_tree / 'WORKSPACES') == []
@@ -0,0 +1,67 @@
+import os
+import numpy as np
+import pytest
+from run_tuv_batch import batch_run
+from tuv_postprocess import Spectra, erythema, _edges
+
+def flat_spectra(n_points=3, n_times=2):
+    # 1 W m-2 nm-1 from 300 to 320 nm, in 2 nm intervals
+    lower = np.arange(300.0, 320.0, 2.0)
+    values = np.ones((n_points, len(lower), n_times))
+    return Spectra(values, lower, lower + 2.0)
+
+def test_bands():
+    doses = flat_spectra().integrate(bands=['UVB', 'UVA'], ratios=['UVB/UVA'])
+    # the 314-316 interval counts half towards each band
+    np.testing.assert_allclose(doses['UVB'], 15.0)
+    np.testing.assert_allclose(doses['UVA'], 5.0)
+    np.testing.assert_allclose(doses['UVB/UVA'], 3.0)
+    assert doses['UVB'].shape == (3, 2)
+
+def test_actions():
+    spectra = flat_spectra()
+    doses = spectra.integrate(bands={'narrow': (305.0, 307.0)},
+                              actions={'half': lambda wavelength: 0.5 * np.ones_like(wavelength),
+                                       'table': ([300.0, 320.0], [1.0, 1.0]),
+                                       'ery': erythema},
+                              chunk_size=2)
+    np.testing.assert_allclose(doses['narrow'], 2.0)
+    np.testing.assert_allclose(doses['half'], 10.0)
+    np.testing.assert_allclose(doses['table'], 20.0)
+    np.testing.assert_allclose(doses['ery'], (erythema(spectra.centre) * 2.0).sum())
+
+def test_invalid():
+    with pytest.raises(ValueError):
+        flat_spectra().integrate(bands=['UVD'])
+    with pytest.raises(ValueError):
+        flat_spectra().integrate(bands=[])
+    with pytest.raises(ValueError):
+        Spectra(np.ones((3, 4, 1)), [300.0, 302.0], [302.0, 304.0])
+
+def test_edges_from_centres():
+    lower, upper = _edges({'wavelength': [301.0, 303.0, 307.0]}, 'irradiance')
+    np.testing.assert_array_equal(lower, [300.0, 302.0, 305.0])
+    np.testing.assert_array_equal(upper, [302.0, 305.0, 309.0])
+
+def test_text_and_store_agree(tuv_tree):
+    params = dict(iterable_i='o3col', o3col=[300.0, 400.0, 600.0], iterable_j='lat', lat=[0.0, 10.0], nt=1)
+    batch_run('text', **params)
+    batch_run('stored', output='store', **params)
+    batch_path = str(tuv_tree / 'OUTPUT' / 'text')
+    text = Spectra.from_outputs(batch_path).integrate()
+    stored = Spectra.from_store(str(tuv_tree / 'OUTPUT' / 'stored' / 'store')).integrate()
+    assert stored['UVB'].shape == (3, 2, 1)
+    for band in ('UVA', 'UVB', 'UVC'):
+        np.testing.assert_allclose(text[band].reshape(stored[band].shape), stored[band])
+    # the stub's spectra scale as 1/o3col
+    np.testing.assert_allclose(stored['UVB'][0], 2 * stored['UVB'][2])
+    assert os.path.exists(os.path.join(batch_path, 'spectra-irradiance.npy'))
+
+def test_cache_follows_the_outputs(tuv_tree):
+    batch_run('text', iterable_i='o3col', o3col=[300.0, 600.0], nt=1)
+    batch_path = str(tuv_tree / 'OUTPUT' / 'text')
+    before = Spectra.from_outputs(batch_path).integrate(bands=['UVB'])['UVB']
+    batch_run('text', iterable_i='o3col', o3col=[300.0, 600.0, 150.0], nt=1, extend=True)
+    after = Spectra.from_outputs(batch_path).integrate(bands=['UVB'])['UVB']
+    assert after.shape == (3, 1)
+    np.testing.assert_array_equal(after[:2], before)
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from modify_usrinp import formatVarType
+from run_tuv_batch import setInputs
+from tuv_preflight import check_points, check_sweep
+from tuv_sweep import Sweep
+
+@pytest.fixture
+def inputs():
+    return setInputs()[0]
+
+@pytest.mark.parametrize('name, values, reason', [
+    ('lat', [95.0], 'lat outside -90 to 90'),
+    ('lat', [float('nan')], 'missing value'),
+    ('imonth', [13], 'invalid month'),
+    ('nt', [0], 'nt below 1'),
+    ('nwint', [0], 'nwint is 0'),
+    ('iyear', [2100], 'iyear outside 1950-2050'),
+    ('zout', [120.0], 'zout outside zstart-zstop'),
+])
+def test_invalid(inputs, name, values, reason):
+    report = check_sweep(inputs, Sweep().product(name, values))
+    assert report.invalid == {0: reason}
+    assert report.n_runs == 0
+
+def test_day_of_month(inputs):
+    sweep = Sweep().product('iyear', [2000, 2001]).product('iday', [29, 30])
+    report = check_sweep({**inputs, 'imonth': 2}, sweep)
+    # 2000 is a leap year
+    assert report.invalid == {1: 'invalid day of month', 2: 'invalid day of month',
+                              3: 'invalid day of month'}
+
+def test_wavelengths(inputs):
+    sweep = Sweep().zip('grid', wstart=[200.0, 200.0, 300.0], nwint=[100, -156, 100])
+    report = check_sweep({**inputs, 'wstop': 290.0}, sweep)
+    # nwint < 0 is TUV's standard grid, which ignores wstart
+    assert report.invalid == {0: 'wstart below 205 nm', 2: 'wstop not above wstart'}
+
+def test_levels(inputs):
+    # zout = 0.5 is between the levels of a 0-80 km grid of 81 levels, so TUV adds one
+    sweep = Sweep().zip('grid', nz=[151, 151, 81], zout=[0.0, 0.5, 0.5])
+    report = check_sweep({**inputs, 'zstart': 0.0, 'zstop': 80.0}, sweep)
+    assert report.invalid == {1: 'nz too large for zout'}
+
+def test_duplicates_match_usrinp(inputs):
+    lats = [0.0005, 0.0, 0.0004, 10.0, 10.0001]
+    report = check_sweep(inputs, Sweep().product('lat', lats))
+    # printf rounds 0.0005 up where np.round would round it to even
+    assert [formatVarType('lat', lat) for lat in lats[:3]] == ['   0.001', '   0.000', '   0.000']
+    assert report.duplicates == {2: 1, 4: 3}
+    assert report.n_runs == 3
+
+def test_duplicates_skip_invalid(inputs):
+    sweep = Sweep().product('lat', [95.0, 95.0, 0.0]).product('lzenit', [True, 'T', False])
+    report = check_sweep(inputs, sweep)
+    assert sorted(report.invalid) == [0, 1, 2, 3, 4, 5]
+    assert report.duplicates == {7: 6}
+    assert report.summary() == ('9 points, 6 invalid (lat outside -90 to 90: 6), '
+                                '1 repeated, 2 runs to execute')
+
+def test_window(inputs):
+    report = check_sweep(inputs, Sweep().product('lat', [0.0, 95.0, 0.0, 95.0]), 2, 4)
+    assert report.n_points == 2
+    assert report.invalid == {3: 'lat outside -90 to 90'}
+    assert report.duplicates == {}
+
+def test_check_points(inputs):
+    invalid = check_points(inputs, {'lat': [0.0, 95.0], 'imonth': np.array([1, 0])}, [10, 11])
+    assert invalid == {11: 'invalid month'}
@@ -0,0 +1,73 @@
+import json
+import os
+import pytest
+import run_tuv_batch
+from tuv_journal import RunJournal
+from tuv_queue import WorkQueue, merge, plan_queue, work
+
+def plan(tmp_path, **kwargs):
+    queue = str(tmp_path / 'queue')
+    plan_queue(queue, 'queued', chunk_size=2, iterable_i='lat', lat=[0.0, 10.0, 20.0], nt=1, **kwargs)
+    return queue
+
+def test_plan(tuv_tree, tmp_path):
+    with open(os.path.join(plan(tmp_path, workers=2), 'plan.json')) as f:
+        saved = json.load(f)
+    assert saved['n_chunks'] == 2
+    assert saved['tuv_path'] == str(tuv_tree)
+    assert saved['options'] == {'workers': 2}
+    assert saved['inputs'] == {'nt': 1}
+
+def test_plan_refuses_unmergeable_options(tuv_tree, tmp_path):
+    with pytest.raises(ValueError):
+        plan(tmp_path, output='store')
+    with pytest.raises(ValueError):
+        plan(tmp_path, extend=True)
+
+def test_claim_is_exclusive(tuv_tree, tmp_path):
+    queue = plan(tmp_path)
+    with WorkQueue(queue, 'a') as a, WorkQueue(queue, 'b') as b:
+        claimed = {a.claim(), b.claim()}
+        assert claimed == {0, 1}
+        # both chunks are leased and the leases are fresh
+        assert a.claim() is None
+        a.complete(a.current)
+        assert len(a.pending()) == 1
+
+def test_stale_lease_is_taken_over(tuv_tree, tmp_path):
+    queue = plan(tmp_path)
+    with WorkQueue(queue, 'dead') as dead:
+        k = dead.claim()
+        lease = os.path.join(queue, 'leases', f'{k:06d}')
+        # the dead worker's lease, last touched an hour ago
+        stamp = os.stat(lease).st_mtime - 3600
+        os.utime(lease, (stamp, stamp))
+        dead.current = None
+    with WorkQueue(queue, 'alive', heartbeat=1.0, lease_timeout=60.0) as alive:
+        taken = {alive.claim(), alive.claim()}
+        assert k in taken
+        with open(lease) as f:
+            assert f.read() == 'alive'
+
+def test_work_and_merge_use_the_plans_tree(tuv_tree, tmp_path, monkeypatch):
+    queue = plan(tmp_path)
+    # a node where the default tree is somewhere else
+    monkeypatch.setattr(run_tuv_batch, 'tuv_path', str(tmp_path / 'elsewhere'))
+    assert work(queue, 'w', local_scratch=str(tmp_path / 'scratch'), wait=False) == 2
+    monkeypatch.setattr(run_tuv_batch, 'tuv_path', str(tmp_path / 'elsewhere'))
+    target = merge(queue)
+    assert target == os.path.join(str(tuv_tree), 'OUTPUT', 'queued')
+    assert sorted(os.listdir(os.path.join(target, 'data'))) == ['usrout-0.txt', 'usrout-1.txt', 'usrout-2.txt']
+    assert sorted(RunJournal(os.path.join(target, 'journal.jsonl')).completed()) == [0, 1, 2]
+
+def test_merge_waits_for_every_chunk(tuv_tree, tmp_path):
+    queue = plan(tmp_path)
+    with pytest.raises(RuntimeError):
+        merge(queue)
+
+def test_resume_counts_the_chunk(tuv_tree, capsys):
+    kwargs = dict(shard=(0, 2), resume=True, iterable_i='lat', lat=[0.0, 10.0, 20.0, 30.0], nt=1)
+    run_tuv_batch.batch_run('shard', **kwargs)
+    assert '..resuming: 0 of 2 iterations already done' in capsys.readouterr().out
+    run_tuv_batch.batch_run('shard', **kwargs)
+    assert '..resuming: 2 of 2 iterations already done' in capsys.readouterr().out
@@ -0,0 +1,37 @@
+import io
+import sys
+import threading
+import run_tuv_batch
+from run_tuv_batch import _MainThreadOutput
+
+def test_other_threads_print_through_the_main_thread():
+    stream = io.StringIO()
+    output = _MainThreadOutput(stream)
+
+    def chatter():
+        for k in range(200):
+            print(f'from thread {k}', file=output)
+
+    thread = threading.Thread(target=chatter)
+    thread.start()
+    for k in range(200):
+        print(f'from main {k}', file=output)
+    thread.join()
+    assert 'from thread' not in stream.getvalue()
+    output.drain()
+    lines = stream.getvalue().splitlines()
+    assert sorted(lines) == sorted([f'from main {k}' for k in range(200)] +
+                                   [f'from thread {k}' for k in range(200)])
+    assert [line for line in lines if 'thread' in line] == [f'from thread {k}' for k in range(200)]
+
+def test_serial_batch_output(tuv_tree, tmp_path, capsys):
+    kwargs = dict(cache=str(tmp_path / 'cache'), iterable_i='lat', lat=[0.0, 10.0, 20.0, 95.0], nt=1)
+    run_tuv_batch.batch_run('serial', **kwargs)
+    run_tuv_batch.batch_run('serial-again', **kwargs)
+    out = capsys.readouterr().out
+    # the cache hits are found while planning, on the render thread
+    assert out.count('found in cache') == 3
+    assert out.count('not run (lat outside -90 to 90)') == 2
+    for line in out.splitlines():
+        assert line.strip() == '' or line.lstrip().startswith(('..', 'TUV Run', '-')), line
+    assert not isinstance(sys.stdout, _MainThreadOutput)
@@ -0,0 +1,72 @@
+import os
+import json
+import argparse
+import pytest
+import run_tuv_batch
+from tuv_spec import load_spec
+
+seasonal = """
+tuv_path = "TUV-V5.4"
+data_subdir = "seasonal"
+workers = 1
+
+[inputs]
+nt = 1
+tstart = 12.0
+
+[axes]
+imonth = {start = 1, stop = 12, step = 5}
+lat = {start = -0.3, stop = 0.3, num = 3}
+site = {lon = [-105.3, 2.3], alsurf = {start = 0.05, stop = 0.2, num = 2}}
+"""
+
+def test_load_spec(tmp_path):
+    (tmp_path / 'seasonal.toml').write_text(seasonal)
+    spec = load_spec(str(tmp_path / 'seasonal.toml'))
+    assert spec['tuv_path'] == str(tmp_path / 'TUV-V5.4')
+    assert (spec['data_subdir'], spec['workers'], spec['nt'], spec['tstart']) == ('seasonal', 1, 1, 12.0)
+    sweep = spec['sweep']
+    assert [axis.name for axis in sweep.axes] == ['imonth', 'lat', 'site']
+    assert sweep.axes[0].params['imonth'] == (1, 6, 11)
+    assert sweep.axes[1].params['lat'] == (-0.3, 0.0, 0.3)
+    assert sweep.axes[2].params == {'lon': (-105.3, 2.3), 'alsurf': (0.05, 0.2)}
+
+def test_json_with_fields(tmp_path):
+    spec = {'data_subdir': 'ozone', 'axes': {'imonth': [1, 7], 'lat': [0.0, 10.0]},
+            'fields': {'o3col': [[300, 310], [320, 330]]}}
+    (tmp_path / 'ozone.json').write_text(json.dumps(spec))
+    sweep = load_spec(str(tmp_path / 'ozone.json'))['sweep']
+    assert [point.values['o3col'] for point in sweep] == [300, 310, 320, 330]
+
+@pytest.mark.parametrize('text', [
+    'nt = 1',
+    'data_subdir = "x"\nnt = 1\n[inputs]\nnt = 2',
+    'data_subdir = "x"\niterable_i = "lat"\n[axes]\nimonth = [1, 2]',
+    'data_subdir = "x"\n[fields]\no3col = [300]',
+    'data_subdir = "x"\n[axes]\nlat = {start = 0, stop = 10}\nimonth = {start = 1, stop = 12, step = -1}',
+    'data_subdir = "x"\n[axes]\nlat = {start = 0, stop = 10, step = 1, num = 11}',
+    'data_subdir = "x"\n[axes]\nlat = {start = 0, num = 11}',
+])
+def test_invalid(tmp_path, text):
+    (tmp_path / 'bad.toml').write_text(text)
+    with pytest.raises(ValueError):
+        load_spec(str(tmp_path / 'bad.toml'))
+
+def test_parse_shard():
+    assert run_tuv_batch._parse_shard('3/100') == (3, 100)
+    for text in ('100/100', '3', 'a/b'):
+        with pytest.raises(argparse.ArgumentTypeError):
+            run_tuv_batch._parse_shard(text)
+
+def test_run_command(tuv_tree, tmp_path, capsys):
+    # the spec's tuv_path, next to it, is the fixture's tree
+    (tmp_path / 'seasonal.toml').write_text(seasonal)
+    run_tuv_batch.main(['run', str(tmp_path / 'seasonal.toml'), '--dry-run'])
+    out = capsys.readouterr().out
+    assert 'points   18 (3 x 3 x 2)' in out
+    assert not os.path.exists(tuv_tree / 'OUTPUT')
+
+    run_tuv_batch.main(['run', str(tmp_path / 'seasonal.toml'), '--shard', '1/3'])
+    assert sorted(os.listdir(tuv_tree / 'OUTPUT' / 'seasonal' / 'data'))[:2] == ['usrout-1-0-0.txt',
+                                                                                 'usrout-1-0-1.txt']
+    assert len(os.listdir(tuv_tree / 'OUTPUT' / 'seasonal' / 'data')) == 6
@@ -0,0 +1,48 @@
+import numpy as np
+from run_tuv_batch import batch_run
+from tuv_output import read_usrout
+from tuv_store import BatchStore
+
+def test_store_matches_text_output(tuv_tree):
+    params = dict(iterable_i='lat', lat=[0.0, 10.0], iterable_j='o3col', o3col=[300.0, 350.0, 400.0], nt=1)
+    batch_run('text', **params)
+    batch_run('stored', output='store', **params)
+    store = BatchStore(str(tuv_tree / 'OUTPUT' / 'stored' / 'store'))
+    assert store.shape == (2, 3)
+    assert store.quantities == ['dose_rates', 'irradiance']
+    assert store.meta('irradiance')['dims'] == ['lat', 'o3col', 'wavelength', 'column']
+    for i in range(2):
+        for j in range(3):
+            assert store.is_done((i, j))
+            output = read_usrout(str(tuv_tree / 'OUTPUT' / 'text' / 'data' / f'usrout-{i}-{j}.txt'))
+            np.testing.assert_array_equal(store.read('irradiance')[i, j], output.irradiance.values)
+            assert 'o3col' in store.log((i, j))
+
+def test_sel(tuv_tree):
+    batch_run('stored', output='store', iterable_i='lat', lat=[0.0, 10.0],
+              iterable_j='o3col', o3col=[300.0, 350.0, 400.0], nt=1)
+    store = BatchStore(str(tuv_tree / 'OUTPUT' / 'stored' / 'store'))
+    # scalars pick the nearest value, slices keep a closed range
+    uv, coords = store.sel('irradiance', lat=9.0, o3col=slice(340, 400), wavelength=slice(None, 300))
+    assert list(coords['o3col']) == [350.0, 400.0]
+    assert uv.shape == (2, len(coords['wavelength']), 1)
+    assert coords['wavelength'].max() <= 300
+    np.testing.assert_array_equal(uv[0], store.read('irradiance')[1, 1, :len(coords['wavelength'])])
+    rates, coords = store.sel('dose_rates', column='spectrum 2')
+    assert rates.shape == (2, 3, 1)
+    assert 'column' not in coords
+
+def test_write_and_copy_point(tuv_tree, tmp_path):
+    batch_run('text', iterable_i='lat', lat=[0.0], nt=1)
+    output = read_usrout(str(tuv_tree / 'OUTPUT' / 'text' / 'data' / 'usrout-0.txt'))
+    store = BatchStore.create(str(tmp_path / 'store'), [('lat', [0.0, 10.0, 20.0])])
+    assert not store.copy_point(0, 1)
+    store.write(0, output, 'log of 0')
+    assert store.copy_point(0, 2)
+    # a reopened store sees the same points
+    store = BatchStore(str(tmp_path / 'store'))
+    assert [store.is_done(i) for i in range(3)] == [True, False, True]
+    assert store.log(1) is None
+    assert store.log(2) == 'log of 0'
+    np.testing.assert_array_equal(store.read('irradiance')[2], output.irradiance.values)
+    assert np.isnan(store.read('irradiance')[1]).all()
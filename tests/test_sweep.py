@@ -0,0 +1,81 @@
+import pytest
+from tuv_sweep import Sweep
+
+def sweep():
+    return (Sweep()
+            .product('imonth', [1, 2, 3])
+            .product('lat', [-10.0, 0.0, 10.0, 20.0])
+            .zip('site', lon=[-105.3, 2.3], alsurf=[0.05, 0.2]))
+
+def test_shape_and_params():
+    s = sweep()
+    assert s.shape == (3, 4, 2)
+    assert len(s) == 24
+    assert s.params == ['imonth', 'lat', 'lon', 'alsurf']
+
+def test_point():
+    point = sweep().point(13)
+    assert point.flat == 13
+    assert point.index == (1, 2, 1)
+    assert point.label == '1-2-1'
+    assert point.values == {'imonth': 2, 'lat': 10.0, 'lon': 2.3, 'alsurf': 0.2}
+
+def test_flat_index():
+    s = sweep()
+    for flat in range(len(s)):
+        assert s.flat_index(s.point(flat).index) == flat
+
+def test_points_in_c_order():
+    s = sweep()
+    points = list(s)
+    assert [point.flat for point in points] == list(range(24))
+    assert points == [s.point(flat) for flat in range(24)]
+    assert list(s.points(5, 9)) == points[5:9]
+    assert list(s.points(20, 100)) == points[20:]
+    assert list(s.points(9, 9)) == []
+
+@pytest.mark.parametrize('n_shards', [1, 2, 5, 7, 24, 30])
+def test_shards_cover_the_sweep(n_shards):
+    s = sweep()
+    flats = [point.flat for k in range(n_shards) for point in s.shard(k, n_shards)]
+    assert flats == list(range(24))
+    sizes = [len(list(s.shard(k, n_shards))) for k in range(n_shards)]
+    assert max(sizes) - min(sizes) <= 1
+
+def test_field():
+    s = Sweep().product('imonth', [1, 2]).product('lat', [0, 10, 20])
+    s.field('o3col', [[300, 310, 320], [330, 340, 350]])
+    assert s.point(4).values == {'imonth': 2, 'lat': 10, 'o3col': 340}
+    with pytest.raises(ValueError):
+        s.field('alsurf', [0.1, 0.2])
+
+def test_dict_round_trip():
+    s = Sweep().product('imonth', [1, 2]).product('lat', [0, 10, 20])
+    s.field('o3col', [300, 310, 320, 330, 340, 350])
+    copy = Sweep.from_dict(s.to_dict())
+    assert list(copy) == list(s)
+
+def test_from_iterables():
+    inputs = {'imonth': [1, 2, 3], 'lat': [0, 10], 'o3col': [300, 350]}
+    s = Sweep.from_iterables(inputs, 'imonth', 'lat', 'o3col')
+    assert s.shape == (3, 2, 2)
+    assert s.point(3).label == '0-1-1'
+
+def test_from_iterables_k_field():
+    # one o3col per (imonth, lat) point, laid out like np.meshgrid(imonth, lat)
+    inputs = {'imonth': [1, 2, 3], 'lat': [0, 10], 'o3col': [[300, 301, 302], [310, 311, 312]]}
+    s = Sweep.from_iterables(inputs, 'imonth', 'lat', 'o3col', k_field=True)
+    assert s.shape == (3, 2)
+    assert [point.values['o3col'] for point in s] == [300, 310, 301, 311, 302, 312]
+    with pytest.raises(ValueError):
+        Sweep.from_iterables({**inputs, 'o3col': [300, 350]}, 'imonth', 'lat', 'o3col', k_field=True)
+
+def test_from_iterables_refuses_nested_k():
+    import numpy as np
+    inputs = {'imonth': [1, 2, 3], 'lat': [0, 10], 'o3col': np.array([[300, 301, 302], [310, 311, 312]])}
+    with pytest.raises(ValueError, match='iterable_k_field=True'):
+        Sweep.from_iterables(inputs, 'imonth', 'lat', 'o3col')
+    with pytest.raises(ValueError, match='iterable_k_field=True'):
+        Sweep.from_iterables({**inputs, 'o3col': inputs['o3col'].tolist()}, 'imonth', 'lat', 'o3col')
+    # a 1-D array is an axis
+    assert Sweep.from_iterables({**inputs, 'o3col': np.array([300, 350])}, 'imonth', 'lat', 'o3col').shape == (3, 2, 2)
@@ -0,0 +1,39 @@
+import os
+from tuv_index import RunIndex
+from tuv_table import TableSweep, batch_run_table
+from tuv_workspace import link_or_copy
+
+csv_text = """id,latitude,note
+a,10.0,"two
+lines"
+b,20.0,x
+c,10.0001,x
+"""
+
+def test_rows(tmp_path):
+    (tmp_path / 'rows.csv').write_text(csv_text)
+    table = TableSweep(str(tmp_path / 'rows.csv'), {'latitude': 'lat'}, 'id')
+    # the quoted line break is part of row a
+    assert len(table) == 3
+    # c is written to usrinp as lat 10.000, the same run as a, so it is held back
+    assert [(point.label, point.values) for point in table] == [('a', {'lat': 10.0}), ('b', {'lat': 20.0})]
+    assert table.duplicates == 1
+
+def test_repeated_rows_are_linked_and_indexed(tuv_tree, tmp_path):
+    (tmp_path / 'rows.csv').write_text(csv_text)
+    index = str(tmp_path / 'index.sqlite')
+    batch_run_table('rows', str(tmp_path / 'rows.csv'), {'latitude': 'lat'}, 'id', index=index, nt=1)
+    data = tuv_tree / 'OUTPUT' / 'rows' / 'data'
+    assert sorted(os.listdir(data)) == ['usrout-a.txt', 'usrout-b.txt', 'usrout-c.txt']
+    assert os.path.samefile(data / 'usrout-a.txt', data / 'usrout-c.txt')
+    with RunIndex(index) as run_index:
+        assert sorted(run['label'] for run in run_index.find()) == ['a', 'b', 'c']
+
+def test_link_or_copy_replaces(tmp_path):
+    (tmp_path / 'first.txt').write_text('first')
+    (tmp_path / 'second.txt').write_text('second')
+    os.link(tmp_path / 'first.txt', tmp_path / 'dst.txt')
+    link_or_copy(str(tmp_path / 'second.txt'), str(tmp_path / 'dst.txt'))
+    assert (tmp_path / 'dst.txt').read_text() == 'second'
+    assert (tmp_path / 'first.txt').read_text() == 'first'
+    assert not os.path.exists(tmp_path / 'dst.txt.part')
@@ -0,0 +1,53 @@
+import os
+import shutil
+import pytest
+from modify_usrinp import InputDeck, loadInputDeck, modifyInput
+
+here = os.path.dirname(os.path.abspath(__file__))
+reference = os.path.join(os.path.dirname(here), 'benchmarks', 'usrinp_backup')
+
+# tests/data/usrinp-defaults and usrinp-modified were written by the modifyInput that went
+# through pandas, before InputDeck
+modified = {'lat': 42.5, 'lon': -105.25, 'imonth': 6, 'iday': 21, 'o3col': 312.3456, 'nt': 10,
+            'tstart': 6.0, 'tstop': 18.0, 'lzenit': True, 'alsurf': 0.05, 'zout': 1.6, 'nwint': -156,
+            'wstart': 280.0, 'wstop': 420.0, 'iyear': 2010, 'tauaer': 0.0005, 'lirrad': False}
+
+def legacy(name):
+    with open(os.path.join(here, 'data', f'usrinp-{name}')) as f:
+        return f.read()
+
+def test_render_matches_legacy():
+    deck = InputDeck(reference)
+    assert deck.render({}) == legacy('defaults')
+    assert deck.render(modified) == legacy('modified')
+
+def test_modify_input_writes_the_same_file(tmp_path, monkeypatch):
+    import modify_usrinp
+    monkeypatch.setattr(modify_usrinp, 'reference_filepath', reference)
+    modifyInput(modified, str(tmp_path / 'usrinp'))
+    with open(tmp_path / 'usrinp') as f:
+        assert f.read() == legacy('modified')
+
+def test_selections():
+    usrinp = InputDeck(reference).render({'spectra': '1 8', 'reactions': 2})
+    lines = usrinp.splitlines()
+    assert lines[20:29] == [f'{"T" if n in (1, 8) else "F"}{line[1:]}'
+                            for n, line in enumerate(legacy('defaults').splitlines()[20:29], 1)]
+    assert lines[31].startswith('T  2 ')
+    assert lines[30].startswith('F  1 ')
+
+def test_invalid_name():
+    with pytest.raises(AttributeError, match='Invalid parameter name: "latitude"'):
+        InputDeck(reference).render({'latitude': 10})
+
+def test_reloads_a_changed_file(tmp_path):
+    filepath = str(tmp_path / 'usrinp_backup')
+    shutil.copy(reference, filepath)
+    deck = loadInputDeck(filepath)
+    assert loadInputDeck(filepath) is deck
+    with open(filepath) as f:
+        text = f.read()
+    with open(filepath, 'w') as f:
+        f.write(text.replace('nms =              7', 'nms =              9'))
+    os.utime(filepath, ns=(deck.mtime + 10**9, deck.mtime + 10**9))
+    assert loadInputDeck(filepath).defaults['nms'] == '9'
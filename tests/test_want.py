@@ -0,0 +1,54 @@
+import os
+import json
+import pytest
+from conftest import repo_dir
+from modify_usrinp import InputDeck
+from run_tuv_batch import batch_run
+from tuv_want import Wanted
+
+deck = InputDeck(os.path.join(repo_dir, 'benchmarks', 'usrinp_backup'))
+
+@pytest.mark.parametrize('spec, number', [
+    ('dose:1', 1),
+    ('dose:UV-B, 280-315 nm', 1),
+    ('dose:UVB*', 2),
+    ('dose:erythema', 8),
+    ('j:O3->O1D', 2),
+    ('j:O3 -> O(3P)', 3),
+    ('j:HO2', 4),
+    ('j:CH2O->H2', 10),
+])
+def test_lookup(spec, number):
+    assert Wanted(spec, deck).outputs[0].number == number
+
+@pytest.mark.parametrize('spec', ['flux', 'dose:10', 'dose:', 'j:O3', 'j:N2O5',
+                                  'irradiance@z', 'dose:UVB@ground'])
+def test_invalid(spec):
+    with pytest.raises(ValueError):
+        Wanted(spec, deck)
+
+def test_one_profile_per_list():
+    with pytest.raises(ValueError):
+        Wanted(['j:NO2@z', 'j:O3->O1D@z'], deck)
+
+def test_settings():
+    settings = Wanted(['dose:UVA', 'dose:UVB', 'j:NO2@z', 'irradiance'], deck).settings()
+    assert settings['spectra'] == '1 3'
+    assert settings['nms'] == 2
+    assert (settings['reactions'], settings['nmj'], settings['ijfix']) == ('6', 1, 6)
+    assert settings['lirrad'] and not settings['laflux'] and not settings['lmmech']
+    assert settings['lrates'] and settings['ljvals']
+
+def test_batch(tuv_tree):
+    wanted = Wanted(['dose:UVA', 'irradiance'])
+    batch_run('wanted', want=wanted.specs, iterable_i='o3col', o3col=[300.0, 600.0], nt=1)
+    batch_path = tuv_tree / 'OUTPUT' / 'wanted'
+    with open(batch_path / 'want.json') as f:
+        assert json.load(f) == ['dose:UVA', 'irradiance']
+    with open(tuv_tree / 'INPUTS' / 'usrinp') as f:
+        assert 'nms =              1' in f.read()
+    values = [wanted.read(str(batch_path / 'data' / f'usrout-{label}.txt')) for label in '01']
+    # the stub prints the one dose rate switched on as its first column
+    assert values[0]['dose:UVA'].tolist() == [0.15]
+    assert values[1]['dose:UVA'].tolist() == [0.075]
+    assert values[0]['irradiance'].shape == (140, 1)
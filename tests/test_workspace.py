@@ -0,0 +1,60 @@
+import os
+import pytest
+from run_tuv_batch import batch_run
+from tuv_workspace import WorkspaceManager, OutputMover, create_workspace, workspace_outputs
+
+def test_create_workspace(tuv_tree, tmp_path):
+    workdir = create_workspace(str(tuv_tree), str(tmp_path / 'scratch'), 0)
+    assert os.path.islink(os.path.join(workdir, 'tuv'))
+    assert os.path.islink(os.path.join(workdir, 'DATAE1'))
+    assert os.path.islink(os.path.join(workdir, 'INPUTS', 'usrinp_backup'))
+    assert not os.path.islink(os.path.join(workdir, 'INPUTS'))
+    assert workspace_outputs(workdir)[0] == str(tmp_path / 'scratch' / 'worker-0' / 'usrout.txt')
+
+def test_scratch_inside_the_tree_is_not_linked_in(tuv_tree):
+    workdir = create_workspace(str(tuv_tree), str(tuv_tree / 'WORKSPACES' / 'batch-1'), 0)
+    assert not os.path.lexists(os.path.join(workdir, 'WORKSPACES'))
+
+def test_manager(tuv_tree, tmp_path):
+    root = str(tmp_path / 'local')
+    workspaces = WorkspaceManager(str(tuv_tree), root)
+    workdir = workspaces.workspace(0)
+    # the executable is a local copy, shared by hardlink
+    assert os.path.samefile(os.path.join(workdir, 'tuv'), os.path.join(root, 'shared', 'tuv'))
+    assert not os.path.samefile(os.path.join(workdir, 'tuv'), tuv_tree / 'tuv')
+    with pytest.raises(RuntimeError):
+        WorkspaceManager(str(tuv_tree), root)
+    workspaces.close()
+
+    # a new executable in the tree replaces the local one
+    with open(tuv_tree / 'tuv', 'a') as f:
+        f.write('# rebuilt\n')
+    workspaces = WorkspaceManager(str(tuv_tree), root)
+    with open(workspaces.workspace(0) + '/tuv') as f:
+        assert f.read().endswith('# rebuilt\n')
+    workspaces.clear()
+    assert not os.path.exists(root)
+
+def test_output_mover(tmp_path):
+    os.makedirs(tmp_path / 'outbox')
+    os.makedirs(tmp_path / 'data')
+    mover = OutputMover(batch_size=2)
+    for k in range(3):
+        (tmp_path / 'outbox' / f'{k}.txt').write_text(str(k))
+        mover.add(str(tmp_path / 'outbox' / f'{k}.txt'), str(tmp_path / 'data' / f'{k}.txt'))
+    # the first two went as a batch, the third waits for a flush
+    assert sorted(os.listdir(tmp_path / 'data')) == ['0.txt', '1.txt']
+    mover.flush()
+    assert sorted(os.listdir(tmp_path / 'data')) == ['0.txt', '1.txt', '2.txt']
+    assert os.listdir(tmp_path / 'outbox') == []
+
+def test_local_scratch_batch(tuv_tree, tmp_path):
+    params = dict(iterable_i='lat', lat=[0.0, 10.0], nt=1)
+    batch_run('plain', **params)
+    batch_run('local', local_scratch=str(tmp_path / 'local'), **params)
+    for label in ('0', '1'):
+        with open(tuv_tree / 'OUTPUT' / 'plain' / 'data' / f'usrout-{label}.txt') as f:
+            expected = f.read()
+        with open(tuv_tree / 'OUTPUT' / 'local' / 'data' / f'usrout-{label}.txt') as f:
+            assert f.read() == expected
+    assert os.listdir(tmp_path / 'local' / 'outbox') == []
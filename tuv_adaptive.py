@@ -0,0 +1,197 @@
+"""
+Adaptive sweeps: run TUV densely only where the output is non-linear.
+
+A uniform sweep spends as many runs on flat stretches of the response as on
+sharp ones. batch_run_adaptive starts from the coarse grid given by the
+iterable_i/j/k axes and treats each grid cell as a box. For every box it
+runs TUV at the box centre and compares one output quantity there with the
+multilinear interpolation from the box corners. Boxes where the difference
+exceeds the tolerance are cut in half across their widest axis (measured in
+units of min_spacing) and tested again; the others are done. Each round of
+new points is one ordinary batch_run, so workers=, cache= and local_scratch=
+work as usual, in OUTPUT/{data_subdir}/round-{n}. Rounds are read back from
+their text output, so output='store' or 'archive' and collapse_time are
+refused.
+
+    from tuv_adaptive import batch_run_adaptive
+    result = batch_run_adaptive('uvb-adaptive', ('dose_rates', 'UV-B, 280-315 nm'),
+                                tol=1e-3, min_spacing={'lat': 1.0},
+                                iterable_i='lat', lat=np.arange(-90, 91, 15),
+                                iterable_j='imonth', imonth=[1, 4, 7, 10, 12],
+                                nt=1, tstart=12.0)
+
+The points that were run, their values, and every final box with its
+measured error are saved to OUTPUT/{data_subdir}/adaptive.npz. The error of
+a box is the difference found at its centre; boxes that could not be split
+further while still above the tolerance are marked as not converged.
+"""
+import os
+import itertools
+import numpy as np
+import run_tuv_batch
+from modify_usrinp import var_types
+from tuv_output import read_usrout
+from tuv_sweep import Sweep
+
+def batch_run_adaptive(data_subdir, quantity, tol, rtol=0.0, min_spacing=None, max_rounds=8,
+                       workers=1, cache=None, resume=False, local_scratch=None, **kwargs):
+    """
+    quantity picks the number(s) to refine on from each run: a function of
+    the parsed TuvOutput, or a (kind, column) pair such as
+    ('dose_rates', 'UV-B, 280-315 nm'), where column is a name or position.
+    A box is split while its centre error exceeds tol + rtol * |value|.
+    """
+    # each round's values are read back from its usrout files
+    if kwargs.get('output', 'text') != 'text':
+        raise ValueError(f"Adaptive sweeps read text output, not output={kwargs['output']!r}")
+    if kwargs.get('collapse_time'):
+        raise ValueError('Adaptive sweeps cannot collapse time; make tstart an axis or set nt')
+    if kwargs.get('iterable_k_field'):
+        raise ValueError('Adaptive sweeps refine axes; iterable_k_field is not supported')
+    names = [kwargs.pop(key) for key in ('iterable_i', 'iterable_j', 'iterable_k') if kwargs.get(key)]
+    if not names:
+        raise AttributeError('No iterable parameters specified')
+    coarse = [np.asarray(kwargs.pop(name), dtype=np.float64) for name in names]
+    for name, values in zip(names, coarse):
+        if len(values) < 2:
+            raise ValueError(f'Axis "{name}" needs at least 2 coarse values')
+    min_spacing = dict(min_spacing or {})
+    # widths are compared in units of min_spacing, or of the coarse spacing
+    scale = [min_spacing.get(name, np.min(np.diff(np.sort(values))))
+             for name, values in zip(names, coarse)]
+    is_int = [var_types.get(name) == 'int' for name in names]
+    if not callable(quantity):
+        quantity = _table_quantity(*quantity)
+
+    runner = _RoundRunner(data_subdir, names, quantity,
+                          dict(workers=workers, cache=cache, resume=resume,
+                               local_scratch=local_scratch, **kwargs))
+
+    active = [(np.array(lo), np.array(hi)) for lo, hi in
+              zip(itertools.product(*(values[:-1] for values in coarse)),
+                  itertools.product(*(values[1:] for values in coarse)))]
+    final = []
+    for n_round in range(max_rounds + 1):
+        points = set()
+        for lo, hi in active:
+            points.update(_corners(lo, hi))
+            points.add(_centre(lo, hi, is_int))
+        runner.run(points)
+        print(f'..adaptive round {n_round}: {len(active)} boxes, {len(runner.values)} points run')
+
+        splitting = []
+        for lo, hi in active:
+            error, value = _box_error(runner.values, lo, hi, is_int)
+            # a failed run gives a NaN error, which is never within tolerance
+            # but is no reason to split either
+            within = error <= tol + rtol * value
+            axis = _split_axis(lo, hi, scale, min_spacing, names, is_int)
+            if error > tol + rtol * value and axis is not None and n_round < max_rounds:
+                splitting.append((lo, hi, axis))
+            else:
+                final.append((lo, hi, error, within))
+        if not splitting:
+            break
+
+        active = []
+        for lo, hi, axis in splitting:
+            middle = _midpoint(lo[axis], hi[axis], is_int[axis])
+            left_hi, right_lo = hi.copy(), lo.copy()
+            left_hi[axis] = right_lo[axis] = middle
+            active += [(lo, left_hi), (right_lo, hi)]
+
+    result = runner.result(final)
+    np.savez(os.path.join(runner.batch_path, 'adaptive.npz'), **result)
+    converged = result['converged'].sum()
+    print(f'..{len(result["points"])} points, {converged} of {len(final)} boxes within tolerance')
+    return result
+
+class _RoundRunner:
+
+    def __init__(self, data_subdir, names, quantity, batch_kwargs):
+        self.data_subdir = data_subdir
+        self.batch_path = f'{run_tuv_batch.tuv_path}/OUTPUT/{data_subdir}'
+        self.names = names
+        self.quantity = quantity
+        self.batch_kwargs = batch_kwargs
+        self.values = {}
+        self.files = {}
+        self.rounds = 0
+
+    def run(self, points):
+        new = sorted(point for point in points if point not in self.values)
+        if not new:
+            return
+        round_subdir = f'{self.data_subdir}/round-{self.rounds}'
+        self.rounds += 1
+        sweep = Sweep().zip('point', **{name: [point[k] for point in new]
+                                        for k, name in enumerate(self.names)})
+        run_tuv_batch.batch_run(round_subdir, sweep=sweep, **self.batch_kwargs)
+        for k, point in enumerate(new):
+            filepath = f'{run_tuv_batch.tuv_path}/OUTPUT/{round_subdir}/data/usrout-{k}.txt'
+            self.files[point] = filepath
+            try:
+                value = np.asarray(self.quantity(read_usrout(filepath)), dtype=np.float64)
+            except OSError:
+                # a failed run, see the round's journal
+                value = np.asarray(np.nan)
+            self.values[point] = value
+
+    def result(self, final):
+        points = sorted(self.values)
+        shape = np.broadcast_shapes(*(value.shape for value in self.values.values()))
+        values = np.stack([np.broadcast_to(self.values[point], shape) for point in points])
+        return {'axes': np.array(self.names),
+                'points': np.array(points, dtype=np.float64).reshape(len(points), len(self.names)),
+                'values': values,
+                'files': np.array([self.files[point] for point in points]),
+                'box_lo': np.array([lo for lo, _, _, _ in final]),
+                'box_hi': np.array([hi for _, hi, _, _ in final]),
+                'box_error': np.array([error for _, _, error, _ in final]),
+                'converged': np.array([ok for _, _, _, ok in final], dtype=bool)}
+
+def _table_quantity(kind, column):
+    def quantity(output):
+        table = output.get(kind)
+        if table is None:
+            raise ValueError(f'No {kind} table in the output')
+        index = table.names.index(column) if isinstance(column, str) else column
+        return table.values[:, index]
+    return quantity
+
+def _key(values):
+    # usrinp holds values to 0.001, so points closer than that are the same run
+    return tuple(round(float(value), 3) for value in values)
+
+def _corners(lo, hi):
+    return [_key(corner) for corner in itertools.product(*zip(lo, hi))]
+
+def _midpoint(lo, hi, is_int):
+    middle = (lo + hi) / 2
+    return np.floor(middle) if is_int else middle
+
+def _centre(lo, hi, is_int):
+    return _key(_midpoint(a, b, i) for a, b, i in zip(lo, hi, is_int))
+
+def _box_error(values, lo, hi, is_int):
+    centre = _centre(lo, hi, is_int)
+    t = [(c - a) / (b - a) for a, b, c in zip(lo, hi, centre)]
+    predicted = 0.0
+    for corner, bits in zip(_corners(lo, hi), itertools.product((0, 1), repeat=len(lo))):
+        weight = np.prod([tk if bit else 1 - tk for tk, bit in zip(t, bits)])
+        predicted = predicted + weight * values[corner]
+    actual = values[centre]
+    return float(np.max(np.abs(actual - predicted))), float(np.max(np.abs(actual)))
+
+def _split_axis(lo, hi, scale, min_spacing, names, is_int):
+    # the widest axis, relative to its scale, that can still be halved
+    best = None
+    for axis, (a, b) in enumerate(zip(lo, hi)):
+        width = b - a
+        if is_int[axis] and width < 2:
+            continue
+        if names[axis] in min_spacing and width / 2 < min_spacing[names[axis]]:
+            continue
+        if best is None or width / scale[axis] > (hi[best] - lo[best]) / scale[best]:
+            best = axis
+    return best
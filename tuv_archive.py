@@ -0,0 +1,178 @@
+"""
+Zip archives of a batch's text outputs, written as the runs finish.
+
+With batch_run(..., output='archive') the usrout and tuvlog files of every
+run go into compressed zip files instead of data/ and log/:
+
+    {batch}/archive/{host}-{pid}-0000.zip    data/usrout-{label}.txt and log/tuvlog-{label}.txt
+    {batch}/archive/{host}-{pid}-0001.zip    of up to chunk_size runs per part
+    ...
+
+Each run is added as soon as it has been journalled, and its files are
+removed. A part is written as .zip.part and renamed when it is full or the
+batch ends, so a crash costs at most the runs of the open part. A resumed
+batch doesn't find those in the archive and runs them again. A .zip.part
+left behind by a crashed batch can be deleted. Part names include the host
+and process, so the shards of one batch can archive into the same directory
+at the same time.
+
+Zip keeps the directory of its members at the end of the file, so one
+output is read by seeking to it and decompressing just that member:
+
+    archive = BatchArchive('OUTPUT/seasonal/archive')
+    text = archive.read('usrout', '3-17')
+    output = archive.read_usrout('3-17', kinds=('irradiance',))
+    archive.extract_all('OUTPUT/seasonal')      # back to data/ and log/
+
+Members are deflated with zlib by default. Set compression = 'lzma' for
+smaller archives that are slower to write and read. Zip compresses every
+member on its own, so runs share no dictionary. Deflate's 32 kB window
+already spans the repeated headers and table layout within one usrout file.
+"""
+import io
+import os
+import shutil
+import socket
+import zipfile
+
+compression = 'deflate'
+compressions = {'deflate': zipfile.ZIP_DEFLATED, 'lzma': zipfile.ZIP_LZMA, 'none': zipfile.ZIP_STORED}
+
+folders = {'usrout': 'data', 'tuvlog': 'log'}
+
+def member_name(kind, label):
+    return f'{folders[kind]}/{kind}-{label}.txt'
+
+class BatchArchive:
+
+    def __init__(self, path, chunk_size=500):
+        self.path = path
+        self.chunk_size = chunk_size
+        os.makedirs(path, exist_ok=True)
+        self._prefix = f'{socket.gethostname()}-{os.getpid()}'
+        self._members = {}
+        self._parts = set()
+        self._readers = {}
+        self._writer = None
+        self._file = None
+        self._runs = 0
+        self._n_parts = 0
+        self.refresh()
+
+    def refresh(self):
+        """Pick up parts finished since the archive was opened, e.g. by other shards."""
+        for name in sorted(os.listdir(self.path)):
+            if not name.endswith('.zip') or name in self._parts:
+                continue
+            # only the directory at the end of the part is read
+            with zipfile.ZipFile(os.path.join(self.path, name)) as part:
+                for member in part.namelist():
+                    self._members[member] = name
+            self._parts.add(name)
+
+    def _open_part(self):
+        while True:
+            name = f'{self._prefix}-{self._n_parts:04d}.zip'
+            self._n_parts += 1
+            if not os.path.exists(os.path.join(self.path, name)):
+                break
+        self._name = name
+        self._file = open(os.path.join(self.path, f'{name}.part'), 'wb')
+        self._writer = zipfile.ZipFile(self._file, 'w', compressions[compression])
+
+    def add(self, label, output_filename, log_filename):
+        """Archive the outputs of one run and remove the files."""
+        if self._writer is None:
+            self._open_part()
+        for kind, filename in (('usrout', output_filename), ('tuvlog', log_filename)):
+            self._writer.write(filename, member_name(kind, label))
+        for filename in (output_filename, log_filename):
+            os.remove(filename)
+        self._added()
+
+    def copy(self, label, new_label):
+        """Archive the outputs of label once more, as new_label."""
+        if not self.has(label):
+            return False
+        if self.has(new_label):
+            return True
+        if self._writer is None:
+            self._open_part()
+        for kind in folders:
+            with self._reader(kind, label).open(member_name(kind, label)) as member:
+                self._writer.writestr(member_name(kind, new_label), member.read())
+        self._added()
+        return True
+
+    def _added(self):
+        self._runs += 1
+        if self._runs >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Finish the open part, making its runs part of the archive."""
+        if self._writer is None:
+            return
+        self._writer.close()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        part_path = os.path.join(self.path, self._name)
+        os.replace(f'{part_path}.part', part_path)
+        self._writer = self._file = None
+        self._runs = 0
+        self.refresh()
+
+    def close(self):
+        self.flush()
+        for part in self._readers.values():
+            part.close()
+        self._readers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def has(self, label):
+        return all(member_name(kind, label) in self._members for kind in folders)
+
+    def labels(self, kind='usrout'):
+        prefix = f'{folders[kind]}/{kind}-'
+        return [member[len(prefix):-4] for member in self._members if member.startswith(prefix)]
+
+    def _reader(self, kind, label):
+        try:
+            name = self._members[member_name(kind, label)]
+        except KeyError:
+            raise KeyError(f'No {kind} of run {label} in {self.path}') from None
+        if name not in self._readers:
+            self._readers[name] = zipfile.ZipFile(os.path.join(self.path, name))
+        return self._readers[name]
+
+    def open(self, kind, label):
+        """The text of one output file as an open file."""
+        return io.TextIOWrapper(self._reader(kind, label).open(member_name(kind, label)))
+
+    def read(self, kind, label):
+        with self.open(kind, label) as member:
+            return member.read()
+
+    def read_usrout(self, label, kinds=None):
+        """The usrout of one run, parsed like tuv_output.read_usrout."""
+        from tuv_output import parse_usrout
+        with self.open('usrout', label) as member:
+            return parse_usrout(member, kinds)
+
+    def extract(self, kind, label, filepath):
+        with self._reader(kind, label).open(member_name(kind, label)) as member, open(filepath, 'wb') as f:
+            shutil.copyfileobj(member, f)
+
+    def extract_all(self, batch_path):
+        """Write every archived output back to {batch_path}/data and log."""
+        for folder in folders.values():
+            os.makedirs(os.path.join(batch_path, folder), exist_ok=True)
+        for member in self._members:
+            kind, _, label = os.path.basename(member)[:-4].partition('-')
+            self.extract(kind, label, os.path.join(batch_path, member))
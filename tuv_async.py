@@ -0,0 +1,113 @@
+"""
+Run a batch with asyncio instead of a process pool.
+
+TUV runs as a separate executable, so the Python side of a batch only waits
+on subprocesses. batch_run_async keeps up to `concurrency` TUV processes
+running from one event loop, each in its own workspace, and gives every run
+a timeout. Failed runs are classified from TUV's console output and tuvlog
+(see run_tuv_batch.classify_failure): timeouts, crashes and runs without
+output are retried with exponential backoff, while Fortran runtime errors
+and inputs TUV rejects fail straight away, since the same inputs would fail
+again. Failures are recorded in the batch journal and the batch carries on.
+
+    import asyncio
+    from tuv_async import batch_run_async
+    asyncio.run(batch_run_async('example-async', concurrency=8, timeout=300,
+                                iterable_i='lat', lat=lat_range, nt=1))
+"""
+import os
+import time
+import shutil
+import asyncio
+import subprocess
+import run_tuv_batch
+from modify_usrinp import modifyInput
+from tuv_workspace import create_workspace, batch_root, workspace_outputs
+from run_tuv_batch import (TuvRunError, classify_failure, permanent_failures,
+                           _setup_batch, _stage, _complete_run, _fail_run, _report_batch,
+                           _close_batch, _link_repeats, _index_batch)
+
+async def batch_run_async(data_subdir, concurrency=4, timeout=None, retries=2, backoff=1.0,
+                          scratch_root=None, cache=None, resume=False, output='text',
+                          sweep=None, shard=None, collapse_time=False, metrics=False,
+                          local_scratch=None, cost_model=None, preflight=True, want=None,
+                          extend=False, index=None, **kwargs):
+    batch = _setup_batch(data_subdir, cache, resume, output, sweep, shard, collapse_time,
+                         metrics, local_scratch, cost_model, preflight, want, extend, kwargs)
+    if batch.cost is not None and concurrency > 1:
+        batch = batch._replace(runs=iter(batch.cost.order(batch.runs)))
+    tuv_path = run_tuv_batch.tuv_path
+    if scratch_root is None:
+        scratch_root = f'{tuv_path}/WORKSPACES'
+
+    if batch.workspaces is not None:
+        workdirs = [batch.workspaces.workspace(n) for n in range(concurrency)]
+    else:
+        root = batch_root(scratch_root)
+        workdirs = [create_workspace(tuv_path, root, n) for n in range(concurrency)]
+    try:
+        # one coroutine per workspace, all pulling from the same lazy plan
+        await asyncio.gather(*(_work(workdir, batch, timeout, retries, backoff)
+                               for workdir in workdirs))
+    finally:
+        if batch.workspaces is None:
+            shutil.rmtree(root, ignore_errors=True)
+        _close_batch(batch)
+
+    _link_repeats(batch)
+    _index_batch(os.path.dirname(batch.journal.filepath), index)
+    _report_batch(batch)
+
+async def _work(workdir, batch, timeout, retries, backoff):
+    for run in batch.runs:
+        staged = _stage(run, batch)
+        for attempt in range(retries + 1):
+            try:
+                timings = await run_point_async(run.inputs, staged.output_filename,
+                                                staged.log_filename, workdir, timeout)
+            except TuvRunError as error:
+                if error.kind in permanent_failures or attempt == retries:
+                    _fail_run(run, error, batch)
+                    break
+                print(f'..iteration {run.iteration+1} failed ({error}), retrying')
+                await asyncio.sleep(backoff * 2**attempt)
+                continue
+            _complete_run(run, batch, timings, staged)
+            print(f'TUV Run: {run.iteration+1}/{batch.total_iterations}'.center(20))
+            break
+
+async def run_point_async(input_dict, output_filename, log_filename, workdir, timeout=None):
+    usrinp_filename = os.path.join(workdir, 'INPUTS', 'usrinp')
+    usrout_filename, tuvlog_filename = workspace_outputs(workdir)
+
+    started = time.perf_counter()
+    modifyInput(input_dict, usrinp_filename)
+    for filename in (usrout_filename, tuvlog_filename):
+        if os.path.exists(filename):
+            os.remove(filename)
+
+    rendered = time.perf_counter()
+    process = await asyncio.create_subprocess_exec('./tuv', cwd=workdir,
+                                                   stdout=subprocess.PIPE,
+                                                   stderr=subprocess.STDOUT)
+    try:
+        console, _ = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise TuvRunError('timeout', f'no result after {timeout} s')
+
+    finished = time.perf_counter()
+    failure = classify_failure(process.returncode, console, usrout_filename, tuvlog_filename)
+    if failure is not None:
+        raise TuvRunError(*failure)
+
+    output_bytes = os.path.getsize(usrout_filename) + os.path.getsize(tuvlog_filename)
+    os.rename(usrout_filename, output_filename)
+    os.rename(tuvlog_filename, log_filename)
+
+    # several TUV processes share RUSAGE_CHILDREN here, so no CPU times
+    return {'render_s': rendered - started,
+            'run_s': finished - rendered,
+            'move_s': time.perf_counter() - finished,
+            'output_bytes': output_bytes}
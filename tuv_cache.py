@@ -0,0 +1,124 @@
+"""
+Content-addressed cache of TUV results.
+
+A run is identified by the full set of TUV inputs, formatted exactly as they
+are written to usrinp (so 300.0001 and 300.0 are the same run), together
+with a fingerprint of the tuv executable. Cached outputs are stored as
+
+    {root}/{key[:2]}/{key}/usrout.txt
+    {root}/{key[:2]}/{key}/tuvlog.txt
+
+and handed back by hardlinking (or copying, across filesystems) into the
+batch output directories. The modification time of an entry directory
+records when it was last used; once the cache grows past max_bytes the least
+recently used entries are evicted.
+"""
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+from collections import OrderedDict
+from modify_usrinp import formatInputs
+from tuv_workspace import link_or_copy
+
+_fingerprints = {}
+
+def binary_fingerprint(filepath):
+    # hashing the executable is cheap but not free, so remember it per version
+    stat = os.stat(filepath)
+    memo_key = (os.path.realpath(filepath), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _fingerprints:
+        digest = hashlib.sha256()
+        with open(filepath, 'rb') as binary:
+            for block in iter(lambda: binary.read(1 << 20), b''):
+                digest.update(block)
+        _fingerprints[memo_key] = digest.hexdigest()
+    return _fingerprints[memo_key]
+
+def inputs_key(input_dict, fingerprint=''):
+    normalized = json.dumps(formatInputs(input_dict), sort_keys=True)
+    return hashlib.sha256(f'{fingerprint}\n{normalized}'.encode()).hexdigest()
+
+class ResultCache:
+
+    def __init__(self, root, max_bytes=10 * 2**30):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(root, exist_ok=True)
+        self._entries = self._scan()
+        self.size = sum(self._entries.values())
+
+    def _scan(self):
+        # rebuild the LRU order from the entry directory modification times
+        found = []
+        for prefix in os.scandir(self.root):
+            if not prefix.is_dir() or len(prefix.name) != 2:
+                continue
+            for entry in os.scandir(prefix.path):
+                if entry.name.startswith('.'):
+                    continue
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                found.append((entry.stat().st_mtime, entry.name, size))
+        found.sort()
+        return OrderedDict((key, size) for _, key, size in found)
+
+    def _entry_path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def fetch(self, key, output_filename, log_filename):
+        entry_path = self._entry_path(key)
+        if not os.path.isdir(entry_path):
+            self._entries.pop(key, None)
+            self.misses += 1
+            return False
+        if key not in self._entries:
+            # stored by another process sharing this cache
+            size = sum(f.stat().st_size for f in os.scandir(entry_path))
+            self._entries[key] = size
+            self.size += size
+        link_or_copy(os.path.join(entry_path, 'usrout.txt'), output_filename)
+        link_or_copy(os.path.join(entry_path, 'tuvlog.txt'), log_filename)
+        os.utime(entry_path)
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True
+
+    def store(self, key, output_filename, log_filename):
+        if key in self._entries:
+            return
+        entry_path = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+
+        # build the entry next to its final location and rename it into place,
+        # so readers in other processes never see half-written entries
+        staging = tempfile.mkdtemp(prefix=f'.{key}-', dir=os.path.dirname(entry_path))
+        link_or_copy(output_filename, os.path.join(staging, 'usrout.txt'))
+        link_or_copy(log_filename, os.path.join(staging, 'tuvlog.txt'))
+        try:
+            os.rename(staging, entry_path)
+        except OSError:
+            # another batch stored the same run first
+            shutil.rmtree(staging, ignore_errors=True)
+
+        size = os.path.getsize(output_filename) + os.path.getsize(log_filename)
+        self._entries[key] = size
+        self.size += size
+        self._evict()
+
+    def _evict(self):
+        while self.size > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            shutil.rmtree(self._entry_path(key), ignore_errors=True)
+            self.size -= size
+            self.evictions += 1
+
+    def stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self.size}
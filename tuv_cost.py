@@ -0,0 +1,138 @@
+"""
+Runtime model of TUV for scheduling and sizing batches.
+
+TUV's cost grows with the number of times, altitude levels and wavelength
+intervals it computes, by how many streams the radiative transfer uses
+(nstr, 2-stream below 2) and with the photolysis rate calculation (ljvals).
+CostModel records the TUV runtime of every run of a batch, with the inputs
+that drive it, to a JSON lines file shared between batches, and fits
+
+    seconds = c0 + c1 nt + (c2 + c3 streams + c4 ljvals) nt nz nw
+
+by least squares. With fewer than min_records runs on record it falls back
+to one constant times nt nz nw, and with none it can still rank runs by that
+product but not predict seconds.
+
+batch_run(..., cost_model=True) records to OUTPUT/runtimes.jsonl, dispatches
+parallel batches longest-expected-first so no worker is left with a long run
+at the end, and with dry_run=True only prints and returns the prediction.
+"""
+import os
+import json
+import heapq
+import numpy as np
+from modify_usrinp import formatVarType
+
+min_records = 10
+
+def features(inputs):
+    # integers may come as floats, from a NumPy axis or an older record ('5.0')
+    nt = max(int(float(inputs['nt'])), 1)
+    nz = max(int(float(inputs['nz'])), 1)
+    # nwint < 0 is TUV's standard grid of |nwint| intervals
+    nw = max(abs(int(float(inputs['nwint']))), 1)
+    nstr = int(float(inputs['nstr']))
+    streams = nstr if nstr >= 2 else 1
+    ljvals = 1.0 if str(inputs['ljvals'])[:1] in 'Tt' else 0.0
+    work = nt * nz * nw
+    return [1.0, nt, work, work * streams, work * ljvals]
+
+class CostModel:
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self._file = None
+        self.coef = None
+        self.n_records = 0
+        self.fit()
+
+    def record(self, inputs, seconds):
+        if self._file is None:
+            self._file = open(self.filepath, 'a', buffering=1)
+        # as usrinp got them
+        record = {name: formatVarType(name, inputs[name]) for name in ('nt', 'nz', 'nwint', 'nstr', 'ljvals')}
+        record['run_s'] = seconds
+        self._file.write(json.dumps(record) + '\n')
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def fit(self):
+        X = []
+        y = []
+        skipped = 0
+        if os.path.exists(self.filepath):
+            with open(self.filepath) as records:
+                for line in records:
+                    try:
+                        record = json.loads(line)
+                        x = features(record)
+                        seconds = float(record['run_s'])
+                    except (ValueError, KeyError, TypeError):
+                        skipped += 1
+                        continue
+                    X.append(x)
+                    y.append(seconds)
+        if skipped:
+            print(f'..cost model: skipped {skipped} unreadable records in {self.filepath}')
+        self.n_records = len(y)
+        if not y:
+            self.coef = None
+            return self
+        X = np.array(X)
+        y = np.array(y)
+        self.floor = y.min()
+        if len(y) >= min_records:
+            self.coef = np.linalg.lstsq(X, y, rcond=None)[0]
+        else:
+            self.coef = np.zeros(X.shape[1])
+            self.coef[2] = y.sum() / X[:, 2].sum()
+        return self
+
+    def predict(self, inputs):
+        """Expected seconds, or relative cost if nothing has been recorded yet."""
+        x = features(inputs)
+        if self.coef is None:
+            return float(x[2])
+        return max(float(np.dot(self.coef, x)), self.floor)
+
+    def order(self, runs):
+        # longest first; this plans the whole batch up front
+        return sorted(runs, key=lambda run: self.predict(run.inputs), reverse=True)
+
+    def predict_batch(self, inputs, workers=1):
+        """
+        Predict a batch from the inputs of its runs. The wall time assumes
+        longest-first dispatch to workers that each take the next run as
+        soon as they are free.
+        """
+        costs = sorted((self.predict(run_inputs) for run_inputs in inputs), reverse=True)
+        finish = [0.0] * max(workers, 1)
+        for cost in costs:
+            heapq.heapreplace(finish, finish[0] + cost)
+        prediction = {'runs': len(costs),
+                      'workers': max(workers, 1),
+                      'records': self.n_records,
+                      'tuv_seconds': None,
+                      'wall_seconds': None}
+        if self.coef is not None:
+            prediction['tuv_seconds'] = sum(costs)
+            prediction['wall_seconds'] = max(finish) if costs else 0.0
+        return prediction
+
+def describe(prediction):
+    if prediction['wall_seconds'] is None:
+        return (f'{prediction["runs"]} runs; no runtimes recorded yet, so no time prediction '
+                f'(run a batch with cost_model=True first)')
+    return (f'{prediction["runs"]} runs, {_duration(prediction["tuv_seconds"])} of TUV time, '
+            f'{_duration(prediction["wall_seconds"])} wall time with {prediction["workers"]} '
+            f'worker(s) (model fit on {prediction["records"]} runs)')
+
+def _duration(seconds):
+    if seconds < 120:
+        return f'{seconds:.1f} s'
+    if seconds < 7200:
+        return f'{seconds/60:.1f} min'
+    return f'{seconds/3600:.1f} h'
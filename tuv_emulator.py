@@ -0,0 +1,235 @@
+"""
+Lookup-table emulator of TUV built from a finished sweep.
+
+A sweep over a regular grid of parameters (say imonth x lat x o3col) already
+holds everything needed to answer questions in between its points. An
+Emulator keeps one quantity of the sweep as an array over the grid and
+interpolates it, one dimension at a time, for any number of query points in
+one vectorized call:
+
+    emulator = Emulator.from_store('OUTPUT/seasonal/store', 'dose_rates',
+                                   column='UV-B, 280-315 nm', time=12)
+    uvb = emulator(imonth=months, lat=lats, o3col=columns)   # arrays, broadcast together
+    emulator.error                                           # held-out error estimate
+
+Queries outside the grid return NaN. Dimensions of the quantity that are not
+selected away (e.g. wavelength for irradiance) are kept as trailing
+dimensions of the result. Interpolation is multilinear by default, or a
+cubic Hermite spline with method='cubic'; grids don't need to be evenly
+spaced.
+
+The error estimate comes from the sweep itself: every other grid point along
+each axis is held out, the held-out points are predicted from the rest, and
+the differences are summarized. The held-out emulator has twice the grid
+spacing, so for smooth quantities the estimate is an upper bound, roughly 4x
+the error of the full emulator for linear interpolation.
+"""
+import json
+import itertools
+import numpy as np
+from tuv_output import iter_usrout
+from tuv_store import BatchStore
+
+methods = ('linear', 'cubic')
+
+class Emulator:
+
+    def __init__(self, axes, values, tail=None, method='linear'):
+        """
+        axes is a list of (name, coordinates) pairs for the leading
+        dimensions of values; tail optionally names the coordinates of the
+        remaining dimensions, as (name, coordinates) pairs.
+        """
+        if method not in methods:
+            raise ValueError(f'Unknown interpolation method: "{method}"')
+        values = np.asarray(values, dtype=np.float64)
+        self.axes = []
+        for dim, (name, coords) in enumerate(axes):
+            coords = np.asarray(coords, dtype=np.float64)
+            if coords.ndim != 1 or len(coords) != values.shape[dim]:
+                raise ValueError(f'Axis "{name}" has {coords.size} coordinates '
+                                 f'for {values.shape[dim]} grid points')
+            # keep every axis ascending
+            order = np.argsort(coords, kind='stable')
+            if np.any(order != np.arange(len(coords))):
+                values = np.take(values, order, axis=dim)
+                coords = coords[order]
+            if np.any(np.diff(coords) == 0):
+                raise ValueError(f'Axis "{name}" has repeated coordinates')
+            self.axes.append((name, coords))
+        self.values = values
+        self.tail = list(tail or [])
+        self.method = method
+        self._error = None
+
+    @property
+    def names(self):
+        return [name for name, _ in self.axes]
+
+    @property
+    def shape(self):
+        return self.values.shape[:len(self.axes)]
+
+    @classmethod
+    def from_store(cls, store, quantity, method='linear', **selection):
+        """
+        One quantity of a batch saved with output='store'. selection picks
+        rows and columns as in BatchStore.sel, e.g. column='UV-B, 280-315 nm'
+        or wavelength=slice(300, 320).
+        """
+        if isinstance(store, str):
+            store = BatchStore(store)
+        grid = [name for name, _ in store.axes]
+        for name in grid:
+            if name in selection:
+                raise ValueError(f'"{name}" is a grid axis and is interpolated, not selected')
+        values, coords = store.sel(quantity, **selection)
+        axes = [(name, coords[name]) for name in grid]
+        tail = [(dim, values_) for dim, values_ in coords.items() if dim not in grid]
+        return cls(axes, values, tail, method)
+
+    @classmethod
+    def from_outputs(cls, data_dir, sweep, kind, method='linear'):
+        """
+        The first table of one kind from the usrout text files of a batch,
+        given the Sweep that produced it.
+        """
+        values = None
+        tail = None
+        for label, output in iter_usrout(data_dir, kinds=(kind,)):
+            table = output.get(kind)
+            if table is None:
+                continue
+            if values is None:
+                values = np.full(sweep.shape + table.values.shape, np.nan)
+                row_dim, rows = next(iter(table.coords.items())) if table.coords else ('row', table.row_names)
+                tail = [(row_dim, rows), ('column', table.names)]
+            values[tuple(int(part) for part in label.split('-'))] = table.values
+        if values is None:
+            raise ValueError(f'No {kind} tables found in {data_dir}')
+        axes = []
+        for axis in sweep.axes:
+            coord = axis.name if axis.name in axis.params else next(iter(axis.params))
+            axes.append((axis.name, axis.params[coord]))
+        return cls(axes, values, tail, method)
+
+    def __call__(self, **coords):
+        missing = [name for name in self.names if name not in coords]
+        if missing:
+            raise AttributeError(f'Missing query coordinate: "{missing[0]}"')
+        extra = [name for name in coords if name not in self.names]
+        if extra:
+            raise AttributeError(f'Invalid parameter name: "{extra[0]}"')
+        query = np.broadcast_arrays(*(np.asarray(coords[name], dtype=np.float64) for name in self.names))
+        shape = query[0].shape
+        points = np.stack([q.ravel() for q in query], axis=-1)
+        return self.query(points).reshape(shape + self.values.shape[len(self.axes):])
+
+    def query(self, points, chunk_size=65536):
+        """Interpolate at an (n, ndims) array of points, in axis order."""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, len(self.axes))
+        result = np.empty((len(points),) + self.values.shape[len(self.axes):])
+        # bounded chunks keep the temporary corner arrays small
+        for start in range(0, len(points), chunk_size):
+            result[start:start + chunk_size] = self._interpolate(points[start:start + chunk_size])
+        return result
+
+    def _interpolate(self, points):
+        stencils = [_stencil(coords, points[:, dim], self.method)
+                    for dim, (_, coords) in enumerate(self.axes)]
+        tail_ndim = self.values.ndim - len(self.axes)
+        result = 0.0
+        for corner in itertools.product(*(range(index.shape[1]) for index, _ in stencils)):
+            index = tuple(stencils[dim][0][:, k] for dim, k in enumerate(corner))
+            weight = np.prod([stencils[dim][1][:, k] for dim, k in enumerate(corner)], axis=0)
+            result = result + self.values[index] * weight.reshape((-1,) + (1,) * tail_ndim)
+        return result
+
+    @property
+    def error(self):
+        if self._error is None:
+            self._error = self.held_out_error()
+        return self._error
+
+    def held_out_error(self):
+        """
+        Predict every other grid point from the remaining ones. Returns the
+        max and RMS absolute error and max relative error over the held-out
+        points, each with the trailing shape of the quantity.
+        """
+        keep = []
+        for _, coords in self.axes:
+            kept = np.arange(0, len(coords), 2)
+            if kept[-1] != len(coords) - 1:
+                kept = np.append(kept, len(coords) - 1)
+            keep.append(kept)
+        if all(len(kept) == len(coords) for kept, (_, coords) in zip(keep, self.axes)):
+            raise ValueError('Every axis needs at least 3 points to hold any out')
+
+        coarse = Emulator([(name, coords[kept]) for kept, (name, coords) in zip(keep, self.axes)],
+                          self.values[np.ix_(*keep)], self.tail, self.method)
+        held = np.ones(self.shape, dtype=bool)
+        held[np.ix_(*keep)] = False
+        index = np.nonzero(held)
+        points = np.stack([coords[i] for i, (_, coords) in zip(index, self.axes)], axis=-1)
+
+        truth = self.values[index]
+        difference = np.abs(coarse.query(points) - truth)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            relative = np.where(truth != 0, difference / np.abs(truth), np.nan)
+        return {'points': len(points),
+                'max_abs': np.nanmax(difference, axis=0),
+                'rms': np.sqrt(np.nanmean(difference**2, axis=0)),
+                'max_rel': np.nanmax(relative, axis=0)}
+
+    def save(self, filepath):
+        meta = {'axes': self.names, 'tail': [name for name, _ in self.tail], 'method': self.method}
+        arrays = {f'axis_{i}': coords for i, (_, coords) in enumerate(self.axes)}
+        arrays.update({f'tail_{i}': np.asarray(coords) for i, (_, coords) in enumerate(self.tail)})
+        np.savez(filepath, values=self.values, meta=json.dumps(meta), **arrays)
+
+    @classmethod
+    def load(cls, filepath):
+        with np.load(filepath) as saved:
+            meta = json.loads(str(saved['meta']))
+            axes = [(name, saved[f'axis_{i}']) for i, name in enumerate(meta['axes'])]
+            tail = [(name, saved[f'tail_{i}']) for i, name in enumerate(meta['tail'])]
+            return cls(axes, saved['values'], tail, meta['method'])
+
+def _stencil(coords, x, method):
+    """
+    Grid indices and weights of the points each query value is interpolated
+    from along one axis, as two (n, k) arrays. Values outside the axis get
+    NaN weights.
+    """
+    n = len(coords)
+    if n == 1:
+        weight = np.where(x == coords[0], 1.0, np.nan)
+        return np.zeros((len(x), 1), dtype=np.intp), weight[:, None]
+
+    i = np.clip(np.searchsorted(coords, x, side='right') - 1, 0, n - 2)
+    x0 = coords[i]
+    dx = coords[i + 1] - x0
+    t = (x - x0) / dx
+    outside = (x < coords[0]) | (x > coords[-1]) | np.isnan(x)
+
+    if method == 'linear':
+        index = np.stack([i, i + 1], axis=-1)
+        weight = np.stack([1 - t, t], axis=-1)
+    else:
+        # cubic Hermite with finite difference slopes, one-sided at the ends:
+        # the slope at i is (y[i+1] - y[i-1]) / (x[i+1] - x[i-1]), with
+        # indices clamped to the grid, so the weights fall on i-1 .. i+2
+        lo = np.maximum(i - 1, 0)
+        hi = np.minimum(i + 2, n - 1)
+        h00 = 2*t**3 - 3*t**2 + 1
+        h10 = t**3 - 2*t**2 + t
+        h01 = -2*t**3 + 3*t**2
+        h11 = t**3 - t**2
+        c0 = h10 * dx / (coords[i + 1] - coords[lo])
+        c1 = h11 * dx / (coords[hi] - coords[i])
+        index = np.stack([lo, i, i + 1, hi], axis=-1)
+        weight = np.stack([-c0, h00 - c1, h01 + c0, c1], axis=-1)
+
+    weight[outside] = np.nan
+    return index, weight
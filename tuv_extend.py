@@ -0,0 +1,140 @@
+"""
+Extending a finished batch with more points instead of running it again.
+
+Output files are named by their position in the sweep (usrout-3-5.txt), so
+adding o3col values or halving the latitude step moves most points to new
+labels. With batch_run(..., extend=True) the points are matched by their
+inputs instead. Every run in the journal whose constant inputs equal the
+new batch's is keyed by the usrinp values of the swept parameters. Each
+point of the new sweep with a matching key takes over that run's files
+under its new label, and only the points without a match are run.
+
+Relabelling goes through a staging directory so that a crash leaves the
+batch either as it was or fully relabelled:
+
+    {batch}/.extend/           new links to the kept outputs, under their new labels
+    {batch}/manifest.json      the sweep of the batch and a generation number
+    {batch}/dropped/{gen}/     outputs of generation gen not in the new sweep,
+                               with the journal that describes them
+
+The staged links are made first. The rewritten journal and then the
+manifest are put in place with atomic renames. Only then are the staged
+files moved into data/ and log/. If a batch is found with a staging
+directory of the manifest's generation, the move is finished. A staging
+directory of any other generation is thrown away.
+"""
+import os
+import json
+import shutil
+from modify_usrinp import formatInputs, formatVarType
+from tuv_journal import RunJournal
+
+def read_manifest(batch_path):
+    try:
+        with open(os.path.join(batch_path, 'manifest.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'generation': 0, 'sweep': None}
+
+def extend_outputs(batch_path, input_dict, sweep):
+    """
+    Relabel the outputs of the batch in batch_path for a new sweep and
+    rewrite its journal to match. Returns the number of points kept.
+    """
+    _recover(batch_path)
+    journal_path = os.path.join(batch_path, 'journal.jsonl')
+    params = sweep.params
+    constants = formatInputs({name: value for name, value in input_dict.items() if name not in params})
+    found = {}
+    for record in RunJournal(journal_path).completed().values():
+        inputs = record['inputs']
+        if any(inputs.get(name) != value for name, value in constants.items()):
+            continue
+        if all(name in inputs for name in params):
+            found[tuple(inputs[name] for name in params)] = record
+
+    generation = read_manifest(batch_path)['generation'] + 1
+    staging = os.path.join(batch_path, '.extend')
+    shutil.rmtree(staging, ignore_errors=True)
+    records = []
+    names = []
+    reused = set()
+    if found:
+        for folder in ('data', 'log'):
+            os.makedirs(os.path.join(staging, folder))
+        for point in sweep.points():
+            record = found.get(tuple(formatVarType(name, point.values[name]) for name in params))
+            if record is None:
+                continue
+            links = [(os.path.join(batch_path, folder, f'{kind}-{record["label"]}.txt'),
+                      os.path.join(folder, f'{kind}-{point.label}.txt'))
+                     for kind, folder in (('usrout', 'data'), ('tuvlog', 'log'))]
+            if not all(os.path.exists(src) for src, _ in links):
+                continue
+            for src, name in links:
+                os.link(src, os.path.join(staging, name))
+                names.append(name)
+                reused.add(os.path.relpath(src, batch_path))
+            records.append({**record, 'iteration': point.flat, 'label': point.label})
+    else:
+        os.makedirs(staging)
+    with open(os.path.join(staging, 'generation.json'), 'w') as f:
+        json.dump({'generation': generation, 'files': names, 'reused': sorted(reused)}, f)
+
+    # the old journal goes with the outputs that drop out
+    dropped = os.path.join(batch_path, 'dropped', str(generation - 1))
+    if os.path.exists(journal_path):
+        os.makedirs(dropped, exist_ok=True)
+        shutil.copyfile(journal_path, os.path.join(dropped, 'journal.jsonl'))
+    _replace(journal_path, ''.join(json.dumps(record) + '\n' for record in records))
+    # from here on the staged files are the batch's outputs
+    _replace(os.path.join(batch_path, 'manifest.json'),
+             json.dumps({'generation': generation, 'sweep': sweep.to_dict()}))
+    _recover(batch_path)
+    print(f'..extending: {len(records)} of {len(sweep)} points already run')
+    return len(records)
+
+def _replace(filepath, text):
+    with open(f'{filepath}.part', 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f'{filepath}.part', filepath)
+
+def _recover(batch_path):
+    staging = os.path.join(batch_path, '.extend')
+    if not os.path.isdir(staging):
+        return
+    try:
+        with open(os.path.join(staging, 'generation.json')) as f:
+            staged = json.load(f)
+    except (FileNotFoundError, ValueError):
+        staged = None
+    generation = read_manifest(batch_path)['generation']
+    if staged is None or staged['generation'] != generation:
+        # relabelling never got as far as the manifest
+        shutil.rmtree(staging)
+        return
+
+    keep = set(staged['files'])
+    reused = set(staged['reused'])
+    dropped = os.path.join(batch_path, 'dropped', str(generation - 1))
+    for folder in ('data', 'log', 'combined'):
+        source = os.path.join(batch_path, folder)
+        if not os.path.isdir(source):
+            continue
+        for entry in os.scandir(source):
+            name = os.path.join(folder, entry.name)
+            if name in keep and not os.path.exists(os.path.join(staging, name)):
+                # moved in from staging already
+                continue
+            if name in reused:
+                # staged under its new label
+                os.remove(entry.path)
+                continue
+            os.makedirs(os.path.join(dropped, folder), exist_ok=True)
+            os.replace(entry.path, os.path.join(dropped, folder, entry.name))
+    for name in staged['files']:
+        if os.path.exists(os.path.join(staging, name)):
+            os.replace(os.path.join(staging, name), os.path.join(batch_path, name))
+    shutil.rmtree(staging)
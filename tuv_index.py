@@ -0,0 +1,320 @@
+"""
+An index of every run of every batch, in one SQLite file.
+
+    index = RunIndex()                          # {tuv_path}/OUTPUT/index.sqlite
+    index.backfill()                            # every batch under OUTPUT, in parallel
+    index.find(lat=42.5, imonth=7, o3col=310)   # has this been run, and where?
+    index.find(lat=(30, 60), imonth=6)          # 30 <= lat <= 60 in June
+    index.count(lat=(30, 60), imonth=6)         # without fetching them
+    index.find('lat BETWEEN 30 AND 60 AND imonth = 6 AND taucld > 0')
+
+Each run (each point of a collapsed time run) is one row, holding:
+
+    batch, label      the batch directory and the run's label in it
+    output, usrout    text, store or archive, and the usrout file, store or archive
+    tuv_sha256        SHA-256 of the tuv executable that made it
+    run_s             seconds TUV took
+    lat, imonth, ...  every input in its own column, typed as in var_types
+
+Float inputs are stored as usrinp holds them, to three decimals, and find()
+matches a float within half of that. find() gives each run's inputs back as
+the dictionary batch_run wrote to usrinp and the journal. The parameters
+sweeps vary most (index_columns) have an index each, and the usual pairs
+such as imonth and lat one together, so a range query over them takes
+milliseconds even across millions of runs. Building the dicts find()
+returns takes longer than the query when it matches thousands of runs.
+
+A batch is read from its journal.jsonl. The index remembers how far into
+each journal it has read, so an update only reads new lines. A journal
+that was replaced (by extend=True) is read again from the start. Batches
+from before the journal are read from the input table TUV echoes at the
+top of every usrout file. Runtimes come from the journal, or else from
+metrics.jsonl. The executable's hash is known only for batches indexed by
+batch_run(..., index=True), which updates the index with its batch when it
+finishes. backfill() leaves the hash empty.
+
+From the command line (see run_tuv_batch.py):
+
+    python -m run_tuv_batch index                 # backfill OUTPUT
+    python -m run_tuv_batch find "lat BETWEEN 30 AND 60 AND imonth = 6"
+"""
+import os
+import json
+import time
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from modify_usrinp import var_types, formatVarType
+
+sql_types = {'float': 'REAL', 'int': 'INTEGER', 'bool': 'INTEGER', 'str': 'TEXT'}
+
+# an index can serve one range, after any number of equalities, so the
+# usual pairs of a sweep get one of their own
+index_columns = ('lat', 'lon', 'iyear', 'imonth', 'iday', 'tstart', 'o3col', 'so2col', 'no2col',
+                 'taucld', 'tauaer', 'alsurf', 'zout', 'nwint',
+                 ('imonth', 'lat'), ('iyear', 'imonth', 'iday', 'lat'), ('lat', 'lon'))
+
+run_columns = ('batch', 'label', 'iteration', 'output', 'usrout', 'tuv_sha256', 'run_s', 'indexed')
+
+# folders inside a batch that never hold another batch
+batch_folders = {'data', 'log', 'combined', 'store', 'archive', 'dropped', '.extend', 'chunks'}
+
+def default_path():
+    import run_tuv_batch
+    return os.path.join(run_tuv_batch.tuv_path, 'OUTPUT', 'index.sqlite')
+
+class RunIndex:
+
+    def __init__(self, path=None):
+        self.path = path or default_path()
+        self.db = sqlite3.connect(self.path)
+        # several batches may update the index at once
+        self.db.execute('PRAGMA busy_timeout = 60000')
+        self.db.execute('PRAGMA journal_mode = WAL')
+        columns = ', '.join(f'"{name}" {sql_types[kind]}' for name, kind in var_types.items())
+        with self.db:
+            self.db.execute(f'CREATE TABLE IF NOT EXISTS runs (batch TEXT NOT NULL, label TEXT NOT NULL, '
+                            f'iteration INTEGER, output TEXT, usrout TEXT, tuv_sha256 TEXT, run_s REAL, '
+                            f'indexed REAL, {columns}, PRIMARY KEY (batch, label))')
+            self.db.execute('CREATE TABLE IF NOT EXISTS batches (batch TEXT PRIMARY KEY, '
+                            'journal_inode INTEGER, journal_offset INTEGER, tuv_sha256 TEXT)')
+            for names in index_columns:
+                names = (names,) if isinstance(names, str) else names
+                indexed = ', '.join(f'"{name}"' for name in names)
+                self.db.execute(f'CREATE INDEX IF NOT EXISTS runs_{"_".join(names)} ON runs ({indexed})')
+
+    def close(self):
+        # keeps the statistics the query planner picks indexes by up to date
+        self.db.execute('PRAGMA optimize')
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _position(self, batch_path):
+        row = self.db.execute('SELECT journal_inode, journal_offset, tuv_sha256 FROM batches WHERE batch = ?',
+                              (batch_path,)).fetchone()
+        return tuple(row) if row is not None else None
+
+    def update(self, batch_path, tuv_sha256=None):
+        """Index the runs of one batch that are new since it was last indexed."""
+        batch_path = os.path.abspath(batch_path)
+        self._write(_scan_batch(batch_path, self._position(batch_path), tuv_sha256))
+
+    def backfill(self, root=None, workers=None):
+        """Index every batch under root (OUTPUT by default), reading workers batches at a time."""
+        if root is None:
+            root = os.path.dirname(self.path)
+        batches = find_batches(root)
+        n_runs = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            scans = pool.map(_scan_batch, batches, [self._position(path) for path in batches])
+            for scan in scans:
+                n_runs += self._write(scan)
+        self.db.execute('ANALYZE')
+        print(f'..indexed {n_runs} runs of {len(batches)} batches in {self.path}')
+        return n_runs
+
+    def _write(self, scan):
+        batch_path, position, restart, rows, failed = scan
+        names = run_columns + tuple(var_types)
+        columns = ', '.join(f'"{name}"' for name in names)
+        now = time.time()
+        with self.db:
+            if restart:
+                self.db.execute('DELETE FROM runs WHERE batch = ?', (batch_path,))
+            self.db.executemany('DELETE FROM runs WHERE batch = ? AND label = ?',
+                                ((batch_path, label) for label in failed))
+            self.db.executemany(f'INSERT OR REPLACE INTO runs ({columns}) VALUES ({", ".join("?" * len(names))})',
+                                ((batch_path, *row[:6], now, *row[6:]) for row in rows))
+            self.db.execute('INSERT OR REPLACE INTO batches VALUES (?, ?, ?, ?)', (batch_path, *position))
+        return len(rows)
+
+    def find(self, where=None, limit=None, **conditions):
+        """
+        Runs matching every condition, as dicts. A condition on an input is
+        a value, a (low, high) range with both ends included, or a list of
+        values. where adds an SQL condition of its own.
+        """
+        clauses, params = _conditions(where, conditions)
+        columns = ', '.join(f'"{name}"' for name in run_columns + tuple(var_types))
+        query = f'SELECT {columns} FROM runs{clauses} ORDER BY batch, iteration, label'
+        if limit is not None:
+            query += f' LIMIT {int(limit)}'
+        formatters = [(name, _formatters[var_types[name]]) for name in var_types]
+        rows = []
+        for row in self.db.execute(query, params):
+            run = dict(zip(run_columns, row))
+            run['inputs'] = {name: format(value) for (name, format), value
+                             in zip(formatters, row[len(run_columns):]) if value is not None}
+            rows.append(run)
+        return rows
+
+    def count(self, where=None, **conditions):
+        """The number of runs find() would give."""
+        clauses, params = _conditions(where, conditions)
+        return self.db.execute(f'SELECT COUNT(*) FROM runs{clauses}', params).fetchone()[0]
+
+def _conditions(where, conditions):
+    clauses = []
+    params = []
+    for name, condition in conditions.items():
+        if name not in var_types:
+            raise AttributeError(f'Invalid parameter name: "{name}"')
+        column = f'"{name}"'
+        if isinstance(condition, tuple):
+            low, high = condition
+            clauses.append(f'{column} BETWEEN ? AND ?')
+            params += [_typed(name, low), _typed(name, high)]
+        elif isinstance(condition, list):
+            clauses.append(f'{column} IN ({", ".join("?" * len(condition))})')
+            params += [_typed(name, value) for value in condition]
+        elif var_types[name] == 'float':
+            # as usrinp would write it
+            value = _typed(name, condition)
+            clauses.append(f'{column} BETWEEN ? AND ?')
+            params += [value - 5e-4, value + 5e-4]
+        else:
+            clauses.append(f'{column} = ?')
+            params.append(_typed(name, condition))
+    if where:
+        clauses.append(f'({where})')
+    return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+def find_batches(root):
+    """Every directory under root with a journal or usrout files in its data folder."""
+    batches = []
+    for dirpath, dirnames, filenames in os.walk(os.path.abspath(root)):
+        if 'journal.jsonl' in filenames or _usrout_files(dirpath):
+            batches.append(dirpath)
+        dirnames[:] = sorted(name for name in dirnames if name not in batch_folders)
+    return batches
+
+def _usrout_files(batch_path):
+    data = os.path.join(batch_path, 'data')
+    if not os.path.isdir(data):
+        return []
+    return [name for name in os.listdir(data) if name.startswith('usrout-') and name.endswith('.txt')]
+
+def _typed(name, value):
+    kind = var_types[name]
+    if kind == 'float':
+        return round(float(value), 3)
+    if kind == 'int':
+        return int(float(value))
+    if kind == 'bool':
+        return int(str(value)[:1] in ('T', 't', '1'))
+    return str(value).strip()
+
+# the usrinp text of a column's value
+_formatters = {'int': str,
+               'float': lambda value: f'{value:8.3f}',
+               'bool': lambda value: 'T' if value else 'F',
+               'str': str}
+
+def _batch_output(batch_path):
+    for output in ('store', 'archive'):
+        if os.path.isdir(os.path.join(batch_path, output)):
+            return output, os.path.join(batch_path, output)
+    return 'text', None
+
+def _row(batch_path, label, iteration, inputs, run_s, tuv_sha256):
+    output, location = _batch_output(batch_path)
+    usrout = location or os.path.join(batch_path, 'data', f'usrout-{label}.txt')
+    typed = []
+    for name in var_types:
+        try:
+            typed.append(_typed(name, inputs[name]) if name in inputs else None)
+        except ValueError:
+            typed.append(None)
+    return (label, iteration, output, usrout, tuv_sha256, run_s, *typed)
+
+def _scan_batch(batch_path, position=None, tuv_sha256=None):
+    """
+    (batch_path, new position, restart, rows, failed labels) for the runs of
+    batch_path not read up to position (journal inode, offset, executable hash).
+    """
+    journal = os.path.join(batch_path, 'journal.jsonl')
+    if tuv_sha256 is None and position is not None:
+        tuv_sha256 = position[2]
+    if not os.path.exists(journal):
+        if position is not None:
+            return batch_path, position, False, [], []
+        return batch_path, (None, None, tuv_sha256), True, _echo_rows(batch_path, tuv_sha256), []
+
+    inode = os.stat(journal).st_ino
+    restart = position is None or position[0] != inode or position[1] > os.path.getsize(journal)
+    offset = 0 if restart else position[1]
+    runtimes = None
+    rows = {}
+    failed = set()
+    with open(journal, 'rb') as lines:
+        lines.seek(offset)
+        for line in lines:
+            if not line.endswith(b'\n'):
+                # still being written
+                break
+            offset += len(line)
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            label = record['label']
+            if record.get('status') == 'failed':
+                rows.pop(label, None)
+                failed.add(label)
+                continue
+            failed.discard(label)
+            run_s = record.get('run_s')
+            if run_s is None:
+                if runtimes is None:
+                    runtimes = _metrics_runtimes(batch_path)
+                run_s = runtimes.get(record['iteration'])
+            rows[label] = _row(batch_path, label, record['iteration'], record['inputs'], run_s, tuv_sha256)
+    return batch_path, (inode, offset, tuv_sha256), restart, list(rows.values()), sorted(failed)
+
+def _metrics_runtimes(batch_path):
+    runtimes = {}
+    try:
+        with open(os.path.join(batch_path, 'metrics.jsonl')) as lines:
+            for line in lines:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get('status') == 'ran' and 'run_s' in record:
+                    runtimes[record['iteration']] = record['run_s']
+    except FileNotFoundError:
+        pass
+    return runtimes
+
+def _echo_rows(batch_path, tuv_sha256):
+    rows = []
+    for name in sorted(_usrout_files(batch_path)):
+        label = name[len('usrout-'):-len('.txt')]
+        inputs = read_input_echo(os.path.join(batch_path, 'data', name))
+        if inputs:
+            rows.append(_row(batch_path, label, None, inputs, None, tuv_sha256))
+    return rows
+
+def read_input_echo(filepath):
+    """The input table at the top of a usrout file, formatted as in usrinp."""
+    inputs = {}
+    rules = 0
+    with open(filepath) as usrout:
+        for line in usrout:
+            if line.strip().startswith('====='):
+                rules += 1
+                if rules == 2:
+                    break
+                continue
+            tokens = line.split()
+            for i in range(1, len(tokens) - 1):
+                if tokens[i] == '=' and tokens[i-1] in var_types:
+                    inputs[tokens[i-1]] = formatVarType(tokens[i-1], tokens[i+1])
+            if rules == 0 and len(inputs) == 0 and line.strip():
+                # no echo at the top of this file
+                break
+    return inputs
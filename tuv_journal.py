@@ -0,0 +1,91 @@
+"""
+Append-only journal of the simulations a batch has finished.
+
+batch_run appends one JSON line to OUTPUT/{data_subdir}/journal.jsonl after
+each simulation, recording its iteration index, file label, the inputs as
+written to usrinp, SHA-256 checksums of its usrout and tuvlog files and,
+when batch_run timed it, the seconds TUV took (run_s).
+Lines are flushed and fsync'ed as they are written, so a batch killed at any
+point leaves at worst one truncated trailing line, which is ignored on read.
+Simulations that fail are journalled too, with status 'failed', the kind of
+failure and TUV's message, but never count as done.
+
+When a batch is restarted with resume=True, a simulation counts as done only
+if its journal entry has the same inputs and both output files still match
+their checksums; everything else is run again.
+"""
+import os
+import json
+import hashlib
+from modify_usrinp import formatInputs
+
+def file_checksum(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class RunJournal:
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.failures = 0
+        # end a line cut short by a killed batch so new records start cleanly
+        if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
+            with open(filepath, 'rb+') as journal:
+                journal.seek(-1, os.SEEK_END)
+                if journal.read(1) != b'\n':
+                    journal.write(b'\n')
+
+    def completed(self):
+        records = {}
+        if not os.path.exists(self.filepath):
+            return records
+        with open(self.filepath) as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # partial line left behind by a killed batch
+                    continue
+                if record.get('status') == 'failed':
+                    records.pop(record['iteration'], None)
+                    continue
+                records[record['iteration']] = record
+        return records
+
+    def record(self, iteration, label, input_dict, output_filename, log_filename, run_s=None):
+        record = {'iteration': int(iteration),
+                  'label': label,
+                  'inputs': formatInputs(input_dict),
+                  'usrout_sha256': file_checksum(output_filename),
+                  'tuvlog_sha256': file_checksum(log_filename)}
+        if run_s is not None:
+            record['run_s'] = round(run_s, 4)
+        self._append(record)
+
+    def record_failure(self, iteration, label, input_dict, kind, message):
+        # a failed run is written down too, but never counts as done
+        self.failures += 1
+        self._append({'iteration': int(iteration),
+                      'label': label,
+                      'inputs': formatInputs(input_dict),
+                      'status': 'failed',
+                      'kind': kind,
+                      'message': message})
+
+    def _append(self, record):
+        with open(self.filepath, 'a') as journal:
+            journal.write(json.dumps(record) + '\n')
+            journal.flush()
+            os.fsync(journal.fileno())
+
+def is_complete(record, input_dict, output_filename, log_filename):
+    if record is None or record['inputs'] != formatInputs(input_dict):
+        return False
+    try:
+        return (file_checksum(output_filename) == record['usrout_sha256'] and
+                file_checksum(log_filename) == record['tuvlog_sha256'])
+    except OSError:
+        return False
@@ -0,0 +1,107 @@
+"""
+Per-run timings of a batch, one JSON line per simulation.
+
+With batch_run(..., metrics=True) every iteration appends a record to
+OUTPUT/{data_subdir}/metrics.jsonl (or to the file given as metrics=):
+
+    status        'ran', 'cached', 'skipped' (already done on resume) or 'failed'
+    render_s      writing usrinp
+    run_s         TUV, from spawning the process to its exit
+    move_s        moving usrout and tuvlog into the output directories
+    finish_s      checksums, journal, cache and store updates afterwards
+    user_s/sys_s  CPU time of the TUV process (getrusage(RUSAGE_CHILDREN))
+    maxrss_kb     peak resident memory of any TUV process so far
+    output_bytes  size of usrout and tuvlog
+    end           time.time() when the record was written
+
+The CPU times are the difference in RUSAGE_CHILDREN across the run, so they
+are exact for serial and process pool batches, where each process waits on
+one TUV at a time, and left out of asyncio batches. Summarize a file with
+
+    python tuv_metrics.py OUTPUT/example/metrics.jsonl
+"""
+import os
+import sys
+import json
+import time
+
+stages = ('render_s', 'run_s', 'move_s', 'finish_s', 'user_s', 'sys_s')
+
+class RunMetrics:
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self._file = open(filepath, 'a', buffering=1)
+
+    def record(self, run, status, timings=None, finish_s=None):
+        record = {'iteration': int(run.iteration), 'label': run.label, 'status': status}
+        if timings:
+            record.update(timings)
+        if finish_s is not None:
+            record['finish_s'] = finish_s
+        record['end'] = time.time()
+        self._file.write(json.dumps(record) + '\n')
+
+    def close(self):
+        self._file.close()
+
+def read_metrics(filepath):
+    records = []
+    with open(filepath) as metrics:
+        for line in metrics:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+def percentile(values, q):
+    # linear interpolation between closest ranks, as numpy.percentile does
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+def summarize(filepath, out=sys.stdout):
+    records = read_metrics(filepath)
+    if not records:
+        print('no records', file=out)
+        return
+
+    statuses = {}
+    for record in records:
+        statuses[record['status']] = statuses.get(record['status'], 0) + 1
+    print(', '.join(f'{count} {status}' for status, count in sorted(statuses.items())), file=out)
+
+    ran = [record for record in records if record['status'] == 'ran']
+    print(f'{"stage":>12} {"p50 ms":>10} {"p95 ms":>10} {"total s":>10}', file=out)
+    for stage in stages:
+        values = [record[stage] for record in ran if record.get(stage) is not None]
+        if values:
+            print(f'{stage:>12} {1e3*percentile(values, 50):10.2f} '
+                  f'{1e3*percentile(values, 95):10.2f} {sum(values):10.2f}', file=out)
+    sizes = [record['output_bytes'] for record in ran if 'output_bytes' in record]
+    if sizes:
+        print(f'output: {percentile(sizes, 50)/1024:.1f} KiB per run (p50), '
+              f'{sum(sizes)/2**20:.1f} MiB in total', file=out)
+    rss = [record['maxrss_kb'] for record in ran if 'maxrss_kb' in record]
+    if rss:
+        print(f'peak TUV memory: {max(rss)/1024:.1f} MiB', file=out)
+
+    # wall time from the start of the first run to the end of the last
+    first = min(record['end'] - sum(record.get(stage, 0) for stage in ('render_s', 'run_s',
+                                                                        'move_s', 'finish_s'))
+                for record in records)
+    wall = max(record['end'] for record in records) - first
+    if wall > 0:
+        print(f'{len(ran)} runs in {wall:.1f} s: {len(ran)/wall:.2f} runs/s '
+              f'({len(records)/wall:.2f} iterations/s)', file=out)
+
+if __name__ == '__main__':
+    for filepath in sys.argv[1:]:
+        if len(sys.argv) > 2:
+            print(os.path.basename(os.path.dirname(os.path.abspath(filepath))))
+        summarize(filepath)
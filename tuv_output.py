@@ -0,0 +1,376 @@
+"""
+Parser for TUV text output (usrout-*.txt and tuvlog-*.txt).
+
+A usrout file is a sequence of text headings followed by fixed-width numeric
+tables. The parser makes a single pass over the lines without regular
+expressions:
+
+  * a line whose first non-sign character is a digit and whose tokens are
+    all numbers is a table row; consecutive rows with the same number of
+    columns form one table
+  * a line starting with an integer, followed by text and ending in
+    floating point numbers (e.g. '  2 O3 -> O2 + O(1D)   1.234E-05') is a
+    labelled row; consecutive labelled rows form one table
+  * every other line is heading text for the next table. Numbered heading
+    lines ('  1 UV-B, 280-315 nm') name the value columns of that table,
+    and the last heading line before a table is read as its column header
+
+Each table is classified from its heading as 'irradiance', 'actinic_flux',
+'dose_rates', 'j_values' or 'other', and coordinate columns (wavelength,
+time, sza, altitude) are split off from the value columns using the column
+header. Numbers are converted a whole table at a time into float64 arrays;
+Fortran's exponent-without-E form ('1.234-100') and overflow fields
+('*********') are handled on a slower fallback path.
+"""
+import os
+import numpy as np
+
+table_kinds = ('irradiance', 'actinic_flux', 'dose_rates', 'j_values', 'other')
+
+# heading keywords, checked in order; the first match wins
+_kind_keywords = (('photolysis', 'j_values'),
+                  ('j-value', 'j_values'),
+                  ('j value', 'j_values'),
+                  ('dose', 'dose_rates'),
+                  ('weighted', 'dose_rates'),
+                  ('actinic', 'actinic_flux'),
+                  ('irradiance', 'irradiance'))
+
+_coord_names = {'wl': 'wavelength', 'wc': 'wavelength', 'wavelength': 'wavelength',
+                'lambda': 'wavelength', 'nm': 'wavelength', 'wu': 'wavelength_upper',
+                'wavelength_upper': 'wavelength_upper',
+                'time': 'time', 'hrs': 'time', 'hours': 'time', 'ut': 'time',
+                'sza': 'sza', 'zenith': 'sza',
+                'z': 'altitude', 'alt': 'altitude', 'altitude': 'altitude', 'km': 'altitude'}
+
+# a table without a usable column header starts with this coordinate
+_default_coord = {'irradiance': 'wavelength',
+                  'actinic_flux': 'wavelength',
+                  'dose_rates': 'time',
+                  'j_values': 'time'}
+
+# str.translate tables deleting the characters of a numeric row and of a rule
+_numeric_chars = str.maketrans('', '', '0123456789.+-EeDd* \t\r\n')
+_rule_chars = str.maketrans('', '', '=-* \t\r\n')
+
+class Table:
+
+    def __init__(self, kind, title, header, coords, values, names, row_names=None):
+        self.kind = kind
+        self.title = title
+        self.header = header
+        self.coords = coords
+        self.values = values
+        self.names = names
+        self.row_names = row_names
+
+    def __repr__(self):
+        return f'<Table {self.kind} {self.values.shape} coords={list(self.coords)}>'
+
+class TuvOutput:
+
+    def __init__(self, tables, inputs):
+        self.tables = tables
+        self.inputs = inputs
+
+    def all(self, kind):
+        return [table for table in self.tables if table.kind == kind]
+
+    def get(self, kind):
+        for table in self.tables:
+            if table.kind == kind:
+                return table
+        return None
+
+    @property
+    def irradiance(self):
+        return self.get('irradiance')
+
+    @property
+    def actinic_flux(self):
+        return self.get('actinic_flux')
+
+    @property
+    def dose_rates(self):
+        return self.get('dose_rates')
+
+    @property
+    def j_values(self):
+        return self.get('j_values')
+
+def read_usrout(filepath, kinds=None):
+    with open(filepath) as usrout:
+        return parse_usrout(usrout, kinds)
+
+def parse_usrout(lines, kinds=None):
+    """
+    Parse an iterable of usrout lines. If kinds is given, tables of other
+    kinds are recognised but their numbers are never converted.
+    """
+    tables = []
+    inputs = {}
+    heading = []
+    rows = []
+    labelled = False
+
+    def close():
+        if rows:
+            table = _build_table(heading, rows, labelled, kinds)
+            if table is not None:
+                tables.append(table)
+            heading.clear()
+            rows.clear()
+
+    for line in lines:
+        tokens = line.split()
+        if not tokens:
+            close()
+            continue
+
+        if _is_number(tokens[0]) and not line.translate(_numeric_chars):
+            if rows and (labelled or len(rows[-1]) != len(tokens)):
+                close()
+            labelled = False
+            rows.append(tokens)
+            continue
+
+        label_row = _labelled_row(tokens)
+        if label_row is not None:
+            if rows and (not labelled or len(rows[-1][1]) != len(label_row[1])):
+                close()
+            labelled = True
+            rows.append(label_row)
+            continue
+
+        close()
+        if len(tokens) > 2 and tokens[1] == '=':
+            # the echo of the input table, not a heading
+            _read_input_echo(tokens, inputs)
+            continue
+        if not line.translate(_rule_chars):
+            continue
+        heading.append(line.strip())
+
+    close()
+    return TuvOutput(tables, inputs)
+
+def split_times(output, nt):
+    """
+    Split the output of a run over nt times (or solar zenith angles) into
+    nt outputs of one time each. Tables with a time or sza coordinate are
+    split by row, tables with one value column per time by column; tables
+    that don't depend on time are shared by every part.
+    """
+    parts = [TuvOutput([], dict(output.inputs)) for _ in range(nt)]
+    for table in output.tables:
+        time_coord = None
+        for name in ('time', 'sza'):
+            if name in table.coords and len(table.coords[name]) == nt:
+                time_coord = name
+                break
+        for k, part in enumerate(parts):
+            if time_coord is not None:
+                coords = {name: values[k:k+1] for name, values in table.coords.items()}
+                part.tables.append(Table(table.kind, table.title, table.header, coords,
+                                         table.values[k:k+1], table.names, table.row_names))
+            elif nt > 1 and table.values.shape[1] == nt:
+                part.tables.append(Table(table.kind, table.title, table.header, table.coords,
+                                         table.values[:, k:k+1], table.names[k:k+1], table.row_names))
+            else:
+                part.tables.append(table)
+    return parts
+
+def write_usrout(output, filepath):
+    """
+    Write parsed tables back out as text that read_usrout reads back to the
+    same arrays. The layout follows TUV's (inputs, then a heading, column
+    names and rows per table) but is not byte-for-byte TUV output.
+    """
+    lines = [f' {name} = {value}' for name, value in output.inputs.items()]
+    for table in output.tables:
+        lines.append('')
+        lines.append(f' {table.title}')
+        if table.row_names is not None:
+            for i, (row_name, row) in enumerate(zip(table.row_names, table.values)):
+                lines.append(f'{i+1:4d} {row_name} ' + ' '.join(_format_value(value) for value in row))
+            continue
+        # names of one word go in the column header; a numbered line with a
+        # number for a name ('   1 2') would read back as a table row
+        header = list(table.coords) + list(table.names)
+        if not (header and not _is_number(header[0]) and
+                all(len(name.split()) == 1 for name in table.names)):
+            for i, name in enumerate(table.names):
+                lines.append(f'{i+1:4d} {name}')
+            header = list(table.coords) + [str(i + 1) for i in range(len(table.names))]
+        lines.append(' ' + ' '.join(header))
+        columns = list(table.coords.values())
+        for r in range(table.values.shape[0]):
+            row = [values[r] for values in columns] + list(table.values[r])
+            lines.append(' ' + ' '.join(_format_value(value) for value in row))
+    with open(filepath, 'w') as usrout:
+        usrout.write('\n'.join(lines) + '\n')
+
+def _format_value(value):
+    # NaN and infinities are written as Fortran's overflow field
+    return f'{value:.6E}' if np.isfinite(value) else '*********'
+
+def iter_usrout(data_dir, prefix='usrout', kinds=None):
+    """
+    Lazily parse every {prefix}-{label}.txt file in data_dir, yielding
+    (label, TuvOutput) pairs in label order. Only one file is held in memory
+    at a time.
+    """
+    for label, filepath in output_files(data_dir, prefix):
+        yield label, read_usrout(filepath, kinds)
+
+def output_files(data_dir, prefix='usrout'):
+    start = f'{prefix}-'
+    found = []
+    for entry in os.scandir(data_dir):
+        if entry.name.startswith(start) and entry.name.endswith('.txt'):
+            found.append((entry.name[len(start):-4], entry.path))
+    found.sort(key=lambda item: _label_key(item[0]))
+    return found
+
+def _label_key(label):
+    # '10-2' sorts after '9-2'
+    return [(0, int(part), '') if part.isdigit() else (1, 0, part) for part in label.split('-')]
+
+def _is_number(token):
+    return token.lstrip('+-.')[:1].isdigit()
+
+def _all_numbers(tokens):
+    for token in tokens:
+        try:
+            float(token)
+        except ValueError:
+            if _fortran_float(token) is None:
+                return False
+    return True
+
+def _fortran_float(token):
+    if token and set(token) == {'*'}:
+        return float('nan')
+    # Fortran drops the 'E' from three digit exponents: 1.234-100
+    for i in range(len(token) - 1, 0, -1):
+        if token[i] in '+-' and token[i-1] not in 'eEdD':
+            try:
+                return float(f'{token[:i]}E{token[i:]}')
+            except ValueError:
+                return None
+    try:
+        return float(token.replace('D', 'E').replace('d', 'e'))
+    except ValueError:
+        return None
+
+def _labelled_row(tokens):
+    if not tokens[0].isdigit() or len(tokens) < 3:
+        return None
+    n_values = 0
+    for token in reversed(tokens[1:]):
+        if len(token) > 2 and set(token) == {'*'}:
+            # an overflowed field
+            n_values += 1
+            continue
+        if not ('.' in token or 'E' in token or 'e' in token) or not _is_number(token):
+            break
+        if not _all_numbers((token,)):
+            break
+        n_values += 1
+    if n_values == 0 or n_values == len(tokens) - 1:
+        return None
+    return ' '.join(tokens[1:len(tokens) - n_values]), tokens[len(tokens) - n_values:]
+
+def _read_input_echo(tokens, inputs):
+    # 'lat =          0.000   lon =          0.000   tmzone =         0.0'
+    for i in range(1, len(tokens) - 1):
+        if tokens[i] == '=':
+            inputs[tokens[i-1]] = tokens[i+1]
+
+def _to_array(tokens):
+    try:
+        return np.array(tokens, dtype=np.float64)
+    except ValueError:
+        return np.array([_to_float(token) for token in tokens], dtype=np.float64)
+
+def _to_float(token):
+    try:
+        return float(token)
+    except ValueError:
+        value = _fortran_float(token)
+        return np.nan if value is None else value
+
+def _classify(heading):
+    text = ' '.join(heading).lower()
+    for keyword, kind in _kind_keywords:
+        if keyword in text:
+            return kind
+    return 'other'
+
+def _split_header(header_line):
+    # join annotations onto their column name: 'time, hrs.' -> 'time,hrs.'
+    columns = []
+    joining = False
+    for token in header_line.split():
+        if joining:
+            columns[-1] += token
+        else:
+            columns.append(token)
+        joining = token.endswith(',')
+    return columns
+
+def _coord_name(column):
+    name = column.lower().split(',')[0].split('(')[0].strip('.:[]')
+    return _coord_names.get(name)
+
+def _heading_names(heading):
+    # numbered heading lines name the value columns: '  3 UV-A, 315-400 nm'
+    names = []
+    for line in heading:
+        tokens = line.split(None, 1)
+        if len(tokens) == 2 and tokens[0].isdigit() and int(tokens[0]) == len(names) + 1:
+            names.append(tokens[1])
+    return names
+
+def _build_table(heading, rows, labelled, kinds):
+    kind = _classify(heading)
+    if kinds is not None and kind not in kinds:
+        return None
+    title = heading[0] if heading else ''
+
+    if labelled:
+        row_names = [row[0] for row in rows]
+        ncols = len(rows[0][1])
+        values = _to_array([token for row in rows for token in row[1]]).reshape(len(rows), ncols)
+        return Table(kind, title, [], {}, values, [], row_names)
+
+    ncols = len(rows[0])
+    data = _to_array([token for row in rows for token in row]).reshape(len(rows), ncols)
+
+    # leading columns named like coordinates become coordinates
+    header = _split_header(heading[-1]) if heading else []
+    ncoords = 0
+    coord_names = []
+    for column in header[:ncols]:
+        coord = _coord_name(column)
+        if coord == 'wavelength' and coord in coord_names:
+            # bin edges: 'wl(lower)  wl(upper)'
+            coord = 'wavelength_upper'
+        if coord is None or coord in coord_names:
+            break
+        coord_names.append(coord)
+        ncoords += 1
+    if ncoords == 0 and kind in _default_coord and ncols > 1:
+        coord_names = [_default_coord[kind]]
+        ncoords = 1
+
+    coords = {name: data[:, i] for i, name in enumerate(coord_names)}
+    values = data[:, ncoords:]
+
+    names = _heading_names(heading)
+    if len(names) != values.shape[1]:
+        names = header[ncoords:ncols] if len(header) == ncols else []
+    if len(names) != values.shape[1]:
+        names = [str(i + 1) for i in range(values.shape[1])]
+
+    return Table(kind, title, header, coords, values, names)
@@ -0,0 +1,196 @@
+"""
+Band integrals and weighted doses over every spectrum of a batch at once.
+
+The spectra of a whole batch are held as one (points, wavelengths, times)
+array: the irradiance (or actinic flux) array of a batch saved with
+output='store', or, for text output, an .npy file built once from the
+usrout files and memory-mapped afterwards. Each band or action spectrum
+becomes one column of a (wavelengths, k) weight matrix, so all of them are
+computed for every point in a single matrix product, a chunk of points at a
+time. A batch never has to fit in memory.
+
+    spectra = Spectra.from_outputs('OUTPUT/seasonal')
+    doses = spectra.integrate(bands=['UVA', 'UVB'], actions={'ery': erythema},
+                              ratios=['UVB/UVA'])
+    doses['UVB']            # W m-2, shape (points, nt), or grid shape + (nt,) for a store
+
+TUV reports spectral irradiance as the mean over each wavelength interval,
+so an integral is the sum of value times width of the interval. Intervals
+are taken from the wl(lower) and wl(upper) columns, which also covers the
+unevenly spaced standard grid of nwint < 0. Where only interval centres are
+given, the edges are put halfway between them. An interval cut by a band
+limit counts with the part of its width inside the band. Action spectra are
+evaluated at interval centres.
+
+Bands, from the notes at the top of run_tuv_batch.py:
+
+UVA: 315-400 nm
+UVB: 280-315 nm
+UVC: 100-280 nm
+"""
+import os
+import json
+import numpy as np
+from tuv_output import read_usrout, output_files
+from tuv_store import BatchStore
+
+uv_bands = {'UVA': (315.0, 400.0),
+            'UVB': (280.0, 315.0),
+            'UVC': (100.0, 280.0)}
+
+def erythema(wavelength):
+    """CIE (1998) erythema action spectrum, 1 below 298 nm."""
+    wavelength = np.asarray(wavelength, dtype=np.float64)
+    return np.select([wavelength <= 298, wavelength <= 328, wavelength <= 400],
+                     [1.0, 10**(0.094 * (298 - wavelength)), 10**(0.015 * (140 - wavelength))], 0.0)
+
+class Spectra:
+
+    def __init__(self, values, lower, upper, labels=None, grid_shape=None):
+        """
+        values is a (points, wavelengths, times) array, or a memmap of one;
+        lower and upper are the edges of the wavelength intervals. Results
+        are reshaped to grid_shape if given.
+        """
+        self.values = values
+        self.lower = np.asarray(lower, dtype=np.float64)
+        self.upper = np.asarray(upper, dtype=np.float64)
+        if values.ndim != 3 or values.shape[1] != len(self.lower):
+            raise ValueError(f'Spectra of shape {values.shape} for {len(self.lower)} wavelengths')
+        self.labels = labels
+        self.grid_shape = grid_shape
+
+    @property
+    def centre(self):
+        return (self.lower + self.upper) / 2
+
+    @property
+    def width(self):
+        return self.upper - self.lower
+
+    @classmethod
+    def from_store(cls, store, quantity='irradiance'):
+        if isinstance(store, str):
+            store = BatchStore(store)
+        meta = store.meta(quantity)
+        array = store.read(quantity)
+        values = array.reshape((-1,) + array.shape[len(store.shape):])
+        lower, upper = _edges(meta['row_coords'], quantity)
+        return cls(values, lower, upper, grid_shape=store.shape)
+
+    @classmethod
+    def from_outputs(cls, batch_path, quantity='irradiance'):
+        """
+        The spectra in {batch_path}/data. They are parsed once into
+        {batch_path}/spectra-{quantity}.npy, which is rebuilt only when the
+        output files change.
+        """
+        files = output_files(os.path.join(batch_path, 'data'))
+        if not files:
+            raise ValueError(f'No usrout files in {batch_path}/data')
+        stamp = [len(files), max(os.stat(filepath).st_mtime_ns for _, filepath in files)]
+        array_path = os.path.join(batch_path, f'spectra-{quantity}.npy')
+        meta_path = os.path.join(batch_path, f'spectra-{quantity}.json')
+        meta = None
+        if os.path.exists(meta_path) and os.path.exists(array_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        if meta is None or meta['stamp'] != stamp:
+            meta = _build_cache(files, quantity, array_path, meta_path, stamp)
+        values = np.load(array_path, mmap_mode='r')
+        return cls(values, meta['lower'], meta['upper'], labels=meta['labels'])
+
+    def band_weights(self, lo, hi):
+        # the width of each interval that lies inside [lo, hi]
+        return np.clip(np.minimum(self.upper, hi) - np.maximum(self.lower, lo), 0.0, None)
+
+    def action_weights(self, action):
+        """action is a function of wavelength in nm or a (wavelengths, values) pair."""
+        if callable(action):
+            spectrum = np.asarray(action(self.centre), dtype=np.float64)
+        else:
+            wavelengths, values = action
+            spectrum = np.interp(self.centre, wavelengths, values, left=0.0, right=0.0)
+        return spectrum * self.width
+
+    def integrate(self, bands=('UVA', 'UVB', 'UVC'), actions=None, ratios=(), chunk_size=4096):
+        """
+        Integrate every spectrum over bands (names from uv_bands, or
+        {name: (lo, hi)}) and weighted by actions ({name: action}).
+        ratios lists 'a/b' pairs of those names. Returns {name: array}.
+        """
+        if isinstance(bands, dict):
+            limits = dict(bands)
+        else:
+            unknown = [band for band in bands if band not in uv_bands]
+            if unknown:
+                raise ValueError(f'Unknown band "{unknown[0]}", give its limits as {{name: (lo, hi)}}')
+            limits = {band: uv_bands[band] for band in bands}
+        names = list(limits) + list(actions or {})
+        columns = [self.band_weights(*limits[name]) for name in limits]
+        columns += [self.action_weights(action) for action in (actions or {}).values()]
+        if not columns:
+            raise ValueError('Nothing to integrate')
+        weights = np.stack(columns, axis=-1)
+
+        # only the intervals some weight falls on are read; NaN elsewhere can't spread
+        used = np.flatnonzero(weights.any(axis=1))
+        weights = weights[used]
+        n_points, _, n_times = self.values.shape
+        result = np.empty((n_points, len(names), n_times))
+        start = 0
+        while start < n_points:
+            stop = min(start + chunk_size, n_points)
+            block = np.asarray(self.values[start:stop])[:, used, :]
+            result[start:stop] = np.einsum('pwt,wk->pkt', block, weights)
+            start = stop
+
+        shape = (self.grid_shape or (n_points,)) + (n_times,)
+        out = {name: result[:, k, :].reshape(shape) for k, name in enumerate(names)}
+        for ratio in ratios:
+            numerator, denominator = ratio.split('/')
+            with np.errstate(divide='ignore', invalid='ignore'):
+                out[ratio] = out[numerator] / out[denominator]
+        return out
+
+def _edges(coords, quantity):
+    if 'wavelength' not in coords:
+        raise ValueError(f'The {quantity} table has no wavelength column')
+    lower = np.asarray(coords['wavelength'], dtype=np.float64)
+    if 'wavelength_upper' in coords:
+        return lower, np.asarray(coords['wavelength_upper'], dtype=np.float64)
+    # only centres: edges halfway between them
+    centre = lower
+    if len(centre) < 2:
+        raise ValueError(f'Cannot tell the width of a single {quantity} interval')
+    middle = (centre[:-1] + centre[1:]) / 2
+    return (np.concatenate([[2*centre[0] - middle[0]], middle]),
+            np.concatenate([middle, [2*centre[-1] - middle[-1]]]))
+
+def _build_cache(files, quantity, array_path, meta_path, stamp):
+    array = None
+    lower = upper = None
+    for i, (label, filepath) in enumerate(files):
+        table = read_usrout(filepath, kinds=(quantity,)).get(quantity)
+        if array is None:
+            if table is None:
+                continue
+            lower, upper = _edges(table.coords, quantity)
+            array = np.lib.format.open_memmap(f'{array_path}.part', mode='w+', dtype=np.float64,
+                                              shape=(len(files),) + table.values.shape)
+            array[:i] = np.nan
+        if table is None or table.values.shape != array.shape[1:]:
+            # a failed run, or one on another wavelength grid
+            array[i] = np.nan
+        else:
+            array[i] = table.values
+    if array is None:
+        raise ValueError(f'No {quantity} tables in the outputs')
+    array.flush()
+    del array
+    os.replace(f'{array_path}.part', array_path)
+    meta = {'stamp': stamp, 'labels': [label for label, _ in files],
+            'lower': lower.tolist(), 'upper': upper.tolist()}
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+    return meta
@@ -0,0 +1,155 @@
+"""
+Checks on a whole sweep before any TUV run is launched.
+
+check_sweep() builds one NumPy array per swept parameter over all planned
+points and tests them in a single vectorized pass against the constraints
+on TUV's inputs (see the input description at the top of run_tuv_batch.py):
+
+    missing value                NaN in any swept parameter
+    wstart below 205 nm          TUV stops with a runtime error below that,
+                                 unless nwint < 0 selects the standard grid
+    wstop not above wstart
+    nwint is 0
+    zbase above ztop             for a cloud with taucld > 0
+    invalid month / day          imonth outside 1-12, iday outside the month
+    iyear outside 1950-2050
+    nz below 2, zstop not above zstart
+    zout outside zstart-zstop
+    nz too large for zout        over TUV's kz levels, counting the level TUV
+                                 inserts when zout is off the zstart-zstop grid
+    lat outside -90 to 90
+    nt below 1
+
+It then looks for points that are the same run once written to usrinp,
+comparing the text formatVarType writes there, and keeps only the first of
+each. batch_run skips the invalid points (recording them in the journal as
+failed with kind 'invalid') and gives the repeats links to the outputs of
+their first occurrence once the batch is done.
+
+check_points() runs the same checks on any set of points given as arrays;
+table batches (tuv_table.py) check each chunk of rows that way as it is read.
+"""
+import numpy as np
+from modify_usrinp import var_types, formatVarType
+
+# kz in TUV's params file: the most altitude levels TUV has room for
+max_levels = 151
+
+class PreflightReport:
+
+    def __init__(self, n_points, invalid, duplicates):
+        self.n_points = n_points
+        self.invalid = invalid
+        self.duplicates = duplicates
+
+    @property
+    def n_runs(self):
+        return self.n_points - len(self.invalid) - len(self.duplicates)
+
+    def summary(self):
+        reasons = {}
+        for reason in self.invalid.values():
+            reasons[reason] = reasons.get(reason, 0) + 1
+        text = f'{self.n_points} points, {len(self.invalid)} invalid'
+        if reasons:
+            text += ' (' + ', '.join(f'{reason}: {count}' for reason, count in sorted(reasons.items())) + ')'
+        return text + f', {len(self.duplicates)} repeated, {self.n_runs} runs to execute'
+
+def _days_in_month(iyear, imonth):
+    days = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])[np.clip(imonth, 1, 12).astype(int) - 1]
+    leap = (iyear % 4 == 0) & ((iyear % 100 != 0) | (iyear % 400 == 0))
+    return days + ((imonth == 2) & leap)
+
+def _zout_off_grid(p):
+    # TUV's levels are zstart + k*(zstop - zstart)/(nz - 1)
+    with np.errstate(divide='ignore'):
+        k = (p('zout') - p('zstart')) / ((p('zstop') - p('zstart')) / (p('nz') - 1))
+    return np.abs(k - np.round(k)) > 1e-4
+
+# (message, test) pairs; each test gets a function returning a parameter as
+# an array over the points (or a scalar if it is not swept) and flags the
+# points that TUV can't run
+checks = (
+    ('wstart below 205 nm', lambda p: (p('nwint') > 0) & (p('wstart') < 205)),
+    ('wstop not above wstart', lambda p: (p('nwint') > 0) & (p('wstop') <= p('wstart'))),
+    ('nwint is 0', lambda p: p('nwint') == 0),
+    ('zbase above ztop', lambda p: (p('taucld') > 0) & (p('zbase') > p('ztop'))),
+    ('invalid month', lambda p: (p('imonth') < 1) | (p('imonth') > 12)),
+    ('invalid day of month', lambda p: (p('iday') < 1) | (p('iday') > _days_in_month(p('iyear'), p('imonth')))),
+    ('iyear outside 1950-2050', lambda p: (p('iyear') < 1950) | (p('iyear') > 2050)),
+    ('nz below 2', lambda p: p('nz') < 2),
+    ('zstop not above zstart', lambda p: p('zstop') <= p('zstart')),
+    ('zout outside zstart-zstop', lambda p: (p('zout') < p('zstart')) | (p('zout') > p('zstop'))),
+    ('nz too large for zout', lambda p: p('nz') + _zout_off_grid(p) > max_levels),
+    ('lat outside -90 to 90', lambda p: np.abs(p('lat')) > 90),
+    ('nt below 1', lambda p: p('nt') < 1),
+)
+
+def check_sweep(input_dict, sweep, start=0, stop=None):
+    """Check the points [start, stop) of a Sweep run with input_dict."""
+    stop = len(sweep) if stop is None else min(stop, len(sweep))
+    flat = np.arange(start, stop)
+    swept = _point_arrays(sweep, flat)
+    invalid, bad = _check(input_dict, swept, flat)
+
+    duplicates = {}
+    if swept and not bad.all():
+        ok = np.flatnonzero(~bad)
+        key = np.stack([_usrinp_values(name, values[ok]) for name, values in swept.items()], axis=-1)
+        _, first, inverse = np.unique(key, axis=0, return_index=True, return_inverse=True)
+        first_of = first[inverse.ravel()]
+        for i in np.flatnonzero(first_of != np.arange(len(ok))):
+            duplicates[int(flat[ok[i]])] = int(flat[ok[first_of[i]]])
+    return PreflightReport(len(flat), invalid, duplicates)
+
+def check_points(input_dict, swept, flat):
+    """
+    {flat index: reason} for the points that TUV can't run, where swept
+    holds an array of each swept parameter over the points flat.
+    """
+    return _check(input_dict, {name: np.asarray(values) for name, values in swept.items()},
+                  np.asarray(flat))[0]
+
+def _check(input_dict, swept, flat):
+    numeric = {}
+    def param(name):
+        if name not in numeric:
+            value = swept[name] if name in swept else input_dict[name]
+            try:
+                numeric[name] = np.asarray(value, dtype=np.float64)
+            except (TypeError, ValueError):
+                numeric[name] = np.full(len(flat), np.nan)
+        return numeric[name]
+
+    bad = np.zeros(len(flat), dtype=bool)
+    reason = np.full(len(flat), '', dtype=object)
+    missing = np.zeros(len(flat), dtype=bool)
+    for name in swept:
+        if var_types.get(name) in ('int', 'float'):
+            missing |= np.isnan(param(name))
+    bad |= missing
+    reason[missing] = 'missing value'
+    with np.errstate(invalid='ignore'):
+        for message, test in checks:
+            failed = np.broadcast_to(test(param), bad.shape) & ~bad
+            reason[failed] = message
+            bad |= failed
+    invalid = {int(flat[i]): reason[i] for i in np.flatnonzero(bad)}
+    return invalid, bad
+
+def _point_arrays(sweep, flat):
+    arrays = {}
+    index = np.unravel_index(flat, sweep.shape) if sweep.axes else ()
+    for axis, axis_index in zip(sweep.axes, index):
+        for name, values in axis.params.items():
+            arrays[name] = np.asarray(values)[axis_index]
+    for name, values in sweep.fields.items():
+        arrays[name] = np.asarray(values)[flat]
+    return arrays
+
+def _usrinp_values(name, values):
+    # the text usrinp would hold, numbered so np.unique can compare the rows;
+    # np.round rounds halves to even where printf doesn't (0.0005 is '0.001')
+    distinct, inverse = np.unique(values, return_inverse=True)
+    text = [formatVarType(name, value) for value in distinct.tolist()]
+    return np.unique(text, return_inverse=True)[1].ravel()[inverse.ravel()].astype(np.float64)
@@ -0,0 +1,324 @@
+"""
+A sweep split into chunks on shared storage, for workers on many nodes.
+
+plan_queue() writes the sweep and its inputs to a queue directory and cuts
+it into chunks of chunk_size points. Any number of workers, on any nodes
+that see the directory, then take chunks one at a time and run each as an
+ordinary batch_run shard into the queue directory. merge() puts the results
+of all chunks together into the usual OUTPUT/{data_subdir} layout.
+
+    {queue}/plan.json           sweep, inputs, TUV tree and batch_run options of the batch
+    {queue}/leases/{k}          a chunk being run; holds the worker's id
+    {queue}/done/{k}            a chunk that has finished
+    {queue}/chunks/{k}/         the chunk's batch directory (data/, log/, journal.jsonl)
+    {queue}/workers/{id}        touched by each worker on every heartbeat
+
+Nothing but the file system coordinates the workers. A chunk is claimed by
+creating its lease file with O_CREAT | O_EXCL, which exactly one worker can
+do. While a worker runs the chunk, a thread touches the lease every
+heartbeat seconds. A lease untouched for lease_timeout seconds belongs to a
+worker that crashed or lost its node. Once every chunk is done or leased,
+idle workers take over such chunks: they rename the stale lease away (only
+one rename can succeed) and claim the chunk again. The new worker resumes the
+chunk from its journal. Ages are measured against the modification time of
+the worker's own heartbeat file, so the nodes' clocks don't need to agree.
+
+From the command line (see run_tuv_batch.py):
+
+    python run_tuv_batch.py plan /shared/queue spec.json --chunk-size 200
+    python run_tuv_batch.py worker /shared/queue --workers 16      # on each node
+    python run_tuv_batch.py merge /shared/queue
+"""
+import os
+import json
+import time
+import shutil
+import socket
+import threading
+import run_tuv_batch
+from tuv_sweep import Sweep
+from tuv_workspace import default_scratch_root
+
+# batch_run options a plan keeps for its workers; those of the worker
+# command line win
+worker_options = ('workers', 'cache', 'timeout', 'metrics', 'local_scratch', 'cost_model', 'preflight')
+
+# batch_run options that don't fit chunks merged back into text outputs
+unsupported_options = {'output': "chunks are merged as text output, so output must be 'text'",
+                       'extend': 'chunks cannot be extended, plan a new queue',
+                       'shard': 'the queue cuts the sweep into chunks itself',
+                       'scratch_root': 'workers take local_scratch instead',
+                       'index': 'index the merged batch with "python -m run_tuv_batch index"',
+                       'dry_run': 'use "python -m run_tuv_batch run --dry-run" on the spec'}
+
+def plan_queue(queue_dir, data_subdir, chunk_size=100, sweep=None, collapse_time=False, want=None,
+               resume=True, output='text', **kwargs):
+    """
+    Write a batch to queue_dir. The arguments are those of batch_run; the
+    sweep is given as sweep= or with iterable_i/j/k as usual. Chunks always
+    resume, and only text output can be merged.
+    """
+    if output != 'text':
+        raise ValueError(f'Cannot plan a queue with output={output!r}: {unsupported_options["output"]}')
+    for name in unsupported_options:
+        if name in kwargs:
+            raise ValueError(f'Cannot plan a queue with {name}=: {unsupported_options[name]}')
+    options = {name: kwargs.pop(name) for name in worker_options if name in kwargs}
+    input_dict, sweep, planned, time_axis = run_tuv_batch._plan_sweep(sweep, collapse_time, want,
+                                                                      dict(kwargs))
+    # the sweep is saved whole, so the inputs only keep the constants
+    inputs = {name: value for name, value in kwargs.items()
+              if name not in sweep.params and name not in ('iterable_i', 'iterable_j', 'iterable_k', 'iterable_k_field')}
+    n_chunks = max(1, -(-len(planned) // chunk_size))
+    plan = {'data_subdir': data_subdir,
+            'tuv_path': run_tuv_batch.tuv_path,
+            'sweep': sweep.to_dict(),
+            'inputs': inputs,
+            'collapse_time': collapse_time,
+            'want': want,
+            'options': options,
+            'points': len(sweep),
+            'n_chunks': n_chunks}
+    os.makedirs(queue_dir)
+    for folder in ('leases', 'done', 'chunks', 'workers'):
+        os.makedirs(os.path.join(queue_dir, folder))
+    with open(os.path.join(queue_dir, 'plan.json.part'), 'w') as f:
+        json.dump(plan, f, default=_to_json)
+    os.replace(os.path.join(queue_dir, 'plan.json.part'), os.path.join(queue_dir, 'plan.json'))
+    print(f'..planned {len(sweep)} points in {n_chunks} chunks in {queue_dir}')
+    return plan
+
+def _to_json(value):
+    # numpy arrays and scalars
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f'{value!r} cannot be saved in a queue plan')
+
+class WorkQueue:
+
+    def __init__(self, queue_dir, worker_id=None, heartbeat=30.0, lease_timeout=300.0):
+        if lease_timeout <= 2 * heartbeat:
+            raise ValueError('lease_timeout must be well over the heartbeat interval')
+        self.path = queue_dir
+        self.worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+        self.heartbeat = heartbeat
+        self.lease_timeout = lease_timeout
+        with open(os.path.join(queue_dir, 'plan.json')) as f:
+            self.plan = json.load(f)
+        self.n_chunks = self.plan['n_chunks']
+        self.current = None
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _file(self, folder, k):
+        return os.path.join(self.path, folder, f'{k:06d}')
+
+    def chunk_dir(self, k):
+        return os.path.abspath(self._file('chunks', k))
+
+    def is_done(self, k):
+        return os.path.exists(self._file('done', k))
+
+    def pending(self):
+        return [k for k in range(self.n_chunks) if not self.is_done(k)]
+
+    def _now(self):
+        # the file system's clock, which stamps the leases too
+        beat = os.path.join(self.path, 'workers', self.worker_id)
+        with open(beat, 'a'):
+            os.utime(beat)
+        return os.stat(beat).st_mtime
+
+    def _create_lease(self, k):
+        try:
+            fd = os.open(self._file('leases', k), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as lease:
+            lease.write(self.worker_id)
+        self.current = k
+        self.lost = False
+        return True
+
+    def claim(self):
+        """The number of a chunk now leased to this worker, or None."""
+        # start at a different chunk on every worker so they don't all race for the first
+        offset = hash(self.worker_id) % self.n_chunks
+        order = [(offset + i) % self.n_chunks for i in range(self.n_chunks)]
+        for k in order:
+            if not self.is_done(k) and self._create_lease(k):
+                if self.is_done(k):
+                    # finished between the two checks
+                    self.release(k)
+                    continue
+                return k
+        now = self._now()
+        for k in order:
+            lease = self._file('leases', k)
+            try:
+                stamp = os.stat(lease).st_mtime
+            except FileNotFoundError:
+                continue
+            if self.is_done(k) or now - stamp < self.lease_timeout:
+                continue
+            stale = f'{lease}.{self.worker_id}'
+            try:
+                os.rename(lease, stale)
+            except FileNotFoundError:
+                continue
+            if os.stat(stale).st_mtime != stamp:
+                # renewed, or replaced by another worker, since it was looked at
+                try:
+                    os.link(stale, lease)
+                except FileExistsError:
+                    pass
+                os.remove(stale)
+                continue
+            os.remove(stale)
+            print(f'..taking over chunk {k}, whose lease expired {now - stamp:.0f} s ago')
+            if self._create_lease(k):
+                return k
+        return None
+
+    def complete(self, k):
+        if self.lost:
+            print(f'..lost the lease on chunk {k} while running it; leaving it to its new worker')
+        else:
+            with open(self._file('done', k), 'w') as done:
+                done.write(self.worker_id)
+        self.release(k)
+
+    def release(self, k):
+        lease = self._file('leases', k)
+        try:
+            with open(lease) as f:
+                owner = f.read()
+            if owner == self.worker_id:
+                os.remove(lease)
+        except FileNotFoundError:
+            pass
+        self.current = None
+
+    def _beat(self):
+        while not self._stop.wait(self.heartbeat):
+            k = self.current
+            if k is None:
+                continue
+            lease = self._file('leases', k)
+            try:
+                with open(lease) as f:
+                    if f.read() != self.worker_id:
+                        raise FileNotFoundError(lease)
+                os.utime(lease)
+            except FileNotFoundError:
+                self.lost = True
+            self._now()
+
+    def __enter__(self):
+        self._now()
+        self._thread = threading.Thread(target=self._beat, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        if self.current is not None:
+            self.release(self.current)
+        try:
+            os.remove(os.path.join(self.path, 'workers', self.worker_id))
+        except FileNotFoundError:
+            pass
+
+def work(queue_dir, worker_id=None, workers=None, local_scratch=None, cache=None, timeout=None,
+         metrics=None, heartbeat=30.0, lease_timeout=300.0, wait=True, tuv_path=None):
+    """
+    Run chunks of a queue until none are left. With wait=True a worker
+    that finds every remaining chunk leased keeps checking on them, so it
+    can take over from a worker that dies, and stops once all are done.
+    Options left as None, tuv_path included, are taken from the plan.
+    """
+    with WorkQueue(queue_dir, worker_id, heartbeat, lease_timeout) as queue:
+        plan = queue.plan
+        _use_plan_tuv_path(plan, tuv_path)
+        sweep = Sweep.from_dict(plan['sweep'])
+        options = dict(plan.get('options', {}))
+        for name, value in (('workers', workers), ('local_scratch', local_scratch), ('cache', cache),
+                            ('timeout', timeout), ('metrics', metrics)):
+            if value is not None:
+                options[name] = value
+        workers = options.pop('workers', 1)
+        local_scratch = options.pop('local_scratch', None)
+        # workers sharing a node each need their own workspaces
+        if not isinstance(local_scratch, str):
+            local_scratch = default_scratch_root()
+        scratch = os.path.join(local_scratch, f'queue-{queue.worker_id}')
+        ran = 0
+        try:
+            while True:
+                k = queue.claim()
+                if k is None:
+                    pending = queue.pending()
+                    if not pending or not wait:
+                        break
+                    time.sleep(heartbeat)
+                    continue
+                print(f'..chunk {k+1}/{queue.n_chunks}')
+                run_tuv_batch.batch_run(queue.chunk_dir(k), workers=workers, resume=True,
+                                        sweep=sweep, shard=(k, queue.n_chunks),
+                                        collapse_time=plan['collapse_time'], local_scratch=scratch,
+                                        want=plan['want'], **options, **plan['inputs'])
+                queue.complete(k)
+                ran += 1
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+    print(f'..worker {queue.worker_id} ran {ran} chunks')
+    return ran
+
+def _use_plan_tuv_path(plan, tuv_path):
+    # the tree the queue was planned against, unless this node names its own
+    tuv_path = tuv_path or plan.get('tuv_path')
+    if tuv_path is not None:
+        run_tuv_batch._use_tuv_path(tuv_path)
+
+def merge(queue_dir, data_subdir=None, partial=False, tuv_path=None):
+    """
+    Move the outputs of every finished chunk into OUTPUT/{data_subdir}
+    (the plan's data_subdir and TUV tree by default) and join their
+    journals, as if the sweep had been one batch_run.
+    """
+    queue = WorkQueue(queue_dir)
+    _use_plan_tuv_path(queue.plan, tuv_path)
+    pending = set(queue.pending())
+    if pending and not partial:
+        raise RuntimeError(f'{len(pending)} of {queue.n_chunks} chunks are not done yet '
+                           f'(first: {min(pending)}); pass partial=True to merge the rest')
+    target = os.path.join(run_tuv_batch.tuv_path, 'OUTPUT', data_subdir or queue.plan['data_subdir'])
+    for folder in ('data', 'log'):
+        os.makedirs(os.path.join(target, folder), exist_ok=True)
+
+    moved = 0
+    for k in range(queue.n_chunks):
+        if k in pending:
+            continue
+        chunk = queue.chunk_dir(k)
+        for folder in ('data', 'log', 'combined'):
+            source = os.path.join(chunk, folder)
+            if not os.path.isdir(source):
+                continue
+            os.makedirs(os.path.join(target, folder), exist_ok=True)
+            for entry in os.scandir(source):
+                shutil.move(entry.path, os.path.join(target, folder, entry.name))
+                moved += folder == 'data'
+        for name in ('journal.jsonl', 'metrics.jsonl'):
+            source = os.path.join(chunk, name)
+            if os.path.exists(source):
+                with open(source) as part, open(os.path.join(target, name), 'a') as whole:
+                    shutil.copyfileobj(part, whole)
+                os.remove(source)
+        source = os.path.join(chunk, 'want.json')
+        if os.path.exists(source):
+            shutil.copyfile(source, os.path.join(target, 'want.json'))
+    print(f'..merged {moved} outputs from {queue.n_chunks - len(pending)} chunks into {target}')
+    return target
@@ -0,0 +1,108 @@
+"""
+Batch specs: a batch_run call written down in a TOML (or JSON) file.
+
+    # seasonal.toml
+    tuv_path = "/opt/TUV-V5.4"        # relative to this file; default run_tuv_batch.tuv_path
+    data_subdir = "seasonal"          # in {tuv_path}/OUTPUT, or an absolute path
+    workers = 16                      # any other argument of batch_run
+    collapse_time = true
+
+    [inputs]                          # TUV inputs that stay the same in every run
+    iday = 1
+    nt = 1
+    tstart = 12.0
+
+    [axes]                            # in order; the last one varies fastest
+    imonth = {start = 1, stop = 12}
+    lat = {start = -90, stop = 90, step = 10}
+    site = {lon = [-105.3, 2.3], alsurf = [0.05, 0.2]}
+
+An axis is either a list of values of the input it is named after, or a
+range of them (start, stop and step or num, both ends included), or a table
+of several inputs that change together, each a list or a range. The
+[fields] table gives inputs with one value per point, nested in axis order.
+TUV inputs can also be given at the top level, and iterable_i/j/k work as
+they do in batch_run.
+
+The same files plan a queue (run_tuv_batch.py plan). The plan keeps
+workers, cache, timeout, metrics, local_scratch, cost_model and preflight
+for its workers, whose command line options win. A queue is merged as text
+output, so output other than 'text', extend, shard and index are refused
+with a ValueError.
+
+    python -m run_tuv_batch run seasonal.toml --dry-run
+    python -m run_tuv_batch run seasonal.toml --shard $SLURM_ARRAY_TASK_ID/100 --resume
+
+Reading a spec takes only the standard library: tomllib (Python 3.11 and
+later), or the tomli package on older versions.
+"""
+import os
+import json
+import math
+from tuv_sweep import Sweep
+
+range_keys = {'start', 'stop', 'step', 'num'}
+
+def load_spec(filepath):
+    """The keyword arguments of batch_run that filepath describes, with tuv_path if it is set."""
+    if filepath.endswith('.json'):
+        with open(filepath) as f:
+            spec = json.load(f)
+    else:
+        try:
+            import tomllib
+        except ImportError:
+            import tomli as tomllib
+        with open(filepath, 'rb') as f:
+            spec = tomllib.load(f)
+
+    kwargs = {name: value for name, value in spec.items() if name not in ('inputs', 'axes', 'fields')}
+    if 'data_subdir' not in kwargs:
+        raise ValueError(f'{filepath} gives no data_subdir')
+    if 'tuv_path' in kwargs:
+        kwargs['tuv_path'] = os.path.join(os.path.dirname(os.path.abspath(filepath)), kwargs['tuv_path'])
+    for name, value in spec.get('inputs', {}).items():
+        if name in kwargs:
+            raise ValueError(f'"{name}" is given twice in {filepath}')
+        kwargs[name] = value
+    if 'axes' in spec:
+        if 'sweep' in kwargs or any(name.startswith('iterable_') for name in kwargs):
+            raise ValueError(f'{filepath} gives both [axes] and another sweep')
+        kwargs['sweep'] = _sweep(spec['axes'], spec.get('fields', {}))
+    elif 'fields' in spec:
+        raise ValueError(f'{filepath} gives [fields] without [axes]')
+    return kwargs
+
+def _sweep(axes, fields):
+    sweep = Sweep()
+    for name, axis in axes.items():
+        if isinstance(axis, dict) and not set(axis) <= range_keys:
+            sweep.zip(name, **{param: _values(param, values) for param, values in axis.items()})
+        else:
+            sweep.product(name, _values(name, axis))
+    for name, values in fields.items():
+        sweep.field(name, values)
+    return sweep
+
+def _values(name, values):
+    if not isinstance(values, dict):
+        return values if isinstance(values, list) else [values]
+    if not {'start', 'stop'} <= set(values) <= range_keys or {'step', 'num'} <= set(values):
+        raise ValueError(f'The range of "{name}" needs start, stop and one of step or num')
+    start, stop = values['start'], values['stop']
+    if 'num' in values:
+        n = int(values['num'])
+        if n < 1:
+            raise ValueError(f'The range of "{name}" needs num of at least 1')
+        if n == 1:
+            return [start]
+        step = (stop - start) / (n - 1)
+    else:
+        step = values.get('step', 1)
+        if step == 0 or (stop - start) / step < 0:
+            raise ValueError(f'The range of "{name}" never gets from {start} to {stop} in steps of {step}')
+        # stop is included, allowing for steps that aren't exact in binary
+        n = math.floor((stop - start) / step + 1e-9) + 1
+    if isinstance(start, int) and isinstance(step, int):
+        return [start + k*step for k in range(n)]
+    return [round(start + k*step, 9) for k in range(n)]
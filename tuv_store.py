@@ -0,0 +1,192 @@
+"""
+Consolidated storage for the results of a whole batch.
+
+Instead of one usrout and one tuvlog text file per simulation, a store keeps
+every parsed output table of the batch in one array per quantity, indexed by
+the iterated parameters:
+
+    {path}/axes.json           iterated parameters, their values and grid shape
+    {path}/{quantity}.npy      float64 array (*grid, rows, columns)
+    {path}/{quantity}.json     coordinates of the rows and names of the columns
+    {path}/done.npy            which grid points have been written
+    {path}/tuvlog.dat          zlib-compressed tuvlog of every run, back to back
+    {path}/tuvlog.idx.npy      (offset, length) of each run in tuvlog.dat
+
+The .npy files are opened as memory maps, so selecting a slice of a large
+batch only reads the pages it touches:
+
+    store = BatchStore('OUTPUT/seasonal/store')
+    uv, coords = store.sel('irradiance', imonth=6, lat=slice(-30, 30),
+                           wavelength=slice(300, 320))
+"""
+import os
+import json
+import zlib
+import numpy as np
+
+class BatchStore:
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'axes.json')) as f:
+            meta = json.load(f)
+        self.axes = [(name, np.asarray(values)) for name, values in meta['axes']]
+        self.fields = {name: (tuple(field['dims']), np.asarray(field['values']))
+                       for name, field in meta.get('fields', {}).items()}
+        self.shape = tuple(len(values) for _, values in self.axes)
+        self._arrays = {}
+
+    @classmethod
+    def create(cls, path, axes, fields=None):
+        """
+        axes is a list of (name, values) pairs, one per grid dimension. fields
+        maps the names of parameters that vary with the grid but are not a
+        dimension of their own to (dims, values) pairs, where dims names the
+        axes the values are laid out over.
+        """
+        os.makedirs(path)
+        meta = {'axes': [(name, np.asarray(values).tolist()) for name, values in axes],
+                'fields': {name: {'dims': list(dims), 'values': np.asarray(values).tolist()}
+                           for name, (dims, values) in (fields or {}).items()}}
+        with open(os.path.join(path, 'axes.json'), 'w') as f:
+            json.dump(meta, f)
+
+        shape = tuple(len(values) for _, values in axes)
+        np.lib.format.open_memmap(os.path.join(path, 'done.npy'), mode='w+',
+                                  dtype=bool, shape=shape).flush()
+        log_index = np.lib.format.open_memmap(os.path.join(path, 'tuvlog.idx.npy'), mode='w+',
+                                              dtype=np.int64, shape=shape + (2,))
+        log_index[...] = -1
+        log_index.flush()
+        open(os.path.join(path, 'tuvlog.dat'), 'wb').close()
+        return cls(path)
+
+    @property
+    def quantities(self):
+        return sorted(name[:-5] for name in os.listdir(self.path)
+                      if name.endswith('.json') and name != 'axes.json')
+
+    def _open(self, name, mode='r+'):
+        if name not in self._arrays:
+            self._arrays[name] = np.load(os.path.join(self.path, f'{name}.npy'), mmap_mode=mode)
+        return self._arrays[name]
+
+    def is_done(self, index):
+        return bool(self._open('done')[index])
+
+    def write(self, index, output, log_text=None):
+        """Store a parsed TuvOutput (and optionally its tuvlog) at a grid index."""
+        seen = {}
+        for table in output.tables:
+            # a second table of the same kind is stored as irradiance_1, ...
+            n = seen.get(table.kind, 0)
+            seen[table.kind] = n + 1
+            name = table.kind if n == 0 else f'{table.kind}_{n}'
+            array = self._quantity(name, table)
+            if array.shape[len(self.shape):] != table.values.shape:
+                raise ValueError(f'{name} at {index} has shape {table.values.shape}, '
+                                 f'expected {array.shape[len(self.shape):]}')
+            array[index] = table.values
+
+        if log_text is not None:
+            packed = zlib.compress(log_text.encode())
+            with open(os.path.join(self.path, 'tuvlog.dat'), 'ab') as logs:
+                offset = logs.tell()
+                logs.write(packed)
+            self._open('tuvlog.idx')[index] = (offset, len(packed))
+
+        self._open('done')[index] = True
+
+    def copy_point(self, src, dst):
+        """Give grid index dst the results at src, if src is done."""
+        if not self.is_done(src):
+            return False
+        for name in self.quantities:
+            array = self._open(name)
+            array[dst] = array[src]
+        log_index = self._open('tuvlog.idx')
+        log_index[dst] = log_index[src]
+        self._open('done')[dst] = True
+        return True
+
+    def _quantity(self, name, table):
+        filepath = os.path.join(self.path, f'{name}.npy')
+        if name not in self._arrays and not os.path.exists(filepath):
+            # the first run to produce a table fixes its layout for the batch
+            if table.coords:
+                row_dim, row_coords = next(iter(table.coords.items()))
+                row_coords = row_coords.tolist()
+            else:
+                row_dim, row_coords = 'row', table.row_names
+            meta = {'dims': [name for name, _ in self.axes] + [row_dim, 'column'],
+                    'title': table.title,
+                    'rows': row_coords,
+                    'row_coords': {coord: values.tolist() for coord, values in table.coords.items()},
+                    'columns': table.names}
+            array = np.lib.format.open_memmap(filepath, mode='w+', dtype=np.float64,
+                                              shape=self.shape + table.values.shape)
+            array[...] = np.nan
+            with open(os.path.join(self.path, f'{name}.json'), 'w') as f:
+                json.dump(meta, f)
+            self._arrays[name] = array
+        return self._open(name)
+
+    def meta(self, quantity):
+        with open(os.path.join(self.path, f'{quantity}.json')) as f:
+            return json.load(f)
+
+    def read(self, quantity):
+        return self._open(quantity, mode='r')
+
+    def log(self, index):
+        offset, length = self._open('tuvlog.idx', mode='r')[index]
+        if offset < 0:
+            return None
+        with open(os.path.join(self.path, 'tuvlog.dat'), 'rb') as logs:
+            logs.seek(offset)
+            return zlib.decompress(logs.read(length)).decode()
+
+    def sel(self, quantity, **selection):
+        """
+        Select by coordinate value rather than position. A scalar picks the
+        nearest value along that dimension, a slice keeps the values within
+        [start, stop]. Dimensions are the iterated parameters, the row
+        coordinate of the table (e.g. wavelength) and 'column', which also
+        accepts column names. Returns the array and the remaining coordinates.
+        """
+        meta = self.meta(quantity)
+        array = self.read(quantity)
+        dim_coords = [values for _, values in self.axes]
+        dim_coords.append(np.asarray(meta['rows']))
+        dim_coords.append(np.asarray(meta['columns'] or range(array.shape[-1])))
+
+        keys = []
+        coords = {}
+        for dim, values in zip(meta['dims'], dim_coords):
+            if dim not in selection:
+                keys.append(slice(None))
+                coords[dim] = values
+                continue
+            key = _coord_index(values, selection.pop(dim))
+            keys.append(key)
+            if not np.isscalar(key):
+                coords[dim] = values[key]
+        if selection:
+            raise AttributeError(f'Invalid dimension name: "{next(iter(selection))}"')
+
+        # apply one dimension at a time so index arrays don't broadcast together
+        result = array
+        for axis in reversed(range(len(keys))):
+            result = result[(slice(None),) * axis + (keys[axis],)]
+        return np.asarray(result), coords
+
+def _coord_index(values, wanted):
+    if isinstance(wanted, slice):
+        if values.dtype.kind in 'US':
+            return slice(None)
+        lo = -np.inf if wanted.start is None else wanted.start
+        hi = np.inf if wanted.stop is None else wanted.stop
+        return np.flatnonzero((values >= lo) & (values <= hi))
+    if values.dtype.kind in 'US':
+        return int(np.flatnonzero(values == wanted)[0])
+    return int(np.argmin(np.abs(values - wanted)))
@@ -0,0 +1,225 @@
+"""
+Planning of parameter sweeps over any number of named axes.
+
+A sweep is an ordered list of axes. Each axis is either a single TUV
+parameter stepped through a list of values (a product axis) or several
+parameters that change together, value for value (a zipped axis). The
+points of the sweep are the Cartesian product of its axes, generated lazily
+in C order (the last axis varies fastest), so planning costs the same
+memory for 10 points as for 10 million:
+
+    sweep = (Sweep()
+             .product('imonth', range(1, 13))
+             .product('lat', lat_range)
+             .zip('site', lon=site_lons, alsurf=site_albedos))
+
+    for point in sweep:
+        point.index     # (imonth index, lat index, site index)
+        point.label     # '3-17-0', used in the output file names
+        point.values    # {'imonth': 4, 'lat': -2.5, 'lon': ..., 'alsurf': ...}
+
+A parameter can also be given as a field: one value per grid point, e.g. a
+climatological ozone column for every (month, latitude) pair.
+
+Any flat position can be turned into its point directly, which makes it
+cheap to split a sweep into shards for several jobs. This module only uses
+the standard library so that planning never waits on NumPy to import.
+"""
+import math
+from collections import namedtuple
+
+Point = namedtuple('Point', ['flat', 'index', 'label', 'values'])
+
+class Axis:
+
+    def __init__(self, name, params):
+        lengths = {len(values) for values in params.values()}
+        if len(lengths) != 1:
+            raise ValueError(f'Parameters zipped along axis "{name}" differ in length')
+        self.name = name
+        self.params = params
+        self.size = lengths.pop()
+
+class Sweep:
+
+    def __init__(self):
+        self.axes = []
+        self.fields = {}
+
+    def product(self, name, values):
+        return self.zip(name, **{name: values})
+
+    def zip(self, name, **params):
+        if any(axis.name == name for axis in self.axes):
+            raise ValueError(f'Duplicate axis name: "{name}"')
+        self.axes.append(Axis(name, {param: _as_tuple(values) for param, values in params.items()}))
+        return self
+
+    def field(self, name, values):
+        """
+        values holds one entry per grid point, nested (or shaped) in axis
+        order. Add every axis before any field.
+        """
+        flat = _flatten(values)
+        if len(flat) != len(self):
+            raise ValueError(f'Field "{name}" has {len(flat)} values for {len(self)} points')
+        self.fields[name] = flat
+        return self
+
+    @property
+    def shape(self):
+        return tuple(axis.size for axis in self.axes)
+
+    @property
+    def params(self):
+        names = [param for axis in self.axes for param in axis.params]
+        return names + list(self.fields)
+
+    def __len__(self):
+        return math.prod(self.shape)
+
+    def __iter__(self):
+        return self.points()
+
+    def point(self, flat):
+        index = []
+        rest = flat
+        for size in reversed(self.shape):
+            rest, i = divmod(rest, size)
+            index.append(i)
+        return self._point(flat, tuple(reversed(index)))
+
+    def _point(self, flat, index):
+        values = {}
+        for axis, i in zip(self.axes, index):
+            for param, param_values in axis.params.items():
+                values[param] = param_values[i]
+        for name, field in self.fields.items():
+            values[name] = field[flat]
+        return Point(flat, index, '-'.join(str(i) for i in index), values)
+
+    def flat_index(self, index):
+        flat = 0
+        for i, size in zip(index, self.shape):
+            flat = flat * size + i
+        return flat
+
+    def without(self, name):
+        """The same sweep with one axis left out. Fields can't be carried over."""
+        if self.fields:
+            raise ValueError('Cannot drop an axis from a sweep with fields')
+        sweep = Sweep()
+        sweep.axes = [axis for axis in self.axes if axis.name != name]
+        return sweep
+
+    def time_axis(self, input_dict):
+        """
+        The name of an axis that TUV can compute in a single run, or None.
+
+        TUV steps through nt equally spaced times (or solar zenith angles if
+        lzenit is set) from tstart to tstop within one run. An axis that only
+        moves tstart (and tstop) through equally spaced values, in a sweep
+        that otherwise asks for nt=1, is exactly such a grid.
+        """
+        if self.fields or int(input_dict.get('nt', 1)) != 1:
+            return None
+        for axis in self.axes:
+            if axis.size < 2 or 'tstart' not in axis.params or not set(axis.params) <= {'tstart', 'tstop'}:
+                continue
+            values = [float(value) for value in axis.params['tstart']]
+            step = (values[-1] - values[0]) / (len(values) - 1)
+            # usrinp holds times to 0.001 h, so that is as equal as they need to be
+            if step > 0 and all(abs(value - (values[0] + k*step)) < 5e-4
+                                for k, value in enumerate(values)):
+                return axis.name
+        return None
+
+    def points(self, start=0, stop=None):
+        stop = len(self) if stop is None else min(stop, len(self))
+        if start >= stop:
+            return
+        # step an odometer instead of dividing every flat index
+        index = list(self.point(start).index)
+        shape = self.shape
+        for flat in range(start, stop):
+            yield self._point(flat, tuple(index))
+            for dim in reversed(range(len(shape))):
+                index[dim] += 1
+                if index[dim] < shape[dim]:
+                    break
+                index[dim] = 0
+
+    def shard(self, shard, n_shards):
+        """Points of the shard-th of n_shards contiguous, near-equal pieces."""
+        size = len(self)
+        return self.points(shard * size // n_shards, (shard + 1) * size // n_shards)
+
+    def to_dict(self):
+        return {'axes': [{'name': axis.name, 'params': {param: list(values)
+                                                         for param, values in axis.params.items()}}
+                         for axis in self.axes],
+                'fields': {name: list(values) for name, values in self.fields.items()}}
+
+    @classmethod
+    def from_dict(cls, spec):
+        sweep = cls()
+        for axis in spec['axes']:
+            sweep.zip(axis['name'], **axis['params'])
+        for name, values in spec.get('fields', {}).items():
+            sweep.field(name, values)
+        return sweep
+
+    @classmethod
+    def from_iterables(cls, input_dict, iter_ivar_name, iter_jvar_name=None, iter_kvar_name=None,
+                       k_field=False):
+        """
+        The sweep described by batch_run's iterable_i/j/k arguments: i, j and
+        k are axes. With k_field=True the iterable_k array instead holds one
+        value per (i, j) point, laid out like np.meshgrid(i, j) (j varies
+        slowest), as in the seasonal ozone example. A k axis given as a 2-D
+        array is refused rather than flattened.
+        """
+        if iter_ivar_name is None:
+            raise AttributeError('No iterable parameters specified')
+        sweep = cls().product(iter_ivar_name, input_dict[iter_ivar_name])
+        if iter_jvar_name is not None:
+            sweep.product(iter_jvar_name, input_dict[iter_jvar_name])
+        if k_field:
+            if not iter_kvar_name:
+                raise ValueError('k_field needs iterable_k')
+            k_values = _flatten(input_dict[iter_kvar_name])
+            if len(k_values) != len(sweep):
+                raise ValueError(f'"{iter_kvar_name}" has {len(k_values)} values for '
+                                 f'{len(sweep)} (i, j) points')
+            idim = sweep.shape[0]
+            jdim = len(sweep) // idim
+            sweep.field(iter_kvar_name, [k_values[j*idim + i] for i in range(idim) for j in range(jdim)])
+        elif iter_kvar_name:
+            k_values = input_dict[iter_kvar_name]
+            if _is_nested(k_values):
+                raise ValueError(f'"{iter_kvar_name}" is nested, but the iterable_k axis takes a flat list '
+                                 f'of values; pass iterable_k_field=True for one value per (i, j) point')
+            sweep.product(iter_kvar_name, k_values)
+        return sweep
+
+def _as_tuple(values):
+    if hasattr(values, 'tolist'):
+        values = values.tolist()
+    if isinstance(values, (str, bytes)) or not hasattr(values, '__iter__'):
+        values = [values]
+    return tuple(values)
+
+def _is_nested(values):
+    if hasattr(values, 'ndim'):
+        return values.ndim > 1
+    return isinstance(values, (list, tuple)) and any(isinstance(value, (list, tuple)) for value in values)
+
+def _flatten(values):
+    if hasattr(values, 'tolist'):
+        values = values.tolist()
+    if not isinstance(values, (list, tuple)):
+        return [values]
+    flat = []
+    for value in values:
+        flat.extend(_flatten(value))
+    return flat
@@ -0,0 +1,245 @@
+"""
+Batches of scattered points read from a table instead of a grid.
+
+Each row of a CSV file, Parquet file or DataFrame is one TUV run, e.g. one
+satellite overpass with its own latitude, date, ozone column and albedo:
+
+    from tuv_table import batch_run_table
+    batch_run_table('overpasses', 'overpasses.csv',
+                    columns={'latitude': 'lat', 'longitude': 'lon', 'month': 'imonth',
+                             'day': 'iday', 'ozone_du': 'o3col', 'albedo': 'alsurf'},
+                    id_column='overpass_id', workers=8, nt=1, tstart=12.0)
+
+Rows are read chunk_size at a time and run as they are read, so the table
+is never held in memory as a whole. Outputs are named by the row id
+(usrout-{id}.txt), or by row number if no id_column is given. Rows whose
+TUV inputs are identical once written to usrinp are run only once, and the
+repeats get links to the same output files when the batch is done. The
+inputs seen so far are kept in an SQLite file next to the outputs
+(rows.sqlite), again so memory stays constant. All other batch_run options
+(workers=, cache=, resume=, metrics=, local_scratch=, dry_run=, ...) work as
+usual; output='store' needs a grid and is not available.
+"""
+import os
+import csv
+import json
+import hashlib
+import sqlite3
+from types import MappingProxyType
+import pandas as pd
+import run_tuv_batch
+from modify_usrinp import formatVarType
+from tuv_journal import RunJournal
+from tuv_sweep import Point
+from tuv_workspace import link_or_copy
+
+def batch_run_table(data_subdir, source, columns=None, id_column=None, chunk_size=10000, **kwargs):
+    if kwargs.get('output', 'text') != 'text':
+        raise ValueError('Table batches can only be saved as text output')
+    batch_path = f'{run_tuv_batch.tuv_path}/OUTPUT/{data_subdir}'
+    dedupe_path = ':memory:' if kwargs.get('dry_run') else os.path.join(batch_path, 'rows.sqlite')
+    table = TableSweep(source, columns, id_column, chunk_size, dedupe_path)
+    # indexed once the repeated rows are linked, so the index has them too
+    index = kwargs.pop('index', None)
+    result = run_tuv_batch.batch_run(data_subdir, sweep=table, **kwargs)
+    if not kwargs.get('dry_run'):
+        table.link_duplicates(batch_path)
+        run_tuv_batch._index_batch(batch_path, index)
+    return result
+
+class TableSweep:
+    """
+    A table of rows in the shape batch_run expects of a Sweep: one
+    dimension, one point per row, generated lazily.
+    """
+
+    # no grid axes or fields; read-only so no instance can change them for all
+    axes = ()
+    fields = MappingProxyType({})
+
+    def __init__(self, source, columns=None, id_column=None, chunk_size=10000, dedupe_path=':memory:'):
+        self.source = source
+        self.id_column = id_column
+        self.chunk_size = chunk_size
+        self.dedupe_path = dedupe_path
+        header = _read_header(source)
+        if id_column is not None and id_column not in header:
+            raise KeyError(f'No column named "{id_column}" in the table')
+        if columns is None:
+            columns = {name: name for name in header if name != id_column}
+        for name in columns:
+            if name not in header:
+                raise KeyError(f'No column named "{name}" in the table')
+        valid = run_tuv_batch.setInputs()[0]
+        for param in columns.values():
+            if param not in valid:
+                raise AttributeError(f'Invalid parameter name: "{param}"')
+        self.columns = dict(columns)
+        self.n_rows = _count_rows(source)
+        self.duplicates = 0
+        # filled in chunk by chunk once preflight() is called
+        self.invalid = {}
+        self._input_dict = None
+
+    @property
+    def params(self):
+        return list(self.columns.values())
+
+    @property
+    def shape(self):
+        return (self.n_rows,)
+
+    def __len__(self):
+        return self.n_rows
+
+    def __iter__(self):
+        return self.points()
+
+    def time_axis(self, input_dict):
+        return None
+
+    def shard(self, shard, n_shards):
+        return self.points(shard * self.n_rows // n_shards, (shard + 1) * self.n_rows // n_shards)
+
+    def preflight(self, input_dict):
+        """
+        Check rows with tuv_preflight as their chunks are read. The report's
+        invalid grows as points() goes through the table; repeats are
+        handled by the table itself.
+        """
+        from tuv_preflight import PreflightReport
+        self._input_dict = input_dict
+        return PreflightReport(self.n_rows, self.invalid, {})
+
+    def points(self, start=0, stop=None):
+        stop = self.n_rows if stop is None else min(stop, self.n_rows)
+        db = _open_db(self.dedupe_path)
+        row = 0
+        try:
+            for chunk in _read_chunks(self.source, self.chunk_size,
+                                      list(self.columns) + ([self.id_column] if self.id_column else [])):
+                n = len(chunk)
+                if row + n <= start:
+                    row += n
+                    continue
+                ids = chunk[self.id_column].tolist() if self.id_column else range(row, row + n)
+                if self._input_dict is not None:
+                    from tuv_preflight import check_points
+                    self.invalid.update(check_points(self._input_dict,
+                                                     {param: chunk[name].to_numpy()
+                                                      for name, param in self.columns.items()},
+                                                     range(row, row + n)))
+                values = {param: chunk[name].tolist() for name, param in self.columns.items()}
+                for k, row_id in enumerate(ids):
+                    flat = row + k
+                    if flat < start:
+                        continue
+                    if flat >= stop:
+                        return
+                    point = Point(flat, (flat,), _label(row_id),
+                                  {param: column[k] for param, column in values.items()})
+                    # invalid rows go to batch_run, which journals them as failed
+                    if flat in self.invalid or self._first_occurrence(db, point):
+                        yield point
+                db.commit()
+                row += n
+        finally:
+            db.commit()
+            db.close()
+
+    def _first_occurrence(self, db, point):
+        try:
+            db.execute('INSERT INTO labels VALUES (?, ?)', (point.label, point.flat))
+        except sqlite3.IntegrityError:
+            if db.execute('SELECT row FROM labels WHERE label = ?', (point.label,)).fetchone()[0] != point.flat:
+                raise ValueError(f'Row id "{point.label}" appears more than once')
+        try:
+            key = _row_key(point.values)
+        except ValueError:
+            # NaN in an integer parameter; batch_run reports and skips it
+            return True
+        db.execute('INSERT OR IGNORE INTO seen VALUES (?, ?, ?)', (key, point.flat, point.label))
+        first_row, first_label = db.execute('SELECT row, label FROM seen WHERE key = ?', (key,)).fetchone()
+        if first_row == point.flat:
+            return True
+        self.duplicates += 1
+        db.execute('INSERT OR REPLACE INTO duplicates VALUES (?, ?, ?, ?)',
+                   (point.flat, point.label, first_label, json.dumps(point.values)))
+        return False
+
+    def link_duplicates(self, batch_path):
+        """Give every repeated row the outputs of the first row like it."""
+        if self.dedupe_path == ':memory:':
+            return
+        db = _open_db(self.dedupe_path)
+        journal = RunJournal(os.path.join(batch_path, 'journal.jsonl'))
+        input_dict = None
+        linked = 0
+        for row, label, first_label, values in db.execute('SELECT * FROM duplicates ORDER BY row'):
+            targets = []
+            for kind, folder in (('usrout', 'data'), ('tuvlog', 'log')):
+                src = os.path.join(batch_path, folder, f'{kind}-{first_label}.txt')
+                dst = os.path.join(batch_path, folder, f'{kind}-{label}.txt')
+                targets.append((src, dst))
+            if not all(os.path.exists(src) for src, _ in targets):
+                # the first row failed or was skipped
+                continue
+            for src, dst in targets:
+                link_or_copy(src, dst)
+            if input_dict is None:
+                input_dict = run_tuv_batch.setInputs()[0]
+            journal.record(row, label, {**input_dict, **json.loads(values)}, targets[0][1], targets[1][1])
+            linked += 1
+        db.close()
+        if linked:
+            print(f'..{linked} repeated rows linked to the outputs of their first occurrence')
+
+def _open_db(path):
+    db = sqlite3.connect(path)
+    db.execute('CREATE TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY, row INTEGER, label TEXT)')
+    db.execute('CREATE TABLE IF NOT EXISTS labels (label TEXT PRIMARY KEY, row INTEGER)')
+    db.execute('CREATE TABLE IF NOT EXISTS duplicates '
+               '(row INTEGER PRIMARY KEY, label TEXT, first_label TEXT, inputs TEXT)')
+    return db
+
+def _row_key(values):
+    # rows are the same run if they are written to usrinp the same way
+    formatted = {param: formatVarType(param, value) for param, value in values.items()}
+    return hashlib.sha1(json.dumps(formatted, sort_keys=True).encode()).hexdigest()
+
+def _label(row_id):
+    return str(row_id).strip().replace(os.sep, '_').replace(' ', '_')
+
+def _is_parquet(source):
+    return isinstance(source, str) and source.endswith(('.parquet', '.pq'))
+
+def _read_header(source):
+    if isinstance(source, pd.DataFrame):
+        return list(source.columns)
+    if _is_parquet(source):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(source).schema_arrow.names
+    return list(pd.read_csv(source, nrows=0).columns)
+
+def _count_rows(source):
+    if isinstance(source, pd.DataFrame):
+        return len(source)
+    if _is_parquet(source):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(source).metadata.num_rows
+    # the csv module's C reader follows quoted fields across line breaks,
+    # and blank lines are skipped as pandas skips them
+    with open(source, newline='') as f:
+        rows = sum(1 for row in csv.reader(f) if row)
+    return max(rows - 1, 0)
+
+def _read_chunks(source, chunk_size, columns):
+    if isinstance(source, pd.DataFrame):
+        for start in range(0, len(source), chunk_size):
+            yield source.iloc[start:start + chunk_size][columns]
+    elif _is_parquet(source):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(source, chunksize=chunk_size, usecols=columns)
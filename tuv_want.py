@@ -0,0 +1,167 @@
+"""
+Ask TUV for only the outputs that will be used.
+
+By default TUV writes spectral irradiance and seven dose rates for every run,
+most of which a batch after one j-value throws away. batch_run(...,
+want=[...]) lists the outputs to keep instead, and the run switches off
+everything else:
+
+    'j:O3->O1D'          photolysis rate of a reaction at zout
+    'dose:UVB'           dose rate of a spectral weighting function at zout
+    'irradiance@zout'    spectral irradiance at zout
+    'actinic_flux@zout'  spectral actinic flux at zout
+    'j:NO2@z'            a j-value (or dose rate) at every altitude
+
+Reactions and weighting functions are looked up in the lists of the
+reference usrinp: by number ('j:2'), by their full name, by a short name
+('UVB' for 'UV-B, 280-315 nm', 'erythema'), or for reactions by reactant
+('NO2') or reactant and products ('O3->O1D' for 'O3 -> O2 + O(1D)'). The outputs set lirrad,
+laflux, lrates and ljvals, switch on just the wanted list entries (with nms
+and nmj to match), and set isfix/ijfix for a profile. lmmech, iwfix, itfix
+and izfix are off.
+
+Wanted.read() then parses only the tables those outputs are in and returns
+one array per output.
+"""
+from collections import namedtuple
+from modify_usrinp import loadInputDeck
+from tuv_output import read_usrout
+
+kinds = {'j': ('reactions', 'j_values'),
+         'dose': ('spectra', 'dose_rates'),
+         'irradiance': (None, 'irradiance'),
+         'actinic_flux': (None, 'actinic_flux')}
+
+# one wanted output; number is its position in the reference list, or None
+WantedOutput = namedtuple('WantedOutput', ['spec', 'kind', 'number', 'name', 'profile'])
+
+class Wanted:
+
+    def __init__(self, want, deck=None):
+        if isinstance(want, str):
+            want = [want]
+        if deck is None:
+            deck = loadInputDeck()
+        self.outputs = [_parse_spec(spec, deck) for spec in want]
+        if not self.outputs:
+            raise ValueError('No outputs wanted')
+        for section in ('spectra', 'reactions'):
+            profiles = {output.number for output in self.outputs
+                        if output.profile and kinds[output.kind][0] == section}
+            if len(profiles) > 1:
+                raise ValueError(f'TUV prints the profile of only one of its {section} per run')
+
+    def _numbers(self, section):
+        return sorted({output.number for output in self.outputs if kinds[output.kind][0] == section})
+
+    def settings(self):
+        """The inputs that make TUV write just these outputs."""
+        wanted = {output.kind for output in self.outputs}
+        spectra = self._numbers('spectra')
+        reactions = self._numbers('reactions')
+        profile = {kinds[output.kind][0]: output.number for output in self.outputs if output.profile}
+        return {'lirrad': 'irradiance' in wanted,
+                'laflux': 'actinic_flux' in wanted,
+                'lmmech': False,
+                'lrates': bool(spectra),
+                'ljvals': bool(reactions),
+                'nms': len(spectra),
+                'nmj': len(reactions),
+                'spectra': ' '.join(str(n) for n in spectra),
+                'reactions': ' '.join(str(n) for n in reactions),
+                'isfix': profile.get('spectra', 0),
+                'ijfix': profile.get('reactions', 0),
+                'iwfix': 0,
+                'itfix': 0,
+                'izfix': 0}
+
+    @property
+    def table_kinds(self):
+        return tuple({kinds[output.kind][1] for output in self.outputs})
+
+    def read(self, filepath):
+        """{spec: values} for one usrout file, None for an output not in it."""
+        output = read_usrout(filepath, kinds=self.table_kinds)
+        return {wanted.spec: _extract(output, wanted, self._numbers(kinds[wanted.kind][0]))
+                for wanted in self.outputs}
+
+    @property
+    def specs(self):
+        return [output.spec for output in self.outputs]
+
+def _parse_spec(spec, deck):
+    text, _, where = spec.partition('@')
+    kind, _, name = text.partition(':')
+    kind = kind.strip().lower()
+    if kind not in kinds:
+        raise ValueError(f'Unknown output "{spec}", expected one of {", ".join(kinds)}')
+    where = where.strip().lower() or 'zout'
+    if where not in ('zout', 'z'):
+        raise ValueError(f'Unknown altitude "{where}" in "{spec}", expected zout or z')
+    section = kinds[kind][0]
+    if section is None:
+        if name or where != 'zout':
+            raise ValueError(f'"{spec}": {kind} is only written as a spectrum at zout')
+        return WantedOutput(spec, kind, None, None, False)
+    if not name:
+        raise ValueError(f'"{spec}" needs a name, e.g. {kind}:1')
+    entries = deck.selections[section]
+    number = _lookup(name.strip(), entries, section)
+    return WantedOutput(spec, kind, number, entries[number - 1], where == 'z')
+
+def _normalize(name):
+    return ''.join(name.upper().split()).replace('-', '').replace(',', '').replace('(', '').replace(')', '')
+
+def _reaction_parts(name):
+    reactant, _, products = _normalize(name).partition('>')
+    return reactant, set(products.split('+'))
+
+def _lookup(name, entries, section):
+    if name.isdigit():
+        if not 1 <= int(name) <= len(entries):
+            raise ValueError(f'There are {len(entries)} {section}, not {name}')
+        return int(name)
+    key = _normalize(name)
+    tests = [lambda entry: _normalize(entry) == key,
+             lambda entry: _normalize(entry.split(',')[0]) == key]
+    if section == 'reactions' and '>' in key:
+        reactant, products = _reaction_parts(name)
+        tests.append(lambda entry: (_reaction_parts(entry)[0] == reactant and
+                                    products <= _reaction_parts(entry)[1]))
+    elif section == 'reactions':
+        tests.append(lambda entry: _reaction_parts(entry)[0] == key)
+    tests.append(lambda entry: key in _normalize(entry))
+    # the strictest test that matches anything decides
+    for test in tests:
+        found = [n for n, entry in enumerate(entries, 1) if test(entry)]
+        if len(found) == 1:
+            return found[0]
+        if found:
+            names = '; '.join(entries[n - 1] for n in found)
+            raise ValueError(f'"{name}" matches more than one of the {section}: {names}')
+    raise ValueError(f'No entry like "{name}" in the {section} of the reference usrinp')
+
+def _extract(output, wanted, selected):
+    kind = kinds[wanted.kind][1]
+    tables = output.all(kind)
+    if wanted.number is None:
+        return tables[0].values if tables else None
+    if wanted.profile:
+        # altitude by time, for the one entry printed as a profile
+        tables = [table for table in tables if 'altitude' in table.coords]
+        return tables[0].values if tables else None
+    tables = [table for table in tables if 'altitude' not in table.coords]
+    if not tables:
+        return None
+    table = tables[0]
+    key = _normalize(wanted.name)
+    if table.row_names is not None:
+        names, values = table.row_names, table.values.T
+    else:
+        names, values = table.names, table.values
+    for i, name in enumerate(names):
+        if _normalize(name) == key:
+            return values[:, i]
+    # TUV prints the switched on entries in list order
+    position = selected.index(wanted.number)
+    return values[:, position] if position < values.shape[1] else None
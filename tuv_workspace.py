@@ -0,0 +1,222 @@
+"""
+Private TUV working directories for running several simulations at once.
+
+TUV reads its inputs from INPUTS/usrinp relative to the directory it is
+launched from and writes usrout.txt and tuvlog.txt one level above that
+directory, so two TUV processes started from the same tree overwrite each
+other's inputs and outputs. A workspace reproduces the tree layout with its
+own INPUTS directory:
+
+    {root}/worker-{n}/              usrout.txt and tuvlog.txt land here
+    {root}/worker-{n}/tuv/          TUV is launched from here
+    {root}/worker-{n}/tuv/INPUTS/   private usrinp
+
+batch_run puts the workspaces of each batch in a directory of its own
+(batch_root), {scratch_root}/batch-XXXXXXXX, so batches started at the
+same time from one tree never share a worker-{n}, and removes it at the end.
+
+Everything else (the tuv executable, DATAE1, DATAJ1, DATAS1, ...) is
+symlinked back to the original tree so no data is copied.
+
+When the TUV tree sits on network storage, every run still reads its input
+and writes its output over the network. A WorkspaceManager keeps the
+workspaces on a local disk or in RAM (/dev/shm by default) instead, with a
+local copy of the executable, made once and refreshed when it changes, and
+optionally of the DATA folders too. The workspaces stay in place between
+batches. Finished outputs are renamed into a local outbox and an OutputMover
+carries them to the output directories in batches, with one round of fsyncs
+per batch rather than per file.
+
+    {root}/shared/tuv               local copy of the executable
+    {root}/shared/DATAE1, ...       local data, with copy_data=True
+    {root}/outbox/                  outputs waiting to be moved
+    {root}/worker-{n}/tuv/          as above, linked to shared/
+"""
+import os
+import fcntl
+import shutil
+import getpass
+import tempfile
+
+def create_workspace(tuv_path, root, n):
+    workdir = os.path.join(root, f'worker-{n}', 'tuv')
+    os.makedirs(os.path.join(workdir, 'INPUTS'), exist_ok=True)
+
+    # never link the workspace root, or a directory holding it, back into itself
+    real_root = os.path.realpath(root)
+    for name in os.listdir(tuv_path):
+        src = os.path.join(tuv_path, name)
+        real_src = os.path.realpath(src)
+        if name in ('INPUTS', 'OUTPUT') or real_root == real_src or real_root.startswith(real_src + os.sep):
+            continue
+        _link(src, os.path.join(workdir, name))
+
+    inputs_path = os.path.join(tuv_path, 'INPUTS')
+    for name in os.listdir(inputs_path):
+        if name == 'usrinp':
+            continue
+        _link(os.path.join(inputs_path, name), os.path.join(workdir, 'INPUTS', name))
+
+    return workdir
+
+def batch_root(scratch_root):
+    """A new directory under scratch_root for the workspaces of one batch."""
+    os.makedirs(scratch_root, exist_ok=True)
+    return tempfile.mkdtemp(prefix='batch-', dir=scratch_root)
+
+def remove_workspace(workdir):
+    shutil.rmtree(os.path.dirname(workdir), ignore_errors=True)
+
+def workspace_outputs(workdir):
+    # TUV writes its outputs one level above the directory it runs in
+    outdir = os.path.dirname(os.path.abspath(workdir))
+    return os.path.join(outdir, 'usrout.txt'), os.path.join(outdir, 'tuvlog.txt')
+
+def _link(src, dst):
+    if not os.path.lexists(dst):
+        os.symlink(src, dst)
+
+def default_scratch_root():
+    base = '/dev/shm' if os.access('/dev/shm', os.W_OK) else tempfile.gettempdir()
+    return os.path.join(base, f'tuv-{getpass.getuser()}')
+
+class WorkspaceManager:
+
+    def __init__(self, tuv_path, root=None, copy_data=False):
+        self.tuv_path = tuv_path
+        self.root = default_scratch_root() if root is None else root
+        self.copy_data = copy_data
+        self.shared = os.path.join(self.root, 'shared')
+        self.outbox = os.path.join(self.root, 'outbox')
+        os.makedirs(self.shared, exist_ok=True)
+        os.makedirs(self.outbox, exist_ok=True)
+
+        # workspaces and outbox are reused, so only one batch may use them at a time
+        self._lock = open(os.path.join(self.root, 'lock'), 'w')
+        try:
+            fcntl.flock(self._lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock.close()
+            raise RuntimeError(f'Scratch directory {self.root} is in use by another batch')
+        self._sync_shared()
+
+    def _sync_shared(self):
+        real_root = os.path.realpath(self.root)
+        for name in os.listdir(self.tuv_path):
+            src = os.path.join(self.tuv_path, name)
+            dst = os.path.join(self.shared, name)
+            if name in ('INPUTS', 'OUTPUT') or os.path.realpath(src) == real_root:
+                continue
+            if name == 'tuv':
+                _copy_if_changed(src, dst)
+            elif self.copy_data and os.path.isdir(src) and not os.path.exists(dst):
+                shutil.copytree(src, f'{dst}.partial')
+                os.rename(f'{dst}.partial', dst)
+
+    def workspace(self, n):
+        workdir = os.path.join(self.root, f'worker-{n}', 'tuv')
+        os.makedirs(os.path.join(workdir, 'INPUTS'), exist_ok=True)
+        for name in os.listdir(self.tuv_path):
+            if name in ('INPUTS', 'OUTPUT'):
+                continue
+            local = os.path.join(self.shared, name)
+            dst = os.path.join(workdir, name)
+            if name == 'tuv':
+                # a hardlink, so the workspace never runs an outdated copy
+                if os.path.lexists(dst) and not os.path.samefile(dst, local):
+                    os.remove(dst)
+                if not os.path.lexists(dst):
+                    os.link(local, dst)
+            elif os.path.exists(local):
+                _link(local, dst)
+            elif os.path.realpath(os.path.join(self.tuv_path, name)) != os.path.realpath(self.root):
+                _link(os.path.join(self.tuv_path, name), dst)
+
+        inputs_path = os.path.join(self.tuv_path, 'INPUTS')
+        for name in os.listdir(inputs_path):
+            if name != 'usrinp':
+                _link(os.path.join(inputs_path, name), os.path.join(workdir, 'INPUTS', name))
+        return workdir
+
+    def staged_outputs(self, label):
+        return (os.path.join(self.outbox, f'usrout-{label}.txt'),
+                os.path.join(self.outbox, f'tuvlog-{label}.txt'))
+
+    def close(self):
+        self._lock.close()
+
+    def clear(self):
+        self.close()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+def link_or_copy(src, dst):
+    """
+    Hardlink src to dst, or copy it across filesystems. An existing dst is
+    replaced rather than written to, since it may be a hardlink to another
+    file (a cache entry, another run's output) that must stay as it is.
+    """
+    part = f'{dst}.part'
+    try:
+        os.unlink(part)
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(src, part)
+    except OSError:
+        shutil.copyfile(src, part)
+    os.replace(part, dst)
+
+class OutputMover:
+    """
+    Moves files to their final location batch_size at a time. Each batch is
+    copied first, then fsync'ed, then renamed into place, and every
+    directory it touched is fsync'ed once at the end.
+    """
+
+    def __init__(self, batch_size=64):
+        self.batch_size = batch_size
+        self.pending = []
+
+    def add(self, src, dst):
+        self.pending.append((src, dst))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        moved = []
+        for src, dst in self.pending:
+            part = f'{dst}.part'
+            try:
+                os.rename(src, part)
+            except OSError:
+                # the outbox is on another filesystem
+                shutil.copyfile(src, part)
+            moved.append((src, part, dst))
+        for _, part, _ in moved:
+            _fsync(part)
+        for src, part, dst in moved:
+            os.replace(part, dst)
+            if os.path.exists(src):
+                os.remove(src)
+        for directory in {os.path.dirname(dst) for _, _, dst in moved}:
+            _fsync(directory)
+        self.pending.clear()
+
+def _fsync(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _copy_if_changed(src, dst):
+    stat = os.stat(src)
+    if os.path.exists(dst):
+        local = os.stat(dst)
+        if local.st_size == stat.st_size and local.st_mtime_ns == stat.st_mtime_ns:
+            return
+    shutil.copy2(src, f'{dst}.partial')
+    # replace rather than overwrite, so running copies keep their old inode
+    os.replace(f'{dst}.partial', dst)